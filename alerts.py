@@ -0,0 +1,73 @@
+"""Low-stock alerts: ingredients that run out within a horizon at their recent burn rate
+
+    python kplate.py alerts --hours 48
+
+Each ingredient's burn rate is what the location's orders used over the
+last BURN_RATE_DAYS days of orders, per hour. An ingredient is alerted
+when its stock on hand plus expected restock lasts less than the horizon
+at that rate ("low"), or is already gone ("out"). The whole location is
+evaluated in one query over its recent orders, so the cost follows the
+order volume in the window rather than the number of ingredients.
+"""
+from collections import namedtuple
+
+import cache
+import diagnostics
+
+# Alert ingredients projected to run out within this many hours
+ALERT_HORIZON_HOURS = 48
+
+# Days of orders, up to the latest one, the burn rate is averaged over
+BURN_RATE_DAYS = 7
+
+Alert = namedtuple("Alert", ["ingredient_id", "name", "kind", "available", "burn_per_hour", "hours_left"])
+
+
+@diagnostics.traced("alerts.evaluate")
+def evaluate(conn, location_id, horizon_hours=ALERT_HORIZON_HOURS, burn_rate_days=BURN_RATE_DAYS):
+    """Return the Alerts of a location's ingredients, the soonest to run out first
+    
+    The burn rate window ends at the location's latest order rather than
+    today, so a store that hasn't synced for a while is still measured on
+    the days it traded. Results are cached until the location's orders or
+    ingredients, or the consumption of orders, change.
+    """
+    return cache.memoize(
+        conn, "low_stock_alerts", (location_id, horizon_hours, burn_rate_days),
+        [("orders", location_id), ("ingredients", location_id), ("consumption", "")],
+        lambda: find_alerts(conn, location_id, horizon_hours, burn_rate_days)
+    )
+
+
+def find_alerts(conn, location_id, horizon_hours, burn_rate_days):
+    """Evaluate the alert rules for every ingredient of a location in one query"""
+    rows = conn.execute(
+        '''WITH burn AS (
+               SELECT c.ingredient_id, SUM(c.quantity) / (:days * 24.0) AS per_hour
+               FROM orders o
+               JOIN order_consumption c ON c.order_id = o.order_id
+               WHERE o.location_id = :location
+                 AND o.local_date > date((SELECT MAX(local_date) FROM orders WHERE location_id = :location),
+                                         '-' || :days || ' days')
+               GROUP BY c.ingredient_id
+           )
+           SELECT i.id, i.name, i.quantity + i.expected_restock AS available, COALESCE(b.per_hour, 0)
+           FROM ingredients i
+           LEFT JOIN burn b ON b.ingredient_id = i.id
+           WHERE i.location_id = :location
+             AND (available <= 0 OR available < COALESCE(b.per_hour, 0) * :horizon)''',
+        {"location": location_id, "days": burn_rate_days, "horizon": horizon_hours}
+    ).fetchall()
+    alerts = [
+        Alert(ingredient_id, name, "out" if available <= 0 else "low", available, per_hour,
+              0.0 if available <= 0 else available / per_hour)
+        for ingredient_id, name, available, per_hour in rows
+    ]
+    return sorted(alerts, key=lambda alert: (alert.hours_left, alert.name))
+
+
+def describe(alert):
+    """One line for an alert, e.g. "Chicken Wings: 12 left, about 5 hours of sales" """
+    if alert.kind == "out":
+        return f"{alert.name}: out of stock"
+    return f"{alert.name}: {alert.available:g} left, about {alert.hours_left:.0f} hours of sales"
@@ -0,0 +1,89 @@
+"""Vectorized order analytics on NumPy arrays"""
+import datetime
+
+import numpy as np
+
+SECONDS_PER_MINUTE = 60
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 86400
+
+# 1970-01-01 was a Thursday (0 = Monday, 6 = Sunday)
+EPOCH_WEEKDAY = 3
+
+
+def epoch_sql(column):
+    """SQL expression converting an ISO-8601 timestamp column (any UTC offset) to epoch seconds"""
+    return f"CAST(strftime('%s', {column}) AS INTEGER)"
+
+
+EPOCH_SQL = epoch_sql("created_at")
+
+
+def to_epoch_seconds(timestamps):
+    """Convert a datetime64 array (or epoch seconds) to int64 UTC epoch seconds"""
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        return timestamps.astype("datetime64[s]").astype(np.int64)
+    return timestamps.astype(np.int64)
+
+
+def utc_offset(epoch, tz):
+    """Return the UTC offset of tz in seconds at one instant"""
+    return int(datetime.datetime.fromtimestamp(int(epoch), tz).utcoffset().total_seconds())
+
+
+def timezone_transitions(start, end, tz):
+    """Return (transition_epochs, offsets) describing tz's UTC offset over [start, end]
+    
+    The offset is sampled once per day and each change is narrowed down to
+    the minute by bisection, so the cost grows with the number of days in
+    the range rather than the number of orders.
+    """
+    first_day = int(start) // SECONDS_PER_DAY
+    last_day = int(end) // SECONDS_PER_DAY + 1
+    
+    transitions = [first_day * SECONDS_PER_DAY]
+    offsets = [utc_offset(transitions[0], tz)]
+    for day in range(first_day + 1, last_day + 1):
+        offset = utc_offset(day * SECONDS_PER_DAY, tz)
+        if offset == offsets[-1]:
+            continue
+        
+        # Bisect the previous day down to the minute the offset changed
+        low = (day - 1) * SECONDS_PER_DAY // SECONDS_PER_MINUTE
+        high = day * SECONDS_PER_DAY // SECONDS_PER_MINUTE
+        while high - low > 1:
+            middle = (low + high) // 2
+            if utc_offset(middle * SECONDS_PER_MINUTE, tz) == offsets[-1]:
+                low = middle
+            else:
+                high = middle
+        transitions.append(high * SECONDS_PER_MINUTE)
+        offsets.append(offset)
+    
+    return np.array(transitions, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+def to_local_seconds(timestamps, tz):
+    """Shift UTC timestamps to local wall-clock epoch seconds in tz, DST included"""
+    epochs = to_epoch_seconds(timestamps)
+    if epochs.size == 0:
+        return epochs
+    
+    transitions, offsets = timezone_transitions(epochs.min(), epochs.max(), tz)
+    index = np.searchsorted(transitions, epochs, side="right") - 1
+    return epochs + offsets[index]
+
+
+def local_weekday_hour(timestamps, tz):
+    """Return the local weekday (0 = Monday) and hour of every timestamp"""
+    local = to_local_seconds(timestamps, tz)
+    weekdays = (local // SECONDS_PER_DAY + EPOCH_WEEKDAY) % 7
+    hours = local % SECONDS_PER_DAY // SECONDS_PER_HOUR
+    return weekdays, hours
+
+
+def weekday_hour_histogram(timestamps, tz):
+    """Count orders per local weekday and hour as a 7x24 array"""
+    weekdays, hours = local_weekday_hour(timestamps, tz)
+    return np.bincount(weekdays * 24 + hours, minlength=7 * 24).reshape(7, 24)
@@ -1,30 +1,42 @@
 import sys
-import os
-import sqlite3
+import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                            QLabel, QLineEdit, QPushButton, QTabWidget, QTableWidget, 
-                            QTableWidgetItem, QMessageBox, QHeaderView, QInputDialog, 
+                            QLabel, QLineEdit, QPushButton, QTabWidget, QTableView, 
+                            QAbstractItemView, QMessageBox, QHeaderView, QInputDialog, 
                             QDialog, QFormLayout, QSpinBox, QDialogButtonBox, QFrame,
-                            QComboBox)
-from PyQt5.QtCore import Qt, QSize, QTimer
-from PyQt5.QtGui import QFont, QIcon, QColor, QPalette
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-import datetime
-import pytz
-from dateutil import parser
-from collections import defaultdict
-import io
-import random
+                            QComboBox, QDateEdit, QTableWidget, QTableWidgetItem, QFileDialog,
+                            QShortcut)
+from PyQt5.QtCore import Qt, QSize, QTimer, QDate
+from PyQt5.QtGui import QFont, QIcon, QColor, QPalette, QKeySequence
+
+import alerts
+import auth
+import database
+import diagnostics
+import sample_data
+from inventory_model import CURRENT_COLUMNS, FUTURE_COLUMNS, InventoryModel, InventoryProxyModel
+from workers import JobRunner
+
+# Preset date ranges on the Analytics tab, in days up to and including today
+DATE_RANGE_DAYS = {"Last 7 Days": 7, "Last 30 Days": 30, "Last 90 Days": 90}
+
+# Users who may open the hidden Diagnostics tab, and its shortcut
+DIAGNOSTICS_USERS = ("admin",)
+DIAGNOSTICS_SHORTCUT = "Ctrl+Shift+D"
+
+# Seconds between refreshes of the Diagnostics tab while it is shown
+DIAGNOSTICS_REFRESH_S = 2
+
+# Seconds between low-stock checks while logged in, to catch orders synced by kplate.py
+ALERT_REFRESH_S = 60
+
+# How long a new low-stock alert stays in the status bar, in milliseconds
+ALERT_TOAST_MS = 8000
+
+# Files the inventory import and export offer
+INVENTORY_FILE_FILTER = "Inventory files (*.csv *.xlsx);;CSV files (*.csv);;Excel files (*.xlsx)"
+
 
-class OrderAnalyticsFigure(FigureCanvas):
-    """A class to create a matplotlib figure embedded in Qt"""
-    def __init__(self, parent=None, width=10, height=6, dpi=100):
-        fig = Figure(figsize=(width, height), dpi=dpi)
-        self.axes = fig.add_subplot(111)
-        super(OrderAnalyticsFigure, self).__init__(fig)
-        
 class KPlateAdminApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -33,211 +45,54 @@ class KPlateAdminApp(QMainWindow):
         self.setWindowTitle("K-Plate Admin Panel")
         self.resize(800, 600)
         
-        # Database path
+        # Database path and shared connection layer
         self.db_path = "kplate.db"
-        self.create_db_tables()
+        self.db = database.Database(self.db_path)
+        sample_data.initialize(self.db)
         
-        # Current user
+        # Current user, and failed logins per username
         self.current_user = None
+        self.login_throttle = auth.LoginThrottle()
+        
+        # Store whose inventory and orders are shown
+        self.location_id = self.db.main_location_id()
         
         # Theme mode (default to dark)
         self.theme_mode = "dark"
         
+        # Background jobs (analytics loading)
+        self.jobs = JobRunner(self)
+        
+        # Ingredients shown by both inventory tables
+        self.inventory_model = InventoryModel(self)
+        
         # Set up UI
         self.init_ui()
         self.apply_theme()
+    
+    def check_orders_database(self):
+        """Check the orders database, generating sample data if it is empty, and return a status message"""
+        # Check if orders table exists
+        cursor = self.db.connection().cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='orders'")
+        table_exists = cursor.fetchone()
         
-    def create_db_tables(self):
-        """Create database tables if they don't exist"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create users table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL
-        )
-        ''')
-        
-        # Create ingredients table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ingredients (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            quantity INTEGER NOT NULL,
-            expected_restock INTEGER DEFAULT 0
-        )
-        ''')
-        
-        # Create orders table for analytics
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY,
-            order_id TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            day_of_week INTEGER NOT NULL,
-            hour INTEGER NOT NULL
-        )
-        ''')
-        
-        # Check if admin user exists, if not create one
-        cursor.execute("SELECT * FROM users WHERE username = 'admin'")
-        admin = cursor.fetchone()
-        if not admin:
-            cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", 
-                          ('admin', 'password'))  # In a real app, hash the password
-            
-            # Add initial inventory data
-            initial_ingredients = [
-                ('K-Plate', 562, 400),
-                ('Spicy Chicken Plate', 190, 120),
-                ('Spicy Pork Plate', 93, 60),
-                ('Short Plate', 60, 40),
-                ('Soy Chicken Plate', 44, 0),
-                ('Beef Dumplings', 124, 80),
-                ('Kimchi Dumplings', 48, 0),
-                ('Fries', 46, 30),
-                ('6 Wings', 60, 40),
-                ('12 Wings', 24, 0),
-                ('18 Wings', 6, 0),
-                ('Mixed Veggie Plate', 22, 0)
-            ]
-            
-            cursor.executemany(
-                "INSERT INTO ingredients (name, quantity, expected_restock) VALUES (?, ?, ?)",
-                initial_ingredients
-            )
-            
-            # Generate initial mock order data
-            self.generate_initial_order_data(cursor)
-        
-        conn.commit()
-        conn.close()
-
-    def generate_initial_order_data(self, cursor):
-        """Generate initial order data and save to database"""
-        # Define your local timezone
-        local_tz = pytz.timezone('US/Pacific')
+        if not table_exists:
+            raise RuntimeError("Orders table does not exist in database")
         
-        # Create mock orders for the past 2 weeks (only if table is empty)
-        cursor.execute("SELECT COUNT(*) FROM orders")
-        count = cursor.fetchone()[0]
+        # Count orders
+        count = self.db.count_orders()
         
         if count == 0:
-            # Create a realistic distribution of orders
-            # Create mock orders for the past 2 weeks
-            start_date = datetime.datetime.now() - datetime.timedelta(weeks=2)
-            
-            order_data = []
-            order_id = 1000
+            # No orders found, regenerate sample data
+            sample_data.add_sample_orders(self.db)
             
-            # Create a realistic distribution with two peaks (lunch and dinner)
-            for day_offset in range(14):
-                current_date = start_date + datetime.timedelta(days=day_offset)
-                weekday = current_date.weekday()
-                
-                # More orders on weekends (5=Sat, 6=Sun)
-                num_orders = 50 if weekday >= 5 else 30
-                
-                for _ in range(num_orders):
-                    # Create a bimodal distribution (lunch and dinner peaks)
-                    hour = None
-                    r = random.random()
-                    
-                    if r < 0.45:  # Lunch peak (11am-2pm)
-                        hour = random.choice([11, 12, 13, 14])
-                        # More orders at 12-1
-                        if hour in [12, 13]:
-                            if random.random() < 0.7:  # 70% chance to keep this hour
-                                pass
-                            else:
-                                continue
-                    elif r < 0.9:  # Dinner peak (5pm-8pm)
-                        hour = random.choice([17, 18, 19, 20])
-                        # More orders at 6-7pm
-                        if hour in [18, 19]:
-                            if random.random() < 0.7:  # 70% chance to keep this hour
-                                pass
-                            else:
-                                continue
-                    else:  # Some scattered orders throughout the day
-                        hour = random.choice([10, 15, 16, 21, 22])
-                        # Lower probability of keeping these hours
-                        if random.random() < 0.3:  # 30% chance to keep
-                            pass
-                        else:
-                            continue
-                    
-                    minute = random.randint(0, 59)
-                    
-                    # Create datetime in local timezone
-                    order_time = current_date.replace(hour=hour, minute=minute, second=0)
-                    
-                    # Convert to UTC
-                    order_time_utc = order_time.astimezone(pytz.UTC)
-                    
-                    # Format as ISO string for Square API compatibility
-                    created_at = order_time_utc.isoformat()
-                    
-                    # Add to order data
-                    order_data.append((
-                        f"order_{order_id}",
-                        created_at,
-                        weekday,
-                        hour
-                    ))
-                    
-                    order_id += 1
-            
-            # Insert into database
-            cursor.executemany(
-                "INSERT INTO orders (order_id, created_at, day_of_week, hour) VALUES (?, ?, ?, ?)",
-                order_data
-            )
-            print(f"Added {len(order_data)} mock orders to database")
+            # Check count again
+            new_count = self.db.count_orders()
+            return f"Generated {new_count} sample orders"
         
-    def check_orders_database(self):
-        """Check the orders database and report status"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check if orders table exists
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='orders'")
-            table_exists = cursor.fetchone()
-            
-            if not table_exists:
-                self.analytics_status.setText("Error: Orders table does not exist in database")
-                conn.close()
-                return False
-            
-            # Count orders
-            cursor.execute("SELECT COUNT(*) FROM orders")
-            count = cursor.fetchone()[0]
-            
-            if count == 0:
-                # No orders found, regenerate sample data
-                self.analytics_status.setText("No orders found. Generating sample data...")
-                self.generate_initial_order_data(cursor)
-                conn.commit()
-                
-                # Check count again
-                cursor.execute("SELECT COUNT(*) FROM orders")
-                new_count = cursor.fetchone()[0]
-                self.analytics_status.setText(f"Generated {new_count} sample orders")
-            else:
-                self.analytics_status.setText(f"Found {count} orders in database")
-            
-            conn.close()
-            return True
-        except Exception as e:
-            self.analytics_status.setText(f"Database error: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return False
-            
+        return f"Found {count} orders in database"
+    
     def init_ui(self):
         """Initialize the user interface"""
         # Create central widget
@@ -314,11 +169,11 @@ class KPlateAdminApp(QMainWindow):
         login_form_layout.addWidget(self.password_input)
         
         # Login button
-        login_button = QPushButton("Login")
-        login_button.setObjectName("primaryButton")
-        login_button.setMinimumHeight(40)
-        login_button.clicked.connect(self.login)
-        login_form_layout.addWidget(login_button, alignment=Qt.AlignCenter)
+        self.login_button = QPushButton("Login")
+        self.login_button.setObjectName("primaryButton")
+        self.login_button.setMinimumHeight(40)
+        self.login_button.clicked.connect(self.login)
+        login_form_layout.addWidget(self.login_button, alignment=Qt.AlignCenter)
         
         # Error message
         self.login_error = QLabel("")
@@ -331,6 +186,9 @@ class KPlateAdminApp(QMainWindow):
         login_layout.addStretch()
     
     def setup_analytics_tab(self, tab):
+        # Loads matplotlib, so only done once the tab is opened
+        from charts import OrderAnalyticsFigure
+        
         layout = QVBoxLayout(tab)
         
         # Title
@@ -349,9 +207,30 @@ class KPlateAdminApp(QMainWindow):
                                     "Thursday", "Friday", "Saturday", "Sunday"])
         self.weekday_combo.currentIndexChanged.connect(self.update_analytics_chart)
         
+        # Date range, applied in SQL so only the orders inside it are read
+        range_label = QLabel("Date Range:")
+        range_label.setObjectName("formLabel")
+        
+        self.date_range_combo = QComboBox()
+        self.date_range_combo.addItems(["All Time"] + list(DATE_RANGE_DAYS) + ["Custom Range"])
+        self.date_range_combo.currentIndexChanged.connect(self.change_date_range)
+        
+        today = QDate.currentDate()
+        self.range_start_edit = QDateEdit(today.addDays(-29))
+        self.range_end_edit = QDateEdit(today)
+        for date_edit in (self.range_start_edit, self.range_end_edit):
+            date_edit.setCalendarPopup(True)
+            date_edit.setDisplayFormat("yyyy-MM-dd")
+            date_edit.dateChanged.connect(self.fetch_order_data)
+            date_edit.hide()
+        
         weekday_layout.addWidget(weekday_label)
         weekday_layout.addWidget(self.weekday_combo)
         weekday_layout.addStretch()
+        weekday_layout.addWidget(range_label)
+        weekday_layout.addWidget(self.date_range_combo)
+        weekday_layout.addWidget(self.range_start_edit)
+        weekday_layout.addWidget(self.range_end_edit)
         layout.addLayout(weekday_layout)
         
         # Section for the chart
@@ -376,96 +255,82 @@ class KPlateAdminApp(QMainWindow):
         self.analytics_status.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.analytics_status)
         
-        # List to store the order data
-        self.orders_data = None
+        # Hourly order counts per weekday, read from the rollup table
+        self.orders_count = 0
         self.weekday_orders = None
         
-        # Set a timer to fetch data when the tab is shown
-        QTimer.singleShot(500, self.fetch_order_data)
-
+        # Fetch data once the tab has been painted
+        QTimer.singleShot(0, self.fetch_order_data)
+    
+    def change_date_range(self, index):
+        """Show the date pickers for a custom range and reload the chart"""
+        custom = self.date_range_combo.currentText() == "Custom Range"
+        self.range_start_edit.setVisible(custom)
+        self.range_end_edit.setVisible(custom)
+        self.fetch_order_data()
+    
+    def selected_date_range(self):
+        """Return the first and last local day of the chosen date range, or None for all history"""
+        label = self.date_range_combo.currentText()
+        if label == "All Time":
+            return None
+        
+        if label == "Custom Range":
+            return self.range_start_edit.date().toPyDate(), self.range_end_edit.date().toPyDate()
+        
+        last_day = datetime.datetime.now(self.db.business_timezone()).date()
+        return last_day - datetime.timedelta(days=DATE_RANGE_DAYS[label] - 1), last_day
+    
     def fetch_order_data(self):
-        """Fetch order data from the database"""
+        """Load hourly order counts for the selected date range in the background"""
         self.analytics_status.setText("Fetching order data...")
+        date_range = self.selected_date_range()
+        location_id = self.location_id
         
+        # A newer request replaces any load that is still running
+        self.jobs.submit("analytics",
+                         lambda check_cancelled: self.load_order_data(check_cancelled, date_range, location_id),
+                         self.show_order_data, self.show_order_data_error)
+    
+    def load_order_data(self, check_cancelled, date_range=None, location_id=None):
+        """Read and group the hourly order counts (runs on a worker thread)"""
         # First check database status
-        if not self.check_orders_database():
-            return
+        self.check_orders_database()
+        check_cancelled()
         
-        try:
-            # Clear previous data
-            self.orders_data = []
-            
-            # Clear previous figure
-            if hasattr(self, 'order_figure') and self.order_figure:
-                self.order_figure.figure.clear()
-            
-            # Get data from database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Get all orders
-            cursor.execute("SELECT order_id, created_at, day_of_week, hour FROM orders")
-            orders_db = cursor.fetchall()
-            conn.close()
-            
-            # Convert to dict format (similar to Square API format)
-            for order_id, created_at, day_of_week, hour in orders_db:
-                order = {
-                    "id": order_id,
-                    "created_at": created_at
-                }
-                self.orders_data.append(order)
-            
-            # Group the orders by weekday
-            self.weekday_orders = self.group_orders_by_weekday(self.orders_data)
-            
-            # Update the chart for all days initially
-            self.weekday_combo.setCurrentIndex(0)
-            self.update_analytics_chart(0)
-            
-            self.analytics_status.setText(f"Order data loaded: {len(self.orders_data)} orders")
-        except Exception as e:
-            self.analytics_status.setText(f"Error loading order data: {str(e)}")
-            import traceback
-            traceback.print_exc()
-
-    def group_orders_by_weekday(self, orders):
-        """Group orders by weekday (Monday-Sunday)"""
-        if not orders:
-            return {}
-        
-        # Initialize a dictionary for orders by weekday
-        weekday_orders = {i: [] for i in range(7)}
-        
-        # Get local timezone
-        local_tz = pytz.timezone('US/Pacific')  # Replace with your business timezone
-        
-        weekday_names = {
-            0: "Monday",
-            1: "Tuesday",
-            2: "Wednesday", 
-            3: "Thursday",
-            4: "Friday",
-            5: "Saturday",
-            6: "Sunday"
-        }
+        # All history comes from the 7x24 rollup; a range only reads the orders inside it
+        rollup = self.db.order_counts_by_weekday_hour(location_id, *(date_range or ()))
+        check_cancelled()
         
-        for order in orders:
-            if order.get("created_at"):
-                # Parse the UTC timestamp
-                order_date_utc = parser.isoparse(order["created_at"])
-                # Convert to local timezone
-                order_date_local = order_date_utc.astimezone(local_tz)
-                
-                # Get weekday (0 = Monday, 6 = Sunday)
-                weekday = order_date_local.weekday()
-                
-                # Add order to the appropriate weekday list
-                weekday_orders[weekday].append(order)
+        # Group the hourly counts by weekday
+        return self.group_counts_by_weekday(rollup)
+    
+    def show_order_data(self, weekday_orders):
+        """Show freshly loaded order counts for the selected day"""
+        self.weekday_orders = weekday_orders
+        self.orders_count = sum(sum(counts) for counts in weekday_orders.values())
+        
+        self.update_analytics_chart()
+        self.analytics_status.setText(
+            f"Order data loaded: {self.orders_count} orders ({self.date_range_combo.currentText().lower()})"
+        )
+    
+    def show_order_data_error(self, message):
+        """Report a failed order data load"""
+        self.analytics_status.setText(f"Error loading order data: {message}")
+    
+    @diagnostics.traced("analytics.group")
+    def group_counts_by_weekday(self, rollup):
+        """Turn (weekday, hour, count) rows into 24 hourly counts per weekday name"""
+        # Initialize 24 hourly counts for each weekday (0 = Monday, 6 = Sunday)
+        weekday_counts = {i: [0] * 24 for i in range(7)}
+        for day_of_week, hour, order_count in rollup:
+            weekday_counts[day_of_week][hour] = order_count
         
         # Return dictionary with weekday names as keys
-        return {weekday_names[day]: orders for day, orders in weekday_orders.items()}
-
+        return {database.WEEKDAY_NAMES[day]: counts for day, counts in weekday_counts.items()}
+    
+    @diagnostics.traced("chart.update")
     def update_analytics_chart(self, index=None):
         """Update the analytics chart based on the selected weekday"""
         if not self.weekday_orders:
@@ -474,109 +339,23 @@ class KPlateAdminApp(QMainWindow):
         
         selected_day = self.weekday_combo.currentText()
         
-        # Define the local timezone 
-        local_tz = pytz.timezone('US/Pacific')  # Replace with your business timezone
-        
-        # Set colors based on theme
-        bar_color = 'skyblue' if self.theme_mode == "light" else '#2979FF'
-        text_color = '#333333' if self.theme_mode == "light" else '#FFFFFF'
-        grid_color = '#E0E0E0' if self.theme_mode == "light" else '#333333'
-        bg_color = 'white' if self.theme_mode == "light" else '#201c1c'
-        
-        # Configure figure and axes background
-        self.order_figure.figure.patch.set_facecolor(bg_color)
+        # Recolor for the current theme (no-op if unchanged)
+        self.order_figure.set_theme(self.theme_mode)
         
         if selected_day == "All Days":
-            # Create a subplot for each day
-            self.order_figure.figure.clear()
+            self.order_figure.show_all_days(self.weekday_orders)
             
             # Update status message for All Days view
             self.analytics_status.setText(f"Showing order data for All Days")
-            
-            # Create a 3x3 grid of subplots (7 days + 2 empty)
-            for i, day in enumerate(["Monday", "Tuesday", "Wednesday", 
-                                    "Thursday", "Friday", "Saturday", "Sunday"]):
-                
-                orders = self.weekday_orders.get(day, [])
-                
-                # Create subplot (add 1 because subplot indices start at 1)
-                ax = self.order_figure.figure.add_subplot(3, 3, i+1)
-                
-                # Count orders per hour
-                hour_counts = defaultdict(int)
-                for order in orders:
-                    if order.get("created_at"):
-                        dt_utc = parser.isoparse(order["created_at"])
-                        dt_local = dt_utc.astimezone(local_tz)
-                        hour_counts[dt_local.hour] += 1
-                
-                # Create a list of counts for each hour
-                hours = list(range(24))
-                counts = [hour_counts.get(hour, 0) for hour in hours]
-                
-                # Check if we have any data
-                if sum(counts) == 0:
-                    ax.text(0.5, 0.5, "No data", ha='center', va='center', color=text_color)
-                    ax.set_facecolor(bg_color)
-                else:
-                    # Plot on the current subplot
-                    ax.bar(hours, counts, color=bar_color)
-                    ax.set_facecolor(bg_color)
-                
-                ax.set_title(day, color=text_color)
-                ax.set_xlabel("Hour", color=text_color)
-                ax.set_ylabel("Orders", color=text_color)
-                ax.set_xticks([0, 6, 12, 18, 23])
-                ax.tick_params(colors=text_color)
-                
-                # Only show grid if we have data
-                if sum(counts) > 0:
-                    ax.grid(axis='y', linestyle='--', alpha=0.7, color=grid_color)
-            
-            self.order_figure.figure.tight_layout()
         else:
-            # Clear the current figure and create a new axis
-            self.order_figure.figure.clear()
-            self.order_figure.axes = self.order_figure.figure.add_subplot(111)
-            
-            # Get orders for the selected day
-            orders = self.weekday_orders.get(selected_day, [])
-            
-            # Count orders per hour for the selected day
-            hour_counts = defaultdict(int)
-            for order in orders:
-                if order.get("created_at"):
-                    dt_utc = parser.isoparse(order["created_at"])
-                    dt_local = dt_utc.astimezone(local_tz)
-                    hour_counts[dt_local.hour] += 1
-            
-            # Create a list of counts for each hour
-            hours = list(range(24))
-            counts = [hour_counts.get(hour, 0) for hour in hours]
-            
-            # Set background color
-            self.order_figure.axes.set_facecolor(bg_color)
+            # Hourly counts for the selected day
+            counts = self.weekday_orders.get(selected_day, [0] * 24)
+            self.order_figure.show_day(selected_day, counts)
             
-            # Check if we have any data
             if sum(counts) == 0:
-                self.order_figure.axes.text(0.5, 0.5, "No data available for this day", 
-                                        ha='center', va='center', 
-                                        fontsize=12, color=text_color)
                 self.analytics_status.setText(f"No orders found for {selected_day}")
             else:
-                # Plot the bar graph
-                self.order_figure.axes.bar(hours, counts, color=bar_color)
-                self.order_figure.axes.grid(axis='y', linestyle='--', alpha=0.7, color=grid_color)
                 self.analytics_status.setText(f"Showing order data for {selected_day}")
-            
-            self.order_figure.axes.set_title(f"Order Frequency by Hour on {selected_day}", color=text_color)
-            self.order_figure.axes.set_xlabel("Hour of Day (Local Time)", color=text_color)
-            self.order_figure.axes.set_ylabel("Number of Orders", color=text_color)
-            self.order_figure.axes.set_xticks(hours)
-            self.order_figure.axes.tick_params(colors=text_color)
-        
-        # Update the figure
-        self.order_figure.figure.canvas.draw()
     
     def setup_admin_ui(self):
         """Set up the admin panel UI"""
@@ -608,8 +387,27 @@ class KPlateAdminApp(QMainWindow):
         logout_button.setObjectName("warningButton")
         logout_button.clicked.connect(self.logout)
         
+        # Store selector; inventory and analytics follow the chosen location
+        location_label = QLabel("Location:")
+        location_label.setObjectName("headerLabel")
+        self.location_combo = QComboBox()
+        self.location_combo.setObjectName("themeCombo")
+        self.location_combo.currentIndexChanged.connect(self.change_location)
+        
+        # Low-stock badge, shown while any ingredient is projected to run out
+        self.alerts_button = QPushButton()
+        self.alerts_button.setObjectName("warningButton")
+        self.alerts_button.clicked.connect(self.show_alerts)
+        self.alerts_button.hide()
+        self.alerts = []
+        self.alert_timer = QTimer(self)
+        self.alert_timer.timeout.connect(self.refresh_alerts)
+        
         header_layout.addWidget(title_label)
         header_layout.addStretch()
+        header_layout.addWidget(self.alerts_button)
+        header_layout.addWidget(location_label)
+        header_layout.addWidget(self.location_combo)
         header_layout.addWidget(theme_label)
         header_layout.addWidget(self.admin_theme_combo)
         header_layout.addWidget(logout_button)
@@ -645,11 +443,25 @@ class KPlateAdminApp(QMainWindow):
         # Add tab widget to layout
         admin_layout.addWidget(self.tab_widget)
         
-        # Set up tabs
-        self.setup_current_inventory_tab(current_tab)
-        self.setup_future_inventory_tab(future_tab)
-        self.setup_add_ingredient_tab(add_tab)
-        self.setup_analytics_tab(analytics_tab)
+        # Each tab is built the first time it is shown
+        self.tab_builders = {
+            self.tab_widget.indexOf(current_tab): (current_tab, self.setup_current_inventory_tab),
+            self.tab_widget.indexOf(future_tab): (future_tab, self.setup_future_inventory_tab),
+            self.tab_widget.indexOf(add_tab): (add_tab, self.setup_add_ingredient_tab),
+            self.tab_widget.indexOf(analytics_tab): (analytics_tab, self.setup_analytics_tab)
+        }
+        self.tab_widget.currentChanged.connect(self.build_tab)
+        
+        # Timings for diagnosing slowdowns, hidden behind a shortcut for admins
+        self.diagnostics_tab = None
+        QShortcut(QKeySequence(DIAGNOSTICS_SHORTCUT), self.admin_widget, self.toggle_diagnostics)
+    
+    def build_tab(self, index):
+        """Build a tab's contents if it hasn't been shown before"""
+        builder = self.tab_builders.pop(index, None)
+        if builder:
+            tab, setup = builder
+            setup(tab)
     
     def setup_current_inventory_tab(self, tab):
         """Set up the current inventory tab"""
@@ -661,13 +473,17 @@ class KPlateAdminApp(QMainWindow):
         title.setObjectName("sectionTitle")
         layout.addWidget(title)
         
+        # Search
+        self.current_filter = QLineEdit()
+        self.current_filter.setPlaceholderText("Search ingredients...")
+        self.current_filter.setMinimumHeight(32)
+        layout.addWidget(self.current_filter)
+        
         # Table
-        self.current_table = QTableWidget()
-        self.current_table.setObjectName("inventoryTable")
-        self.current_table.setColumnCount(3)
-        self.current_table.setHorizontalHeaderLabels(["ID", "Ingredient", "Quantity"])
-        self.current_table.setShowGrid(True)
-        self.current_table.setAlternatingRowColors(True)
+        self.current_proxy = InventoryProxyModel(CURRENT_COLUMNS, self)
+        self.current_proxy.setSourceModel(self.inventory_model)
+        self.current_filter.textChanged.connect(self.current_proxy.setFilterFixedString)
+        self.current_table = self.create_inventory_view(self.current_proxy)
         
         # Set column widths
         self.current_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
@@ -691,10 +507,22 @@ class KPlateAdminApp(QMainWindow):
         delete_button.clicked.connect(self.delete_ingredient)
         button_layout.addWidget(delete_button)
         
+        import_button = QPushButton("Import...")
+        import_button.setObjectName("primaryButton")
+        import_button.setMinimumHeight(36)
+        import_button.clicked.connect(self.import_inventory)
+        button_layout.addWidget(import_button)
+        
+        export_button = QPushButton("Export...")
+        export_button.setObjectName("primaryButton")
+        export_button.setMinimumHeight(36)
+        export_button.clicked.connect(self.export_inventory)
+        button_layout.addWidget(export_button)
+        
         refresh_button = QPushButton("Refresh")
         refresh_button.setObjectName("successButton")
         refresh_button.setMinimumHeight(36)
-        refresh_button.clicked.connect(lambda: self.load_ingredients(current=True))
+        refresh_button.clicked.connect(self.load_ingredients)
         button_layout.addWidget(refresh_button)
         
         layout.addLayout(button_layout)
@@ -709,19 +537,24 @@ class KPlateAdminApp(QMainWindow):
         title.setObjectName("sectionTitle")
         layout.addWidget(title)
         
+        # Search
+        self.future_filter = QLineEdit()
+        self.future_filter.setPlaceholderText("Search ingredients...")
+        self.future_filter.setMinimumHeight(32)
+        layout.addWidget(self.future_filter)
+        
         # Table
-        self.future_table = QTableWidget()
-        self.future_table.setObjectName("inventoryTable")
-        self.future_table.setColumnCount(4)
-        self.future_table.setHorizontalHeaderLabels(["ID", "Ingredient", "Expected Restock", "Predicted Inventory"])
-        self.future_table.setShowGrid(True)
-        self.future_table.setAlternatingRowColors(True)
+        self.future_proxy = InventoryProxyModel(FUTURE_COLUMNS, self)
+        self.future_proxy.setSourceModel(self.inventory_model)
+        self.future_filter.textChanged.connect(self.future_proxy.setFilterFixedString)
+        self.future_table = self.create_inventory_view(self.future_proxy)
         
         # Set column widths
         self.future_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
         self.future_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
         self.future_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents)
         self.future_table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeToContents)
+        self.future_table.horizontalHeader().setSectionResizeMode(4, QHeaderView.ResizeToContents)
         
         layout.addWidget(self.future_table)
         
@@ -737,10 +570,144 @@ class KPlateAdminApp(QMainWindow):
         refresh_button = QPushButton("Refresh")
         refresh_button.setObjectName("successButton")
         refresh_button.setMinimumHeight(36)
-        refresh_button.clicked.connect(lambda: self.load_ingredients(future=True))
+        refresh_button.clicked.connect(self.load_ingredients)
+        button_layout.addWidget(refresh_button)
+        
+        layout.addLayout(button_layout)
+    
+    def create_inventory_view(self, proxy):
+        """Create a sortable, row-selecting table view over an inventory proxy"""
+        view = QTableView()
+        view.setObjectName("inventoryTable")
+        view.setModel(proxy)
+        view.setShowGrid(True)
+        view.setAlternatingRowColors(True)
+        view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        view.setSelectionMode(QAbstractItemView.SingleSelection)
+        view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        view.setSortingEnabled(True)
+        view.sortByColumn(1, Qt.AscendingOrder)
+        view.verticalHeader().hide()
+        return view
+    
+    def selected_ingredient(self, view):
+        """Return the ingredient selected in an inventory view, or None"""
+        rows = view.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return view.model().ingredient(rows[0])
+    
+    def toggle_diagnostics(self):
+        """Show or hide the Diagnostics tab (admins only)"""
+        if self.current_user not in DIAGNOSTICS_USERS:
+            return
+        
+        if self.diagnostics_tab is None:
+            self.diagnostics_tab = QWidget()
+            self.setup_diagnostics_tab(self.diagnostics_tab)
+        
+        index = self.tab_widget.indexOf(self.diagnostics_tab)
+        if index >= 0:
+            self.tab_widget.removeTab(index)
+        else:
+            self.tab_widget.setCurrentIndex(self.tab_widget.addTab(self.diagnostics_tab, "Diagnostics"))
+            self.refresh_diagnostics()
+    
+    def setup_diagnostics_tab(self, tab):
+        """Set up the Diagnostics tab: span timings, the slow log and background errors"""
+        layout = QVBoxLayout(tab)
+        
+        # Title
+        title = QLabel("Diagnostics")
+        title.setFont(QFont("Arial", 14, QFont.Bold))
+        title.setObjectName("sectionTitle")
+        layout.addWidget(title)
+        
+        # Rolling timings per span
+        self.spans_table = self.create_diagnostics_table(["Span", "Count", "p50 (ms)", "p95 (ms)", "Max (ms)"])
+        layout.addWidget(self.spans_table, 2)
+        
+        # Slow spans and failed jobs, newest first
+        slow_label = QLabel("Slow operations and errors")
+        slow_label.setObjectName("formLabel")
+        layout.addWidget(slow_label)
+        self.slow_table = self.create_diagnostics_table(["Time", "Span", "ms", "Thread", "Detail"])
+        layout.addWidget(self.slow_table, 1)
+        
+        # Buttons
+        button_layout = QHBoxLayout()
+        
+        save_button = QPushButton("Save JSON...")
+        save_button.setObjectName("primaryButton")
+        save_button.setMinimumHeight(36)
+        save_button.clicked.connect(self.save_diagnostics)
+        button_layout.addWidget(save_button)
+        
+        reset_button = QPushButton("Reset")
+        reset_button.setObjectName("warningButton")
+        reset_button.setMinimumHeight(36)
+        reset_button.clicked.connect(self.reset_diagnostics)
+        button_layout.addWidget(reset_button)
+        
+        refresh_button = QPushButton("Refresh")
+        refresh_button.setObjectName("successButton")
+        refresh_button.setMinimumHeight(36)
+        refresh_button.clicked.connect(self.refresh_diagnostics)
         button_layout.addWidget(refresh_button)
         
         layout.addLayout(button_layout)
+        
+        # Keep the numbers current while the tab is open
+        self.diagnostics_timer = QTimer(self)
+        self.diagnostics_timer.timeout.connect(self.refresh_diagnostics)
+        self.diagnostics_timer.start(DIAGNOSTICS_REFRESH_S * 1000)
+    
+    def create_diagnostics_table(self, headers):
+        """Create a read-only table for diagnostics rows"""
+        table = QTableWidget(0, len(headers))
+        table.setObjectName("inventoryTable")
+        table.setHorizontalHeaderLabels(headers)
+        table.setAlternatingRowColors(True)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.verticalHeader().hide()
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.horizontalHeader().setStretchLastSection(True)
+        return table
+    
+    def fill_diagnostics_table(self, table, rows):
+        table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                item = QTableWidgetItem("" if value is None else str(value))
+                if isinstance(value, (int, float)):
+                    item.setTextAlignment(int(Qt.AlignRight | Qt.AlignVCenter))
+                table.setItem(row, column, item)
+    
+    def refresh_diagnostics(self):
+        """Redraw the Diagnostics tab from the current timings, if it is shown"""
+        if self.tab_widget.currentWidget() is not self.diagnostics_tab:
+            return
+        snapshot = diagnostics.snapshot()
+        self.fill_diagnostics_table(self.spans_table, [
+            (name, stats["count"], stats["p50_ms"], stats["p95_ms"], stats["max_ms"])
+            for name, stats in snapshot["spans"].items()
+        ])
+        entries = [(entry["at"], entry["span"], entry["ms"], entry["thread"], entry["detail"])
+                   for entry in snapshot["slow_log"]]
+        entries += [(error["at"], error["span"], None, "error", error["error"]) for error in snapshot["errors"]]
+        self.fill_diagnostics_table(self.slow_table, sorted(entries, key=lambda entry: entry[0], reverse=True))
+    
+    def reset_diagnostics(self):
+        diagnostics.tracer.reset()
+        self.refresh_diagnostics()
+    
+    def save_diagnostics(self):
+        """Dump the timings, slow log and errors to a JSON file for later analysis"""
+        path, _ = QFileDialog.getSaveFileName(self, "Save Diagnostics", "kplate-diagnostics.json",
+                                              "JSON files (*.json)")
+        if path:
+            diagnostics.dump(path)
     
     def setup_add_ingredient_tab(self, tab):
         """Set up the add ingredient tab"""
@@ -760,7 +727,7 @@ class KPlateAdminApp(QMainWindow):
         form_layout.setLabelAlignment(Qt.AlignRight)
         form_layout.setFormAlignment(Qt.AlignLeft)
         form_layout.setSpacing(15)
-        
+
 # Name field
         name_label = QLabel("Ingredient Name:")
         name_label.setObjectName("formLabel")
@@ -818,28 +785,50 @@ class KPlateAdminApp(QMainWindow):
             self.login_error.setText("Please enter both username and password")
             return
         
-        # Check credentials in database
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, password))
-        user = cursor.fetchone()
-        conn.close()
+        wait = self.login_throttle.retry_after(username)
+        if wait:
+            self.login_error.setText(f"Too many failed attempts, try again in {wait:.0f} seconds")
+            return
         
-        if user:
-            self.current_user = username
-            self.welcome_label.setText(f"Welcome, {self.current_user}")
-            
-            # Transfer theme setting
-            self.admin_theme_combo.setCurrentIndex(self.theme_combo.currentIndex())
-            
-            # Switch to admin panel
-            self.login_widget.hide()
-            self.admin_widget.show()
-            
-            # Load data
-            self.load_ingredients(current=True, future=True)
-        else:
-            self.login_error.setText("Invalid username or password")
+        # Check credentials in the background; the hash is deliberately slow
+        self.login_button.setEnabled(False)
+        self.login_error.setText("Checking...")
+        self.jobs.submit(
+            "login", lambda check_cancelled: self.db.verify_user(username, password),
+            lambda verified: self.finish_login(username, verified),
+            self.login_failed
+        )
+    
+    def login_failed(self, message):
+        self.login_button.setEnabled(True)
+        self.login_error.setText(f"Login failed: {message}")
+    
+    def finish_login(self, username, verified):
+        """Open the admin panel for a verified user, or count the failed attempt"""
+        self.login_button.setEnabled(True)
+        if not verified:
+            wait = self.login_throttle.failed(username)
+            self.login_error.setText("Invalid username or password" +
+                                     (f"; try again in {wait:.0f} seconds" if wait else ""))
+            return
+        self.login_throttle.succeeded(username)
+        self.login_error.clear()
+        
+        self.current_user = username
+        self.welcome_label.setText(f"Welcome, {self.current_user}")
+        
+        # Transfer theme setting
+        self.admin_theme_combo.setCurrentIndex(self.theme_combo.currentIndex())
+        
+        # Switch to admin panel
+        self.login_widget.hide()
+        self.admin_widget.show()
+        
+        # Build the visible tab and load data
+        self.build_tab(self.tab_widget.currentIndex())
+        self.load_locations()
+        self.load_ingredients()
+        self.alert_timer.start(ALERT_REFRESH_S * 1000)
     
     def logout(self):
         """Handle logout"""
@@ -851,6 +840,15 @@ class KPlateAdminApp(QMainWindow):
         # Transfer theme setting
         self.theme_combo.setCurrentIndex(self.admin_theme_combo.currentIndex())
         
+        # The Diagnostics tab is only for the admin who opened it
+        if self.diagnostics_tab is not None:
+            self.tab_widget.removeTab(self.tab_widget.indexOf(self.diagnostics_tab))
+        
+        # Stop checking stock until someone logs in again
+        self.alert_timer.stop()
+        self.jobs.cancel("alerts")
+        self.set_alerts([])
+        
         # Switch to login screen
         self.admin_widget.hide()
         self.login_widget.show()
@@ -864,7 +862,7 @@ class KPlateAdminApp(QMainWindow):
             self.admin_theme_combo.setCurrentIndex(index)
         elif self.sender() == self.admin_theme_combo:
             self.theme_combo.setCurrentIndex(index)
-            
+        
         self.apply_theme()
         
         # Update analytics chart with new theme colors
@@ -951,19 +949,19 @@ class KPlateAdminApp(QMainWindow):
                     color: #FFFFFF;
                 }
                 
-                QTableWidget {
+                QTableView {
                     background-color: #1E1E1E;
                     alternate-background-color: #2D2D2D;
                     border: 1px solid #333333;
                     gridline-color: #333333;
                 }
                 
-                QTableWidget::item {
+                QTableView::item {
                     padding: 6px;
                     color: #FFFFFF;
                 }
                 
-                QTableWidget::item:selected {
+                QTableView::item:selected {
                     background-color: #2979FF;
                 }
                 
@@ -1114,19 +1112,19 @@ class KPlateAdminApp(QMainWindow):
                     color: #333333;
                 }
                 
-                QTableWidget {
+                QTableView {
                     background-color: #FFFFFF;
                     alternate-background-color: #F5F5F5;
                     border: 1px solid #E0E0E0;
                     gridline-color: #E0E0E0;
                 }
                 
-                QTableWidget::item {
+                QTableView::item {
                     padding: 6px;
                     color: #333333;
                 }
                 
-                QTableWidget::item:selected {
+                QTableView::item:selected {
                     background-color: #2196F3;
                     color: #FFFFFF;
                 }
@@ -1200,152 +1198,219 @@ class KPlateAdminApp(QMainWindow):
                 }
             """)
     
-    def load_ingredients(self, current=False, future=False):
-        """Load ingredients into tables"""
-        # Get ingredients from database
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, quantity, expected_restock FROM ingredients ORDER BY name")
-        ingredients = cursor.fetchall()
-        conn.close()
-        
-        # Update current inventory table
-        if current:
-            self.current_table.setRowCount(0)  # Clear table
-            
-            for row, ingredient in enumerate(ingredients):
-                id, name, quantity, _ = ingredient
-                
-                self.current_table.insertRow(row)
-                self.current_table.setItem(row, 0, QTableWidgetItem(str(id)))
-                self.current_table.setItem(row, 1, QTableWidgetItem(name))
-                self.current_table.setItem(row, 2, QTableWidgetItem(str(quantity)))
-        
-        # Update future inventory table
-        if future:
-            self.future_table.setRowCount(0)  # Clear table
-            
-            for row, ingredient in enumerate(ingredients):
-                id, name, quantity, expected = ingredient
-                predicted = quantity + expected
-                
-                self.future_table.insertRow(row)
-                self.future_table.setItem(row, 0, QTableWidgetItem(str(id)))
-                self.future_table.setItem(row, 1, QTableWidgetItem(name))
-                self.future_table.setItem(row, 2, QTableWidgetItem(str(expected)))
-                self.future_table.setItem(row, 3, QTableWidgetItem(str(predicted)))
+    def load_locations(self):
+        """Fill the location selector, keeping the current location selected"""
+        self.location_combo.blockSignals(True)
+        self.location_combo.clear()
+        for location_id, name in self.db.list_locations():
+            self.location_combo.addItem(name, location_id)
+        index = self.location_combo.findData(self.location_id)
+        self.location_combo.setCurrentIndex(max(index, 0))
+        self.location_id = self.location_combo.currentData() or database.DEFAULT_LOCATION_ID
+        self.location_combo.blockSignals(False)
+    
+    def change_location(self, index):
+        """Show another store's inventory and orders"""
+        self.location_id = self.location_combo.itemData(index)
+        self.load_ingredients()
+        if hasattr(self, "analytics_status"):
+            self.fetch_order_data()
+    
+    def load_ingredients(self):
+        """Reload ingredients from the database; only rows that changed are redrawn"""
+        self.inventory_model.set_ingredients(self.db.list_ingredients(self.location_id))
+        
+        # The projected columns follow once the forecasts are refreshed in the background
+        self.refresh_forecasts()
+        self.refresh_alerts()
+    
+    def reload_ingredient(self, ingredient_id):
+        """Re-read one ingredient after an edit and update its row in both tables"""
+        ingredient = self.db.get_ingredient(ingredient_id)
+        if ingredient is None:
+            self.inventory_model.remove_ingredient(ingredient_id)
+            return
+        import forecasting
+        
+        projection = forecasting.project_inventory(self.db.connection(), [ingredient])[ingredient.id]
+        self.inventory_model.update_ingredient(ingredient, projection)
+        self.refresh_alerts()
+    
+    def refresh_forecasts(self):
+        """Fold new sales into the ingredient forecasts in the background, then update both tables"""
+        location_id = self.location_id
+        self.jobs.submit(
+            "forecast", lambda check_cancelled: self.load_projections(check_cancelled, location_id),
+            lambda result: self.inventory_model.set_ingredients(*result),
+            lambda message: QMessageBox.warning(self, "Warning", f"Forecast update failed: {message}")
+        )
+    
+    def load_projections(self, check_cancelled, location_id=database.DEFAULT_LOCATION_ID):
+        """Update the forecasts and project every ingredient of a location (runs on a worker thread)"""
+        import forecasting
+        
+        conn = self.db.connection()
+        forecasting.update_forecasts(conn)
+        check_cancelled()
+        
+        ingredients = self.db.list_ingredients(location_id)
+        return ingredients, forecasting.project_inventory(conn, ingredients)
+    
+    def refresh_alerts(self):
+        """Re-evaluate the current location's low-stock alerts in the background"""
+        location_id = self.location_id
+        self.jobs.submit(
+            "alerts", lambda check_cancelled: alerts.evaluate(self.db.connection(), location_id),
+            self.set_alerts
+        )
+    
+    def set_alerts(self, found):
+        """Show the alerts on the badge and in the tables, announcing the ones not raised before"""
+        raised = [alert for alert in found if alert.ingredient_id not in self.inventory_model.alerted_ids]
+        self.alerts = found
+        self.inventory_model.set_alerts(alert.ingredient_id for alert in found)
+        
+        self.alerts_button.setText(f"Low Stock ({len(found)})")
+        self.alerts_button.setVisible(bool(found))
+        if raised:
+            self.statusBar().showMessage("Low stock: " + "; ".join(alerts.describe(alert) for alert in raised),
+                                         ALERT_TOAST_MS)
+    
+    def show_alerts(self):
+        """List every current low-stock alert"""
+        QMessageBox.warning(self, "Low Stock", "\n".join(alerts.describe(alert) for alert in self.alerts))
     
     def update_quantity(self):
         """Update the quantity of the selected ingredient"""
-        selected_items = self.current_table.selectedItems()
-        if not selected_items:
+        ingredient = self.selected_ingredient(self.current_table)
+        if ingredient is None:
             QMessageBox.warning(self, "Warning", "Please select an ingredient to update")
             return
         
-        # Get the row and ingredient ID
-        row = selected_items[0].row()
-        id_item = self.current_table.item(row, 0)
-        name_item = self.current_table.item(row, 1)
-        quantity_item = self.current_table.item(row, 2)
+        # Ask for new quantity
+        new_quantity, ok = QInputDialog.getInt(
+            self, "Update Quantity", 
+            f"Enter new quantity for {ingredient.name}:",
+            int(ingredient.quantity), 0, 9999
+        )
         
-        if id_item and name_item and quantity_item:
-            ingredient_id = int(id_item.text())
-            ingredient_name = name_item.text()
-            current_quantity = int(quantity_item.text())
+        if ok:
+            # Update database
+            self.db.set_quantity(ingredient.id, new_quantity)
             
-            # Ask for new quantity
-            new_quantity, ok = QInputDialog.getInt(
-                self, "Update Quantity", 
-                f"Enter new quantity for {ingredient_name}:",
-                current_quantity, 0, 9999
-            )
+            # Refresh the edited row
+            self.reload_ingredient(ingredient.id)
             
-            if ok:
-                # Update database
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute("UPDATE ingredients SET quantity = ? WHERE id = ?", (new_quantity, ingredient_id))
-                conn.commit()
-                conn.close()
-                
-                # Refresh tables
-                self.load_ingredients(current=True, future=True)
-                
-                QMessageBox.information(self, "Success", f"{ingredient_name} quantity updated to {new_quantity}")
+            QMessageBox.information(self, "Success", f"{ingredient.name} quantity updated to {new_quantity}")
     
     def update_restock(self):
         """Update the expected restock amount for the selected ingredient"""
-        selected_items = self.future_table.selectedItems()
-        if not selected_items:
+        ingredient = self.selected_ingredient(self.future_table)
+        if ingredient is None:
             QMessageBox.warning(self, "Warning", "Please select an ingredient to update")
             return
         
-        # Get the row and ingredient ID
-        row = selected_items[0].row()
-        id_item = self.future_table.item(row, 0)
-        name_item = self.future_table.item(row, 1)
-        restock_item = self.future_table.item(row, 2)
+        # Ask for new restock amount
+        new_restock, ok = QInputDialog.getInt(
+            self, "Update Expected Restock", 
+            f"Enter new expected restock for {ingredient.name}:",
+            int(ingredient.expected_restock), 0, 9999
+        )
         
-        if id_item and name_item and restock_item:
-            ingredient_id = int(id_item.text())
-            ingredient_name = name_item.text()
-            current_restock = int(restock_item.text())
+        if ok:
+            # Update database
+            self.db.set_expected_restock(ingredient.id, new_restock)
             
-            # Ask for new restock amount
-            new_restock, ok = QInputDialog.getInt(
-                self, "Update Expected Restock", 
-                f"Enter new expected restock for {ingredient_name}:",
-                current_restock, 0, 9999
-            )
+            # Refresh the edited row
+            self.reload_ingredient(ingredient.id)
             
-            if ok:
-                # Update database
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute("UPDATE ingredients SET expected_restock = ? WHERE id = ?", (new_restock, ingredient_id))
-                conn.commit()
-                conn.close()
-                
-                # Refresh tables
-                self.load_ingredients(current=True, future=True)
-                
-                QMessageBox.information(self, "Success", f"{ingredient_name} expected restock updated to {new_restock}")
+            QMessageBox.information(self, "Success", f"{ingredient.name} expected restock updated to {new_restock}")
     
     def delete_ingredient(self):
         """Delete the selected ingredient"""
-        selected_items = self.current_table.selectedItems()
-        if not selected_items:
+        ingredient = self.selected_ingredient(self.current_table)
+        if ingredient is None:
             QMessageBox.warning(self, "Warning", "Please select an ingredient to delete")
             return
         
-        # Get the row and ingredient ID
-        row = selected_items[0].row()
-        id_item = self.current_table.item(row, 0)
-        name_item = self.current_table.item(row, 1)
+        # Confirm deletion
+        reply = QMessageBox.question(
+            self, "Confirm Deletion", 
+            f"Are you sure you want to delete {ingredient.name}?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
         
-        if id_item and name_item:
-            ingredient_id = int(id_item.text())
-            ingredient_name = name_item.text()
+        if reply == QMessageBox.Yes:
+            # Delete from database
+            self.db.delete_ingredient(ingredient.id)
             
-            # Confirm deletion
-            reply = QMessageBox.question(
-                self, "Confirm Deletion", 
-                f"Are you sure you want to delete {ingredient_name}?",
-                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
-            )
+            # Remove the row from both tables
+            self.inventory_model.remove_ingredient(ingredient.id)
             
-            if reply == QMessageBox.Yes:
-                # Delete from database
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM ingredients WHERE id = ?", (ingredient_id,))
-                conn.commit()
-                conn.close()
-                
-                # Refresh tables
-                self.load_ingredients(current=True, future=True)
-                
-                QMessageBox.information(self, "Success", f"{ingredient_name} deleted successfully")
+            QMessageBox.information(self, "Success", f"{ingredient.name} deleted successfully")
+    
+    def import_inventory(self):
+        """Apply a CSV or Excel file of counts and restocks, after previewing every change"""
+        import inventory_io
+        
+        path, _ = QFileDialog.getOpenFileName(self, "Import Inventory", "", INVENTORY_FILE_FILTER)
+        if not path:
+            return
+        try:
+            changes = inventory_io.plan_import(inventory_io.read_file(path),
+                                               self.db.list_ingredients(self.location_id))
+        except inventory_io.InventoryFileError as e:
+            QMessageBox.warning(self, "Import Failed", f"Nothing was imported. Please fix these rows:\n\n{e}")
+            return
+        except (OSError, RuntimeError, ValueError) as e:
+            QMessageBox.warning(self, "Import Failed", f"Could not read {path}: {e}")
+            return
+        if not changes:
+            QMessageBox.information(self, "Import", "The file matches the current inventory")
+            return
+        if not self.preview_inventory_changes(changes):
+            return
+        
+        # One transaction for the whole file, then one reload
+        inventory_io.apply_changes(self.db, changes, self.location_id)
+        self.load_ingredients()
+        QMessageBox.information(self, "Success", f"{len(changes)} ingredients updated")
+    
+    def preview_inventory_changes(self, changes):
+        """Show the changes an import makes; returns True if they should be applied"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Import Preview")
+        dialog.resize(640, 480)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel(f"{len(changes)} ingredients will change:"))
+        
+        table = self.create_diagnostics_table(["Ingredient", "Quantity", "New Quantity",
+                                               "Expected Restock", "New Expected Restock"])
+        self.fill_diagnostics_table(table, [
+            (change.name + (" (new)" if change.ingredient_id is None else ""),
+             change.old_quantity, change.quantity, change.old_expected_restock, change.expected_restock)
+            for change in changes
+        ])
+        layout.addWidget(table)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.button(QDialogButtonBox.Ok).setText("Apply")
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        return dialog.exec_() == QDialog.Accepted
+    
+    def export_inventory(self):
+        """Write the current location's ingredients to a CSV or Excel file"""
+        import inventory_io
+        
+        path, _ = QFileDialog.getSaveFileName(self, "Export Inventory", "inventory.csv", INVENTORY_FILE_FILTER)
+        if not path:
+            return
+        try:
+            inventory_io.export_file(path, self.db.list_ingredients(self.location_id))
+        except (OSError, RuntimeError) as e:
+            QMessageBox.warning(self, "Export Failed", str(e))
     
     def add_ingredient(self):
         """Add a new ingredient"""
@@ -1359,27 +1424,16 @@ class KPlateAdminApp(QMainWindow):
             return
         
         # Check if ingredient already exists
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM ingredients WHERE name = ?", (name,))
-        exists = cursor.fetchone()
-        
-        if exists:
+        if self.db.find_ingredient(name, self.location_id):
             self.add_status.setText(f"Ingredient '{name}' already exists")
             self.add_status.setStyleSheet("color: #FF5252;")
-            conn.close()
             return
         
         # Add to database
-        cursor.execute(
-            "INSERT INTO ingredients (name, quantity, expected_restock) VALUES (?, ?, ?)",
-            (name, quantity, restock)
-        )
-        conn.commit()
-        conn.close()
+        ingredient_id = self.db.add_ingredient(name, quantity, restock, self.location_id)
         
-        # Refresh tables
-        self.load_ingredients(current=True, future=True)
+        # Add the new row to both tables
+        self.reload_ingredient(ingredient_id)
         
         # Clear form
         self.new_name_input.clear()
@@ -1399,7 +1453,9 @@ def main():
     
     window = KPlateAdminApp()
     window.show()
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    window.db.close()
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
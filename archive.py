@@ -0,0 +1,425 @@
+"""Parquet archive of cold order history, partitioned by location and month
+
+    python kplate.py archive --horizon-days 365 --vacuum
+
+Orders whose local day is more than a horizon old are moved out of SQLite,
+a whole month at a time, into Parquet files under kplate_archive/ next to
+the database (or the archive_path setting):
+
+    kplate_archive/location=<id>/month=2023-04/orders-<stamp>.parquet
+    kplate_archive/location=<id>/month=2023-04/consumption-<stamp>.parquet
+
+Only what analytics and forecasting read is kept: each order's id and UTC
+epoch, and the ingredients it used. Local dates, weekdays and hours are
+derived from the epoch when read, so a new business timezone applies to
+archived orders too. Line items are not kept, so archived orders are not
+re-mapped when item mappings change.
+
+SQLite keeps a catalog of the partitions with their epoch range, plus each
+location's archived weekday/hour counts. All-time analytics never open a
+file, and range queries only read the partitions they overlap. pyarrow is
+only needed once there is something archived.
+
+An order imported or synced again after its month was archived goes back
+into SQLite, and the same transaction rewrites its partition without the
+archived copy, so it is never counted twice.
+"""
+import datetime
+import os
+import time
+import urllib.parse
+
+import numpy as np
+
+import analytics
+import database
+import diagnostics
+
+# Orders whose local day is older than this many days are archived
+ARCHIVE_HORIZON_DAYS = 365
+
+# Widest UTC offset in use, padding a local day range when matching it to epochs
+MAX_UTC_OFFSET_S = 14 * analytics.SECONDS_PER_HOUR
+
+# Order ids of the partition being archived, as a subquery
+ARCHIVE_ORDER_IDS = "SELECT order_id FROM temp.archive_orders"
+
+EPOCH_DATE = datetime.date(1970, 1, 1)
+
+
+def require_pyarrow():
+    """Import pyarrow with its Parquet support, explaining how to get it if it is missing"""
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Archived orders need pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+def day_number(day):
+    """Convert a date or ISO date to days since 1970-01-01"""
+    return (datetime.date.fromisoformat(str(day)) - EPOCH_DATE).days
+
+
+def archive_root(conn):
+    """Return the archive directory: the archive_path setting, else kplate_archive beside the database"""
+    row = conn.execute("SELECT value FROM settings WHERE key = 'archive_path'").fetchone()
+    if row:
+        return row[0]
+    db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+    return os.path.splitext(db_file or "kplate.db")[0] + "_archive"
+
+
+def set_archive_root(conn, path):
+    """Keep the archive in another directory (files already archived are not moved)"""
+    with conn:
+        conn.execute(
+            "INSERT INTO settings (key, value) VALUES ('archive_path', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (os.path.abspath(path),)
+        )
+
+
+def partition_files(conn, column, location_id=None, first_day=None, last_day=None):
+    """Return the orders or consumption files of partitions that may hold orders on local days
+    first_day..last_day (days since 1970-01-01) of one location, or of all of them"""
+    conditions = []
+    params = []
+    if location_id is not None:
+        conditions.append("location_id = ?")
+        params.append(location_id)
+    if first_day is not None:
+        conditions.append("last_epoch >= ?")
+        params.append(first_day * analytics.SECONDS_PER_DAY - MAX_UTC_OFFSET_S)
+    if last_day is not None:
+        conditions.append("first_epoch < ?")
+        params.append((last_day + 1) * analytics.SECONDS_PER_DAY + MAX_UTC_OFFSET_S)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    rows = conn.execute(f"SELECT {column} FROM archived_partitions {where}", params).fetchall()
+    if not rows:
+        return []
+    root = archive_root(conn)
+    return [os.path.join(root, path) for path, in rows]
+
+
+def read_files(files, columns, first_day=None, last_day=None):
+    """Read columns of archive files into one table, keeping rows near local days first_day..last_day"""
+    pa = require_pyarrow()
+    filters = []
+    if first_day is not None:
+        filters.append(("created_epoch", ">=", first_day * analytics.SECONDS_PER_DAY - MAX_UTC_OFFSET_S))
+    if last_day is not None:
+        filters.append(("created_epoch", "<", (last_day + 1) * analytics.SECONDS_PER_DAY + MAX_UTC_OFFSET_S))
+    tables = [pa.parquet.read_table(path, columns=columns, filters=filters or None) for path in files]
+    return pa.concat_tables(tables)
+
+
+def local_seconds(epochs, tz):
+    return analytics.to_local_seconds(epochs, tz) if epochs.size else epochs
+
+
+def weekday_hour_counts(epochs, tz):
+    """Count epochs per local weekday and hour as a 7x24 array"""
+    if not epochs.size:
+        return np.zeros((7, 24), dtype=np.int64)
+    return analytics.weekday_hour_histogram(epochs, tz)
+
+
+@diagnostics.traced("archive.order_counts")
+def order_counts(conn, location_id, first_day, last_day, tz=None):
+    """Return archived order counts per local weekday and hour on local days first_day..last_day
+    as a 7x24 array, or None if no archived partition overlaps them"""
+    files = partition_files(conn, "orders_file", location_id, first_day, last_day)
+    if not files:
+        return None
+    tz = tz or database.business_timezone(conn)
+    
+    epochs = read_files(files, ["created_epoch"], first_day, last_day)["created_epoch"].to_numpy()
+    local = local_seconds(epochs, tz)
+    days = local // analytics.SECONDS_PER_DAY
+    local = local[(days >= first_day) & (days <= last_day)]
+    weekdays = (local // analytics.SECONDS_PER_DAY + analytics.EPOCH_WEEKDAY) % 7
+    hours = local % analytics.SECONDS_PER_DAY // analytics.SECONDS_PER_HOUR
+    return np.bincount(weekdays * 24 + hours, minlength=7 * 24).reshape(7, 24)
+
+
+@diagnostics.traced("archive.daily_consumption")
+def daily_consumption(conn, first_day, last_day, tz=None):
+    """Return archived (ingredient_ids, days, quantities) used on local days first_day..last_day
+    by ingredients that still exist"""
+    empty = np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+    files = partition_files(conn, "consumption_file", None, first_day, last_day)
+    if not files:
+        return empty
+    tz = tz or database.business_timezone(conn)
+    
+    table = read_files(files, ["created_epoch", "ingredient_id", "quantity"], first_day, last_day)
+    days = local_seconds(table["created_epoch"].to_numpy(), tz) // analytics.SECONDS_PER_DAY
+    ingredient_ids = table["ingredient_id"].to_numpy()
+    # Ingredient ids are never reused, so an id still in ingredients is the same ingredient
+    existing = np.array([row[0] for row in conn.execute("SELECT id FROM ingredients")], dtype=np.int64)
+    keep = (days >= first_day) & (days <= last_day) & np.isin(ingredient_ids, existing)
+    return ingredient_ids[keep], days[keep], table["quantity"].to_numpy()[keep]
+
+
+def oldest_day(conn, tz=None):
+    """Return the local day of the oldest archived order, or None"""
+    first_epoch = conn.execute("SELECT MIN(first_epoch) FROM archived_partitions").fetchone()[0]
+    if first_epoch is None:
+        return None
+    tz = tz or database.business_timezone(conn)
+    return int(local_seconds(np.array([first_epoch], dtype=np.int64), tz)[0] // analytics.SECONDS_PER_DAY)
+
+
+def recount(cursor, tz):
+    """Recount every location's archived orders per local weekday and hour in tz"""
+    cursor.execute("DELETE FROM archived_order_counts")
+    locations = [row[0] for row in cursor.execute("SELECT DISTINCT location_id FROM archived_partitions")]
+    for location_id in locations:
+        files = partition_files(cursor, "orders_file", location_id)
+        epochs = read_files(files, ["created_epoch"])["created_epoch"].to_numpy()
+        add_order_counts(cursor, location_id, weekday_hour_counts(epochs, tz))
+
+
+def add_order_counts(cursor, location_id, counts):
+    """Add a 7x24 array of counts (negative to remove) to a location's archived order counts"""
+    cursor.executemany(
+        '''INSERT INTO archived_order_counts (location_id, day_of_week, hour, order_count)
+           VALUES (?, ?, ?, ?)
+           ON CONFLICT (location_id, day_of_week, hour) DO UPDATE SET
+               order_count = order_count + excluded.order_count''',
+        [(location_id, int(day), int(hour), int(counts[day, hour]))
+         for day, hour in zip(*np.nonzero(counts))]
+    )
+
+
+@diagnostics.traced("archive.orders")
+def archive_orders(conn, horizon_days=ARCHIVE_HORIZON_DAYS, today=None):
+    """Move orders older than horizon_days, whole local months at a time, into the archive
+    
+    Returns (partitions written, orders archived). Partitions that already
+    exist are rewritten with their new orders; an order synced again after
+    it was archived replaces its archived copy.
+    """
+    tz = database.business_timezone(conn)
+    today = datetime.datetime.now(tz).date() if today is None else today
+    cutoff = (today - datetime.timedelta(days=horizon_days)).replace(day=1).isoformat()
+    
+    partitions = conn.execute(
+        '''SELECT location_id, substr(local_date, 1, 7) FROM orders WHERE local_date < ?
+           GROUP BY location_id, substr(local_date, 1, 7)''',
+        (cutoff,)
+    ).fetchall()
+    if not partitions:
+        return 0, 0
+    
+    pa = require_pyarrow()
+    archived = 0
+    for location_id, month in partitions:
+        archived += archive_partition(conn, pa, tz, location_id, month)
+    return len(partitions), archived
+
+
+def archive_partition(conn, pa, tz, location_id, month):
+    """Write one location's month of orders to new Parquet files and delete them from SQLite
+    
+    The catalog update and the deletes commit together, so an interrupted run
+    leaves every order in exactly one place; files of an uncommitted run are
+    never referenced. Returns the number of orders moved.
+    """
+    root = archive_root(conn)
+    first_date = datetime.date.fromisoformat(f"{month}-01")
+    next_month = (first_date + datetime.timedelta(days=32)).replace(day=1)
+    directory = os.path.join(f"location={urllib.parse.quote(location_id, safe='')}", f"month={month}")
+    stamp = time.time_ns()
+    orders_file = os.path.join(directory, f"orders-{stamp}.parquet")
+    consumption_file = os.path.join(directory, f"consumption-{stamp}.parquet")
+    
+    cursor = conn.cursor()
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS archive_orders (order_id TEXT PRIMARY KEY)")
+    try:
+        with conn:
+            cursor.execute(
+                '''INSERT INTO temp.archive_orders (order_id)
+                   SELECT order_id FROM orders WHERE location_id = ? AND local_date >= ? AND local_date < ?''',
+                (location_id, first_date.isoformat(), next_month.isoformat())
+            )
+            order_ids, epochs = zip(*cursor.execute(
+                f"SELECT order_id, created_epoch FROM orders WHERE order_id IN ({ARCHIVE_ORDER_IDS})"
+            ).fetchall())
+            consumption = cursor.execute(
+                f'''SELECT c.order_id, o.created_epoch, c.ingredient_id, c.quantity
+                    FROM order_consumption c JOIN orders o ON o.order_id = c.order_id
+                    WHERE c.order_id IN ({ARCHIVE_ORDER_IDS})'''
+            ).fetchall()
+            
+            orders = pa.table({
+                "order_id": pa.array(order_ids, pa.string()),
+                "created_epoch": pa.array(epochs, pa.int64())
+            })
+            consumption = pa.table({
+                "order_id": pa.array([row[0] for row in consumption], pa.string()),
+                "created_epoch": pa.array([row[1] for row in consumption], pa.int64()),
+                "ingredient_id": pa.array([row[2] for row in consumption], pa.int64()),
+                "quantity": pa.array([row[3] for row in consumption], pa.float64())
+            })
+            
+            # Merge with what this partition already holds, newer copies of an order winning
+            previous = cursor.execute(
+                "SELECT orders_file, consumption_file FROM archived_partitions WHERE location_id = ? AND month = ?",
+                (location_id, month)
+            ).fetchone()
+            previous_epochs = np.array([], dtype=np.int64)
+            if previous:
+                previous_orders = pa.parquet.read_table(os.path.join(root, previous[0]))
+                previous_consumption = pa.parquet.read_table(os.path.join(root, previous[1]))
+                previous_epochs = previous_orders["created_epoch"].to_numpy()
+                new_ids = orders["order_id"]
+                orders = pa.concat_tables([
+                    previous_orders.filter(pa.compute.invert(
+                        pa.compute.is_in(previous_orders["order_id"], value_set=new_ids))),
+                    orders
+                ])
+                consumption = pa.concat_tables([
+                    previous_consumption.filter(pa.compute.invert(
+                        pa.compute.is_in(previous_consumption["order_id"], value_set=new_ids))),
+                    consumption
+                ])
+            
+            # Sorted by time, so row group statistics skip most of a file for a date range
+            orders = orders.sort_by("created_epoch")
+            consumption = consumption.sort_by("created_epoch")
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+            pa.parquet.write_table(orders, os.path.join(root, orders_file))
+            pa.parquet.write_table(consumption, os.path.join(root, consumption_file))
+            
+            all_epochs = orders["created_epoch"].to_numpy()
+            cursor.execute(
+                '''INSERT INTO archived_partitions
+                   (location_id, month, orders_file, consumption_file, order_count, first_epoch, last_epoch, archived_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (location_id, month) DO UPDATE SET
+                       orders_file = excluded.orders_file,
+                       consumption_file = excluded.consumption_file,
+                       order_count = excluded.order_count,
+                       first_epoch = excluded.first_epoch,
+                       last_epoch = excluded.last_epoch,
+                       archived_at = excluded.archived_at''',
+                (location_id, month, orders_file, consumption_file, len(all_epochs),
+                 int(all_epochs.min()), int(all_epochs.max()), int(time.time()))
+            )
+            add_order_counts(cursor, location_id,
+                             weekday_hour_counts(all_epochs, tz) - weekday_hour_counts(previous_epochs, tz))
+            
+            # The rollup triggers take the deleted orders out of the live counts; the forecast
+            # triggers would queue their removal as corrections, but the sales only moved
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS archive_pending AS SELECT * FROM forecast_pending WHERE 0")
+            cursor.execute("INSERT INTO temp.archive_pending SELECT * FROM forecast_pending")
+            cursor.execute(f"DELETE FROM order_consumption WHERE order_id IN ({ARCHIVE_ORDER_IDS})")
+            cursor.execute("DELETE FROM forecast_pending")
+            cursor.execute("INSERT INTO forecast_pending SELECT * FROM temp.archive_pending")
+            cursor.execute("DELETE FROM temp.archive_pending")
+            cursor.execute(f"DELETE FROM order_line_item_modifiers WHERE order_id IN ({ARCHIVE_ORDER_IDS})")
+            cursor.execute(f"DELETE FROM order_line_items WHERE order_id IN ({ARCHIVE_ORDER_IDS})")
+            cursor.execute(f"DELETE FROM orders WHERE order_id IN ({ARCHIVE_ORDER_IDS})")
+            cursor.execute("DELETE FROM temp.archive_orders")
+    except BaseException:
+        remove_files(conn, (orders_file, consumption_file))
+        raise
+    
+    # The replaced files are no longer referenced once the catalog has committed
+    if previous:
+        remove_files(conn, previous)
+    return len(order_ids)
+
+
+def remove_files(conn, paths):
+    """Delete archive files (paths relative to the archive root) that still exist"""
+    root = archive_root(conn)
+    for path in paths:
+        if os.path.exists(os.path.join(root, path)):
+            os.remove(os.path.join(root, path))
+
+
+@diagnostics.traced("archive.drop_copies")
+def drop_archived_copies(cursor, order_ids_sql, written, replaced):
+    """Remove the archived copies of live orders (a subquery of order ids) synced again after archiving
+    
+    Call inside the transaction that wrote the orders, after their consumption
+    and stock changes were staged. Each copy leaves the archived counts, its
+    ingredients go back to stock through temp.stock_changes and it is taken
+    out of any fitted forecast, so the order counts once. The partitions it
+    was in are rewritten without it: written gets the new files (delete them
+    if the transaction rolls back) and replaced the old ones (delete them
+    once it commits). Returns the number of copies removed.
+    """
+    # Only partitions whose time range holds one of the orders can have a copy
+    partitions = cursor.execute(f'''
+        SELECT DISTINCT p.location_id, p.month, p.orders_file, p.consumption_file
+        FROM orders o
+        JOIN archived_partitions p
+          ON p.location_id = o.location_id AND o.created_epoch BETWEEN p.first_epoch AND p.last_epoch
+        WHERE o.order_id IN ({order_ids_sql})
+    ''').fetchall()
+    if not partitions:
+        return 0
+    
+    pa = require_pyarrow()
+    root = archive_root(cursor)
+    tz = database.business_timezone(cursor)
+    live_ids = pa.array([row[0] for row in cursor.execute(
+        f"SELECT order_id FROM orders WHERE order_id IN ({order_ids_sql})"
+    )], pa.string())
+    dropped_count = 0
+    for location_id, month, orders_file, consumption_file in partitions:
+        orders = pa.parquet.read_table(os.path.join(root, orders_file))
+        dropped = pa.compute.is_in(orders["order_id"], value_set=live_ids)
+        if not pa.compute.any(dropped).as_py():
+            continue
+        consumption = pa.parquet.read_table(os.path.join(root, consumption_file))
+        used = pa.compute.is_in(consumption["order_id"], value_set=live_ids)
+        dropped_epochs = orders.filter(dropped)["created_epoch"].to_numpy()
+        dropped_count += len(dropped_epochs)
+        add_order_counts(cursor, location_id, -weekday_hour_counts(dropped_epochs, tz))
+        
+        # Give back the stock the archived copy used, and take its sales out of fitted forecast days
+        use = consumption.filter(used)
+        use_epochs = use["created_epoch"].to_numpy()
+        use_days = local_seconds(use_epochs, tz) // analytics.SECONDS_PER_DAY
+        use_rows = list(zip(use["ingredient_id"].to_pylist(), use["quantity"].to_pylist(),
+                            use_epochs.tolist(), use_days.tolist()))
+        cursor.executemany(
+            '''INSERT INTO temp.stock_changes (ingredient_id, amount)
+               SELECT id, -? FROM ingredients WHERE id = ? AND ? > counted_at''',
+            [(quantity, ingredient_id, epoch) for ingredient_id, quantity, epoch, _ in use_rows]
+        )
+        cursor.executemany(
+            '''INSERT INTO forecast_pending (ingredient_id, day, quantity)
+               SELECT ?, ?, -? FROM forecast_state WHERE id = 1 AND ? <= fitted_through
+               ON CONFLICT (ingredient_id, day) DO UPDATE SET quantity = quantity + excluded.quantity''',
+            [(ingredient_id, day, quantity, day) for ingredient_id, quantity, _, day in use_rows]
+        )
+        
+        replaced.extend([orders_file, consumption_file])
+        orders = orders.filter(pa.compute.invert(dropped))
+        if not orders.num_rows:
+            cursor.execute("DELETE FROM archived_partitions WHERE location_id = ? AND month = ?", (location_id, month))
+            continue
+        stamp = time.time_ns()
+        directory = os.path.dirname(orders_file)
+        new_files = [os.path.join(directory, f"orders-{stamp}.parquet"),
+                     os.path.join(directory, f"consumption-{stamp}.parquet")]
+        written.extend(new_files)
+        pa.parquet.write_table(orders, os.path.join(root, new_files[0]))
+        pa.parquet.write_table(consumption.filter(pa.compute.invert(used)), os.path.join(root, new_files[1]))
+        epochs = orders["created_epoch"].to_numpy()
+        cursor.execute(
+            '''UPDATE archived_partitions
+               SET orders_file = ?, consumption_file = ?, order_count = ?, first_epoch = ?, last_epoch = ?
+               WHERE location_id = ? AND month = ?''',
+            (new_files[0], new_files[1], len(epochs), int(epochs.min()), int(epochs.max()), location_id, month)
+        )
+    return dropped_count
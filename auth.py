@@ -0,0 +1,108 @@
+"""Password hashing and login throttling for the admin panel
+
+Passwords are stored as salted scrypt hashes, "scrypt$n$r$p$salt$key"
+with the salt and key in hex. The cost parameters live in each hash, so
+raising SCRYPT_N later only rehashes a user's password the next time they
+log in. Keys are compared in constant time, and unknown users are checked
+against a dummy hash so a wrong username takes as long as a wrong password.
+
+LoginThrottle makes every failed attempt past FREE_ATTEMPTS double the
+wait before a username may try again, so guessing costs the guesser time
+while the check itself stays a dictionary lookup.
+"""
+import functools
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+# scrypt cost: about 50 ms and 16 MiB per check on a desktop
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+# Failed logins allowed per username before each attempt has to wait
+FREE_ATTEMPTS = 3
+
+# Wait after the first throttled failure, doubling with each one after it, and its ceiling
+LOCKOUT_BASE_S = 1
+LOCKOUT_MAX_S = 300
+
+
+def derive_key(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=2 * 128 * n * r * p, dklen=KEY_BYTES)
+
+
+def hash_password(password):
+    """Return a salted scrypt hash of a password at the current cost"""
+    salt = os.urandom(SALT_BYTES)
+    key = derive_key(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${key.hex()}"
+
+
+def is_hashed(stored):
+    return stored.startswith("scrypt$")
+
+
+def verify_password(password, stored):
+    """Return True if a password matches a stored hash"""
+    try:
+        _, n, r, p, salt, key = stored.split("$")
+        expected = bytes.fromhex(key)
+        actual = derive_key(password, bytes.fromhex(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+def needs_rehash(stored):
+    """Return True if a hash was made at a different cost than the current one"""
+    return not stored.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+@functools.lru_cache(maxsize=1)
+def dummy_hash():
+    """Hash checked for unknown usernames, made once on first use"""
+    return hash_password("")
+
+
+def check_unknown_user(password):
+    """Spend as long as a real check would for a username that doesn't exist; always False"""
+    verify_password(password, dummy_hash())
+    return False
+
+
+class LoginThrottle:
+    """Failed login counts per username, and how long each must wait before trying again"""
+    
+    def __init__(self, free_attempts=FREE_ATTEMPTS, base_s=LOCKOUT_BASE_S, max_s=LOCKOUT_MAX_S):
+        self.free_attempts = free_attempts
+        self.base_s = base_s
+        self.max_s = max_s
+        self.failures = {}
+        self.lock = threading.Lock()
+    
+    def retry_after(self, username):
+        """Seconds until the username may try again, 0 if it may now"""
+        with self.lock:
+            _, locked_until = self.failures.get(username.casefold(), (0, 0))
+        return max(0, locked_until - time.monotonic())
+    
+    def failed(self, username):
+        """Count a failed attempt and return the seconds the next one has to wait"""
+        with self.lock:
+            count, _ = self.failures.get(username.casefold(), (0, 0))
+            count += 1
+            wait = 0
+            if count >= self.free_attempts:
+                wait = min(self.base_s * 2 ** (count - self.free_attempts), self.max_s)
+            self.failures[username.casefold()] = (count, time.monotonic() + wait)
+        return wait
+    
+    def succeeded(self, username):
+        with self.lock:
+            self.failures.pop(username.casefold(), None)
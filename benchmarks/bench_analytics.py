@@ -0,0 +1,112 @@
+"""Benchmark the vectorized weekday/hour histogram against the per-order Python loop
+
+    python benchmarks/bench_analytics.py --orders 1000000
+"""
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+import pytz
+from dateutil import parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import analytics
+
+# Required speedup of the vectorized path over the Python loop
+MIN_SPEEDUP = 50
+
+
+def make_orders_db(num_orders, seed=42):
+    """Build an in-memory orders table with a year of random UTC timestamps"""
+    rng = np.random.default_rng(seed)
+    start = int(datetime.datetime(2024, 1, 1, tzinfo=pytz.UTC).timestamp())
+    epochs = np.sort(rng.integers(start, start + 365 * analytics.SECONDS_PER_DAY, num_orders))
+    
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, created_at TEXT NOT NULL, created_epoch INTEGER)")
+    conn.executemany(
+        "INSERT INTO orders (created_at, created_epoch) VALUES (?, ?)",
+        ((datetime.datetime.fromtimestamp(int(epoch), pytz.UTC).isoformat(), int(epoch)) for epoch in epochs)
+    )
+    conn.commit()
+    return conn
+
+
+def load_created_at(conn):
+    """Load order timestamps as a datetime64[s] array with a single query"""
+    rows = conn.execute("SELECT created_epoch FROM orders").fetchall()
+    return np.array(rows, dtype=np.int64).reshape(-1).astype("datetime64[s]")
+
+
+def legacy_histogram(created_at_values, local_tz):
+    """Per-order loop equivalent to the old group_orders_by_weekday + update_analytics_chart"""
+    orders = [{"created_at": created_at} for created_at in created_at_values]
+    
+    # Group by weekday, parsing every timestamp
+    weekday_orders = {i: [] for i in range(7)}
+    for order in orders:
+        weekday_orders[parser.isoparse(order["created_at"]).astimezone(local_tz).weekday()].append(order)
+    
+    # Count per hour, parsing every timestamp again
+    counts = np.zeros((7, 24), dtype=np.int64)
+    for day, day_orders in weekday_orders.items():
+        hour_counts = defaultdict(int)
+        for order in day_orders:
+            hour_counts[parser.isoparse(order["created_at"]).astimezone(local_tz).hour] += 1
+        for hour, count in hour_counts.items():
+            counts[day, hour] = count
+    return counts
+
+
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--orders", type=int, default=1_000_000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+    
+    local_tz = pytz.timezone('US/Pacific')
+    print(f"Building {args.orders} orders...")
+    conn = make_orders_db(args.orders)
+    
+    # Aggregation only: both sides start from timestamps already loaded from SQLite
+    created_at_values = [created_at for (created_at,) in conn.execute("SELECT created_at FROM orders")]
+    timestamps = load_created_at(conn)
+    vectorized_time, vectorized = best_time(
+        lambda: analytics.weekday_hour_histogram(timestamps, local_tz), args.repeat
+    )
+    legacy_time, legacy = best_time(lambda: legacy_histogram(created_at_values, local_tz), 1)
+    
+    # End to end, including the query
+    load_time, _ = best_time(lambda: load_created_at(conn), args.repeat)
+    raw_load_time, _ = best_time(lambda: conn.execute("SELECT created_at FROM orders").fetchall(), args.repeat)
+    
+    if not np.array_equal(legacy, vectorized):
+        print("FAIL: vectorized histogram differs from the per-order loop")
+        return 1
+    
+    speedup = legacy_time / vectorized_time
+    print(f"per-order loop:      {legacy_time:.3f}s")
+    print(f"vectorized:          {vectorized_time:.3f}s")
+    print(f"speedup:             {speedup:.1f}x (required {MIN_SPEEDUP}x)")
+    print(f"end to end (loop):   {raw_load_time + legacy_time:.3f}s")
+    print(f"end to end (vector): {load_time + vectorized_time:.3f}s")
+    return 0 if speedup >= MIN_SPEEDUP else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
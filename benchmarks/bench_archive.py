@@ -0,0 +1,108 @@
+"""Benchmark long-range analytics and forecasting before and after archiving cold orders
+
+    python benchmarks/bench_archive.py --orders 1000000 --days 1460 --horizon-days 365
+
+Builds a synthetic history, times the same queries on the all-SQLite
+database and on a copy whose older months were moved to the Parquet
+archive, checks they give the same answers, and compares the file sizes.
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import archive
+import database
+import forecasting
+import synthetic_orders
+from bench_suite import timed
+
+END_DATE = datetime.date.fromisoformat(synthetic_orders.END_DATE)
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run_queries(path, rounds, days):
+    """Time the long-range queries on one database; returns ({name: seconds}, {name: result})"""
+    db = database.Database(path)
+    conn = db.connection()
+    today = forecasting.day_number(END_DATE.isoformat()) + 1
+    ranges = {
+        "counts (all time)": (None, None),
+        "counts (full history range)": (END_DATE - datetime.timedelta(days=days - 1), END_DATE),
+        "counts (one old month)": (END_DATE - datetime.timedelta(days=days - 1),
+                                   END_DATE - datetime.timedelta(days=days - 31))
+    }
+    times = {}
+    results = {}
+    try:
+        for name, (first_day, last_day) in ranges.items():
+            query = lambda: sorted(db.order_counts_by_weekday_hour(None, first_day, last_day))
+            times[name] = timed(query, rounds)
+            results[name] = query()
+        
+        times["forecast refit"] = timed(lambda: forecasting.update_forecasts(conn, today=today), rounds,
+                                        setup=lambda: forecasting.reset_forecasts(conn))
+        results["forecast refit"] = conn.execute(
+            "SELECT ingredient_id, ROUND(intercept, 6), ROUND(slope, 6) FROM ingredient_forecasts ORDER BY 1"
+        ).fetchall()
+    finally:
+        db.close()
+    return times, results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--orders", type=int, default=300_000)
+    arg_parser.add_argument("--days", type=int, default=1095)
+    arg_parser.add_argument("--horizon-days", type=int, default=archive.ARCHIVE_HORIZON_DAYS)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--rounds", type=int, default=5)
+    args = arg_parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    try:
+        hot_path = os.path.join(workdir, "hot.db")
+        cold_path = os.path.join(workdir, "cold.db")
+        print(f"Building {args.orders} orders over {args.days} days...")
+        synthetic_orders.build_database(hot_path, args.orders, args.seed, days=args.days)
+        shutil.copy(hot_path, cold_path)
+        
+        db = database.Database(cold_path)
+        try:
+            conn = db.connection()
+            partitions, archived = archive.archive_orders(conn, args.horizon_days,
+                                                          today=END_DATE + datetime.timedelta(days=1))
+            conn.execute("VACUUM")
+            archive_dir = archive.archive_root(conn)
+        finally:
+            db.close()
+        print(f"Archived {archived} orders into {partitions} partitions")
+        
+        hot_times, hot_results = run_queries(hot_path, args.rounds, args.days)
+        cold_times, cold_results = run_queries(cold_path, args.rounds, args.days)
+    finally:
+        sizes = (os.path.getsize(hot_path), os.path.getsize(cold_path), directory_size(archive_dir))
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    print(f"  {'':<32} {'SQLite only':>12} {'archived':>12}")
+    for name in hot_times:
+        print(f"  {name:<32} {hot_times[name] * 1000:9.1f} ms {cold_times[name] * 1000:9.1f} ms")
+    print(f"  {'database size':<32} {sizes[0] / 1e6:9.1f} MB {sizes[1] / 1e6:9.1f} MB "
+          f"(+ {sizes[2] / 1e6:.1f} MB of Parquet)")
+    
+    mismatched = [name for name in hot_results if hot_results[name] != cold_results[name]]
+    if mismatched:
+        print(f"error: archived results differ for {', '.join(mismatched)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Benchmark switching the Analytics chart between days
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_chart.py
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PyQt5.QtWidgets import QApplication
+
+# Target for switching to a previously shown day
+MAX_SWITCH_MS = 50
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--rounds", type=int, default=10)
+    args = arg_parser.parse_args()
+    
+    app = QApplication(sys.argv)
+    from charts import OrderAnalyticsFigure, WEEKDAY_NAMES
+    
+    figure = OrderAnalyticsFigure(width=10, height=6)
+    figure.resize(1000, 600)
+    figure.show()
+    figure.set_theme("dark")
+    
+    # Counts as large as a multi-year, multi-register history would give
+    rng = random.Random(42)
+    weekday_counts = {day: [rng.randint(0, 50000) for _ in range(24)] for day in WEEKDAY_NAMES}
+    views = [None] + WEEKDAY_NAMES
+    
+    def show(view):
+        if view is None:
+            figure.show_all_days(weekday_counts)
+        else:
+            figure.show_day(view, weekday_counts[view])
+        app.processEvents()
+    
+    # The first time each view is shown it is fully drawn
+    first_times = []
+    for view in views:
+        start = time.perf_counter()
+        show(view)
+        first_times.append(time.perf_counter() - start)
+    
+    # Afterwards switching only updates the artists and blits
+    switch_times = []
+    for _ in range(args.rounds):
+        for view in views:
+            start = time.perf_counter()
+            show(view)
+            switch_times.append(time.perf_counter() - start)
+    
+    switch_ms = median(switch_times) * 1000
+    print(f"first draw of a view: {median(first_times) * 1000:.1f} ms (median)")
+    print(f"switch between views: {switch_ms:.1f} ms (median, target {MAX_SWITCH_MS} ms)")
+    return 0 if switch_ms < MAX_SWITCH_MS else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Benchmark reconstructing stock at past instants from a years-long inventory ledger
+
+    python benchmarks/bench_ledger.py --days 1095 --events-per-day 100
+
+Fills the ledger of the synthetic ingredients with sales and deliveries,
+snapshotting it once a day as the compaction job would, then times
+ledger.stock_at() against summing every event up to the instant, before
+and after compacting, and checks they agree.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import database
+import ledger
+import synthetic_orders
+from bench_suite import timed
+
+SECONDS_PER_DAY = ledger.SECONDS_PER_DAY
+
+# Every this many days an ingredient gets a delivery
+RESTOCK_EVERY_DAYS = 7
+
+
+def fill_ledger(conn, ingredient_ids, first_at, days, events_per_day, seed):
+    """Write days of sales and weekly deliveries, snapshotting after each day"""
+    rng = random.Random(seed)
+    
+    # The ingredients were just created; move that to before the history starts
+    with conn:
+        conn.execute("UPDATE inventory_items SET created_at = ?", (first_at - 1,))
+        conn.execute("UPDATE inventory_events SET at = ?", (first_at - 1,))
+    for day in range(days):
+        start = first_at + day * SECONDS_PER_DAY
+        events = []
+        for ingredient_id in ingredient_ids:
+            for at in sorted(rng.randrange(start, start + SECONDS_PER_DAY) for _ in range(events_per_day)):
+                events.append((ingredient_id, at, "sale", -rng.randint(1, 3)))
+            if day % RESTOCK_EVERY_DAYS == 0:
+                events.append((ingredient_id, start + SECONDS_PER_DAY - 1, "restock", 2 * events_per_day * RESTOCK_EVERY_DAYS))
+        events.sort(key=lambda event: event[1])
+        with conn:
+            conn.executemany("INSERT INTO inventory_events (ingredient_id, at, kind, delta) VALUES (?, ?, ?, ?)", events)
+            totals = {}
+            for ingredient_id, _, _, delta in events:
+                totals[ingredient_id] = totals.get(ingredient_id, 0) + delta
+            conn.executemany("UPDATE ingredients SET quantity = quantity + ? WHERE id = ?",
+                             [(delta, ingredient_id) for ingredient_id, delta in totals.items()])
+            ledger.take_snapshots(conn.cursor())
+
+
+def full_scan(conn, location_id, at):
+    """Stock at an instant by summing every event up to it, the way a ledger without snapshots would"""
+    return conn.execute(
+        '''SELECT i.ingredient_id, i.name, COALESCE(SUM(e.delta), 0)
+           FROM inventory_items i LEFT JOIN inventory_events e ON e.ingredient_id = i.ingredient_id AND e.at <= ?
+           WHERE i.location_id = ? GROUP BY i.ingredient_id ORDER BY i.name''',
+        (at, location_id)
+    ).fetchall()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--days", type=int, default=1095)
+    arg_parser.add_argument("--events-per-day", type=int, default=100, help="sales per ingredient per day")
+    arg_parser.add_argument("--keep-days", type=int, default=ledger.LEDGER_RETENTION_DAYS)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--rounds", type=int, default=5)
+    args = arg_parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    try:
+        db = database.Database(os.path.join(workdir, "ledger.db"))
+        synthetic_orders.prepare_database(db)
+        conn = db.connection()
+        location_id = database.DEFAULT_LOCATION_ID
+        ingredient_ids = [ingredient.id for ingredient in db.list_ingredients(location_id)]
+        
+        now = int(time.time())
+        first_at = now - args.days * SECONDS_PER_DAY
+        start = time.perf_counter()
+        fill_ledger(conn, ingredient_ids, first_at, args.days, args.events_per_day, args.seed)
+        events = conn.execute("SELECT COUNT(*) FROM inventory_events").fetchone()[0]
+        print(f"Wrote {events:,} events for {len(ingredient_ids)} ingredients over {args.days} days "
+              f"in {time.perf_counter() - start:.1f}s")
+        
+        # Instants across the whole history, and one inside the retained window
+        instants = {
+            "oldest month": first_at + 30 * SECONDS_PER_DAY + 12345,
+            "middle": first_at + args.days // 2 * SECONDS_PER_DAY + 12345,
+            "last week": now - 7 * SECONDS_PER_DAY + 12345,
+        }
+        expected = {name: full_scan(conn, location_id, at) for name, at in instants.items()}
+        
+        print(f"  {'stock at':<14} {'full scan':>12} {'snapshots':>12} {'compacted':>12}")
+        results = {}
+        for name, at in instants.items():
+            results[name] = [timed(lambda: full_scan(conn, location_id, at), args.rounds),
+                             timed(lambda: ledger.stock_at(conn, location_id, at), args.rounds)]
+        mismatched = [name for name, at in instants.items() if ledger.stock_at(conn, location_id, at) != expected[name]]
+        
+        start = time.perf_counter()
+        snapshots, removed = ledger.compact(conn, args.keep_days, now=now)
+        compact_s = time.perf_counter() - start
+        for name, at in instants.items():
+            results[name].append(timed(lambda: ledger.stock_at(conn, location_id, at), args.rounds))
+            print(f"  {name:<14} " + " ".join(f"{seconds * 1000:9.2f} ms" for seconds in results[name]))
+        print(f"Compacting removed {removed:,} events in {compact_s:.1f}s")
+        
+        # Compaction keeps every instant inside the retention exact
+        if ledger.stock_at(conn, location_id, instants["last week"]) != expected["last week"]:
+            mismatched.append("last week (compacted)")
+        if ledger.check(conn):
+            mismatched.append("current quantities")
+        db.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    if mismatched:
+        print(f"MISMATCH: {', '.join(mismatched)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
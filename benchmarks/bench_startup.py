@@ -0,0 +1,103 @@
+"""Benchmark admin panel cold start: module import time and time to the login window
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_startup.py
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Target from launching the interpreter to the login window being painted
+MAX_STARTUP_S = 1.0
+
+# Child process: start the app and report once the login window has been shown
+LAUNCH_APP = f"""
+import sys
+sys.path.insert(0, {os.path.abspath(ROOT)!r})
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
+import app
+qt_app = QApplication(sys.argv)
+qt_app.setStyle('Fusion')
+window = app.KPlateAdminApp()
+window.show()
+QTimer.singleShot(0, qt_app.quit)
+qt_app.exec_()
+print("login window shown", flush=True)
+window.db.close()
+"""
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def import_times(workdir):
+    """Return (module, cumulative microseconds) for `import app`, slowest first"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {os.path.abspath(ROOT)!r}); import app"],
+        cwd=workdir, capture_output=True, text=True, check=True
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        times.append((module.strip(), int(cumulative)))
+    return sorted(times, key=lambda item: item[1], reverse=True)
+
+
+def time_to_login(workdir):
+    """Seconds from launching a fresh interpreter until the login window is shown"""
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", LAUNCH_APP], cwd=workdir,
+                            capture_output=True, text=True, check=True).stdout
+    elapsed = time.perf_counter() - start
+    if "login window shown" not in output:
+        raise RuntimeError("the app exited before showing the login window")
+    return elapsed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--rounds", type=int, default=5)
+    arg_parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    args = arg_parser.parse_args()
+
+    # Run against a copy of the database so the benchmark never changes kplate.db
+    workdir = tempfile.mkdtemp()
+    try:
+        if os.path.exists(os.path.join(ROOT, "kplate.db")):
+            shutil.copy(os.path.join(ROOT, "kplate.db"), workdir)
+
+        # The first launch may create or migrate the schema; only time the ones after it
+        time_to_login(workdir)
+
+        times = import_times(workdir)
+        app_us = dict(times).get("app", 0)
+        print(f"import app: {app_us / 1000:.1f} ms cumulative")
+        for module, cumulative in times[1:args.top + 1]:
+            print(f"  {module:<40} {cumulative / 1000:8.1f} ms")
+
+        startup = median([time_to_login(workdir) for _ in range(args.rounds)])
+        print(f"time to login window: {startup * 1000:.0f} ms (median, target {MAX_STARTUP_S * 1000:.0f} ms)")
+
+        loaded = subprocess.run(
+            [sys.executable, "-c", f"import sys; sys.path.insert(0, {os.path.abspath(ROOT)!r}); import app; "
+             "print(' '.join(m for m in ('matplotlib', 'numpy', 'dateutil') if m in sys.modules))"],
+            cwd=workdir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        print(f"heavy modules loaded at startup: {loaded or 'none'}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return 0 if startup < MAX_STARTUP_S else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
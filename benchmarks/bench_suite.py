@@ -0,0 +1,229 @@
+"""Benchmark the main data paths against a synthetic order history
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_suite.py --orders 100000
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_suite.py --orders 1000000 --locations 5
+    python benchmarks/bench_suite.py --orders 1000000 --save baseline.json
+    python benchmarks/bench_suite.py --orders 1000000 --compare baseline.json
+
+Times the Square import, the analytics load and grouping behind
+fetch_order_data, the chart update, load_ingredients, forecasting and the
+low-stock alerts, on a scratch database built by synthetic_orders. The
+cache of derived results is cleared before each round, except for the
+repeat view that measures a cache hit. With --compare, any benchmark more
+than REGRESSION_TOLERANCE slower than the saved run fails.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import alerts
+import cache
+import database
+import forecasting
+import square_import
+import synthetic_orders
+
+# Allowed slowdown against a saved baseline before a benchmark counts as a regression
+REGRESSION_TOLERANCE = 0.2
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def timed(fn, rounds, setup=None):
+    """Return the median seconds of fn() over several rounds, calling setup() untimed before each"""
+    times = []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return median(times)
+
+
+def bench_import(workdir, num_orders, seed, num_locations):
+    """Import a synthetic Square export into an empty database; returns (seconds, orders imported)"""
+    db = database.Database(os.path.join(workdir, "import.db"))
+    try:
+        locations = synthetic_orders.prepare_database(db, num_locations)
+        export = io.StringIO()
+        synthetic_orders.write_export(
+            export, synthetic_orders.generate_orders(num_orders, seed, locations=locations)
+        )
+        source = io.BytesIO(export.getvalue().encode())
+        
+        start = time.perf_counter()
+        writer, _ = square_import.import_orders(db.connection(), [source])
+        return time.perf_counter() - start, writer.imported
+    finally:
+        db.close()
+
+
+def bench_forecasting(db, rounds, today):
+    """Time a full refit and a one-day incremental update of the forecasts"""
+    conn = db.connection()
+    results = {}
+    
+    def reset():
+        forecasting.reset_forecasts(conn)
+        cache.results.clear()
+    results["forecast refit"] = timed(lambda: forecasting.update_forecasts(conn, today=today), rounds, setup=reset)
+    
+    def fit_all_but_last_day():
+        reset()
+        forecasting.update_forecasts(conn, today=today - 1)
+    results["forecast one new day"] = timed(
+        lambda: forecasting.update_forecasts(conn, today=today), rounds, setup=fit_all_but_last_day
+    )
+    results["project inventory"] = timed(
+        lambda: forecasting.project_inventory(conn, db.list_ingredients(), today=today), rounds,
+        setup=cache.results.clear
+    )
+    return results
+
+
+def bench_ui(workdir, rounds, last_date):
+    """Time the admin panel's analytics, chart and inventory loads against workdir/kplate.db"""
+    from PyQt5.QtWidgets import QApplication
+    
+    qt_app = QApplication.instance() or QApplication(sys.argv)
+    import app
+    
+    # The admin panel opens kplate.db in the working directory
+    os.chdir(workdir)
+    window = app.KPlateAdminApp()
+    window.show()
+    window.username_input.setText("admin")
+    window.password_input.setText("password")
+    window.login()
+    
+    # The password is checked in the background; let it finish before loading
+    window.jobs.pool.waitForDone()
+    qt_app.processEvents()
+    window.tab_widget.setCurrentIndex(window.tab_widget.count() - 1)
+    window.jobs.pool.waitForDone()
+    qt_app.processEvents()
+    
+    no_cancel = lambda: None
+    month = (last_date - datetime.timedelta(days=29), last_date)
+    results = {}
+    try:
+        results["fetch_order_data (all time)"] = timed(lambda: window.load_order_data(no_cancel), rounds,
+                                                       setup=cache.results.clear)
+        results["fetch_order_data (last 30 days)"] = timed(lambda: window.load_order_data(no_cancel, month), rounds,
+                                                           setup=cache.results.clear)
+        results["fetch_order_data (one store, last 30 days)"] = timed(
+            lambda: window.load_order_data(no_cancel, month, database.DEFAULT_LOCATION_ID), rounds,
+            setup=cache.results.clear
+        )
+        results["fetch_order_data (repeat view, cached)"] = timed(lambda: window.load_order_data(no_cancel, month),
+                                                                  rounds)
+        
+        # Redraw every chart view, as a user paging through the weekdays would
+        window.weekday_orders = window.load_order_data(no_cancel)
+        
+        def show_every_view():
+            for index in range(window.weekday_combo.count()):
+                window.weekday_combo.setCurrentIndex(index)
+                window.update_analytics_chart()
+                qt_app.processEvents()
+        show_every_view()
+        results["chart update (per view)"] = timed(show_every_view, rounds) / window.weekday_combo.count()
+        
+        def load_ingredients():
+            window.inventory_model.set_ingredients(*window.load_projections(no_cancel))
+        results["load_ingredients"] = timed(load_ingredients, rounds)
+    finally:
+        window.jobs.pool.waitForDone()
+        window.db.close()
+    return results
+
+
+def compare(results, baseline):
+    """Print each result against the baseline; returns the names that regressed"""
+    regressions = []
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        change = seconds / before - 1
+        flag = ""
+        if change > REGRESSION_TOLERANCE:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"  {name:<42} {before * 1000:10.1f} ms -> {seconds * 1000:10.1f} ms ({change:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--orders", type=int, default=100_000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--locations", type=int, default=1, help="stores sharing the orders")
+    arg_parser.add_argument("--rounds", type=int, default=5)
+    arg_parser.add_argument("--no-ui", action="store_true", help="skip the benchmarks that need PyQt5 and matplotlib")
+    arg_parser.add_argument("--save", help="write the results to a JSON baseline")
+    arg_parser.add_argument("--compare", help="fail on regressions against a JSON baseline")
+    args = arg_parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        results = {}
+        print(f"Importing {args.orders} synthetic orders...")
+        seconds, imported = bench_import(workdir, args.orders, args.seed, args.locations)
+        results["import"] = seconds
+        print(f"  import: {seconds:.2f}s ({imported / seconds:,.0f} orders/s)")
+        
+        # Everything else reads the same history, built once
+        db_path = os.path.join(workdir, "kplate.db")
+        shutil.copy(os.path.join(workdir, "import.db"), db_path)
+        last_day = forecasting.day_number(synthetic_orders.END_DATE)
+        db = database.Database(db_path)
+        try:
+            results.update(bench_forecasting(db, args.rounds, last_day + 1))
+            results["low-stock alerts"] = timed(
+                lambda: alerts.evaluate(db.connection(), database.DEFAULT_LOCATION_ID), args.rounds,
+                setup=cache.results.clear
+            )
+        finally:
+            db.close()
+        
+        if not args.no_ui:
+            results.update(bench_ui(workdir, args.rounds, forecasting.EPOCH_DATE + datetime.timedelta(days=last_day)))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    print(f"Results for {args.orders} orders (median of {args.rounds}):")
+    for name, seconds in results.items():
+        print(f"  {name:<42} {seconds * 1000:10.1f} ms")
+    
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"orders": args.orders, "locations": args.locations, "seed": args.seed, "results": results},
+                      f, indent=2)
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("orders") != args.orders:
+            print(f"warning: baseline was run with {baseline.get('orders')} orders")
+        print("Against the baseline:")
+        if compare(results, baseline["results"]):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Benchmark the Square sync of several locations against the local stub server
+
+    python benchmarks/bench_sync.py --orders 20000 --locations 4 --latency-ms 50
+    python benchmarks/bench_sync.py --throttle-rate 0.2 --error-rate 0.05
+
+Serves synthetic orders from square_stub with simulated network latency
+and optional 429 and 503 answers, then syncs every location into a scratch
+database one at a time and again with a worker pool. Both runs must end up
+with the same orders.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import database
+import square_stub
+import square_sync
+import synthetic_orders
+
+
+def run_sync(workdir, name, base_url, locations, workers, rps):
+    """Sync every location into a new database; returns (seconds, orders stored, client)"""
+    db = database.Database(os.path.join(workdir, name))
+    try:
+        synthetic_orders.prepare_database(db, 1)
+        client = square_sync.SquareClient("", base_url, requests_per_second=rps)
+        start = time.perf_counter()
+        square_sync.sync_locations(db.connection(), client, locations, workers)
+        return time.perf_counter() - start, db.count_orders(), client
+    finally:
+        db.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--orders", type=int, default=20_000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--locations", type=int, default=4)
+    arg_parser.add_argument("--workers", type=int, default=square_sync.SYNC_WORKERS)
+    arg_parser.add_argument("--rps", type=float, default=0, help="request budget per second (default: unlimited)")
+    arg_parser.add_argument("--latency-ms", type=float, default=50)
+    arg_parser.add_argument("--throttle-rate", type=float, default=0.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    args = arg_parser.parse_args()
+    
+    locations = synthetic_orders.location_ids(args.locations)
+    orders = list(synthetic_orders.generate_orders(args.orders, args.seed, locations=locations))
+    server = square_stub.make_server(orders, throttle_rate=args.throttle_rate, error_rate=args.error_rate,
+                                     latency_s=args.latency_ms / 1000, seed=args.seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    
+    workdir = tempfile.mkdtemp()
+    try:
+        results = {}
+        for name, workers in (("serial", 1), ("parallel", args.workers)):
+            connections = server.connections_opened
+            seconds, stored, client = run_sync(workdir, f"{name}.db", base_url, locations, workers, args.rps)
+            results[name] = stored
+            print(f"  {name:<9} {workers} workers: {seconds:6.2f}s, {stored} orders, "
+                  f"{client.requests} requests ({client.retries} retried), "
+                  f"{server.connections_opened - connections} connections")
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    print(f"Stub answered {server.requests_served} pages, {server.requests_throttled} 429s, "
+          f"{server.requests_failed} 503s")
+    if results["serial"] != results["parallel"]:
+        print("error: the serial and parallel syncs stored different orders")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
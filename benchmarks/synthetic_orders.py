@@ -0,0 +1,227 @@
+"""Seeded synthetic Square order history for benchmarks and hardware sizing
+
+    python benchmarks/synthetic_orders.py --orders 1000000 -o /tmp/kplate_1m.db
+    python benchmarks/synthetic_orders.py --orders 1000000 --locations 5 -o /tmp/kplate_5_stores.db
+    python benchmarks/synthetic_orders.py --orders 10000 --export /tmp/orders_10k.json
+
+The same seed, size and end date always give the same orders. They go
+through the real importer into a scratch database (never kplate.db), so
+the result looks exactly like a store that has been syncing from Square.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import analytics
+import database
+import forecasting
+import sample_data
+import square_import
+
+# Last local day of the generated history (days after it have no orders)
+END_DATE = "2025-01-01"
+
+# Menu: (item name, variation name, price in cents, relative popularity).
+# Item names match the starter inventory so every order uses ingredients.
+MENU = [
+    ("K-Plate", "Regular", 1495, 30),
+    ("Spicy Chicken Plate", "Regular", 1395, 14),
+    ("Spicy Pork Plate", "Regular", 1395, 8),
+    ("Short Plate", "Regular", 1695, 5),
+    ("Soy Chicken Plate", "Regular", 1395, 4),
+    ("Beef Dumplings", "6 Pieces", 795, 9),
+    ("Kimchi Dumplings", "6 Pieces", 795, 4),
+    ("Fries", "Regular", 495, 10),
+    ("6 Wings", "Regular", 995, 6),
+    ("12 Wings", "Regular", 1795, 3),
+    ("18 Wings", "Regular", 2495, 1),
+    ("Mixed Veggie Plate", "Regular", 1295, 3)
+]
+
+# Optional add-ons: (modifier name, price in cents)
+MODIFIERS = [("Extra Rice", 200), ("Fried Egg", 150), ("Extra Sauce", 50)]
+
+# Share of line items with an add-on
+MODIFIER_RATE = 0.15
+
+# Relative orders per local hour: lunch and dinner peaks, closed overnight
+HOUR_WEIGHTS = np.array([0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 6, 10, 9, 5, 2, 3, 6, 10, 9, 6, 3, 1, 0], dtype=float)
+
+# Saturdays and Sundays are busier than weekdays
+WEEKEND_WEIGHT = 5 / 3
+
+# Order states: mostly completed, a few still open or canceled (the importer skips those)
+STATES = ["COMPLETED", "OPEN", "CANCELED"]
+STATE_WEIGHTS = [0.97, 0.02, 0.01]
+
+# Orders per day of history when --days is not given
+ORDERS_PER_DAY = 300
+
+
+def order_epochs(rng, num_orders, first_day, num_days, tz):
+    """Draw sorted UTC epochs for orders spread over the business's local opening hours"""
+    day_numbers = np.arange(first_day, first_day + num_days)
+    day_weights = np.where((day_numbers + analytics.EPOCH_WEEKDAY) % 7 >= 5, WEEKEND_WEIGHT, 1.0)
+    days = rng.choice(day_numbers, size=num_orders, p=day_weights / day_weights.sum())
+    hours = rng.choice(24, size=num_orders, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    seconds = rng.integers(0, analytics.SECONDS_PER_HOUR, num_orders)
+    local = days * analytics.SECONDS_PER_DAY + hours * analytics.SECONDS_PER_HOUR + seconds
+    
+    # Local wall clock to UTC; exact except inside a DST change, when the store is closed
+    transitions, offsets = analytics.timezone_transitions(
+        local.min() - analytics.SECONDS_PER_DAY, local.max() + analytics.SECONDS_PER_DAY, tz
+    )
+    return np.sort(local - offsets[np.searchsorted(transitions, local, side="right") - 1])
+
+
+def location_ids(num_locations):
+    """Return the ids of the synthetic stores; the first is the default location"""
+    return [database.DEFAULT_LOCATION_ID] + [f"SYN-LOC-{n}" for n in range(2, num_locations + 1)]
+
+
+def generate_orders(num_orders, seed=0, end_date=END_DATE, days=None, tz=None, locations=None):
+    """Yield num_orders Square-shaped order dicts, oldest first
+    
+    Orders cover `days` local days up to end_date (by default enough days for
+    ORDERS_PER_DAY orders a day) and are spread evenly over the given
+    location ids. All random draws are made up front with NumPy, so
+    generation stays cheap next to the import it feeds.
+    """
+    import pytz
+    
+    tz = tz or pytz.timezone(database.DEFAULT_TIMEZONE)
+    rng = np.random.default_rng(seed)
+    days = days or max(1, -(-num_orders // ORDERS_PER_DAY))
+    last_day = forecasting.day_number(end_date)
+    
+    epochs = order_epochs(rng, num_orders, last_day - days + 1, days, tz)
+    created_at = epochs.astype("datetime64[s]").astype(str).tolist()
+    states = rng.choice(len(STATES), size=num_orders, p=STATE_WEIGHTS).tolist()
+    
+    # One to four line items per order, each with a quantity of one or two
+    line_counts = rng.choice([1, 2, 3, 4], size=num_orders, p=[0.45, 0.3, 0.15, 0.1]).tolist()
+    num_lines = sum(line_counts)
+    popularity = np.array([item[3] for item in MENU], dtype=float)
+    items = rng.choice(len(MENU), size=num_lines, p=popularity / popularity.sum()).tolist()
+    quantities = rng.choice([1, 2], size=num_lines, p=[0.85, 0.15]).tolist()
+    modifiers = np.where(rng.random(num_lines) < MODIFIER_RATE,
+                         rng.integers(0, len(MODIFIERS), num_lines), -1).tolist()
+    locations = locations or location_ids(1)
+    order_locations = rng.integers(0, len(locations), num_orders).tolist()
+    
+    line = 0
+    for i in range(num_orders):
+        order_id = f"SYN{seed}-{i:09d}"
+        line_items = []
+        for uid in range(line_counts[i]):
+            name, variation_name, price, _ = MENU[items[line]]
+            quantity = quantities[line]
+            line_item = {
+                "uid": f"{order_id}-{uid}",
+                "catalog_object_id": f"SYN-ITEM-{items[line]}",
+                "name": name,
+                "variation_name": variation_name,
+                "quantity": str(quantity),
+                "base_price_money": {"amount": price, "currency": "USD"},
+                "total_money": {"amount": price * quantity, "currency": "USD"}
+            }
+            if modifiers[line] >= 0:
+                modifier_name, modifier_price = MODIFIERS[modifiers[line]]
+                line_item["modifiers"] = [{
+                    "uid": f"{order_id}-{uid}-m",
+                    "catalog_object_id": f"SYN-MOD-{modifiers[line]}",
+                    "name": modifier_name,
+                    "quantity": "1",
+                    "total_price_money": {"amount": modifier_price * quantity, "currency": "USD"}
+                }]
+            line_items.append(line_item)
+            line += 1
+        
+        yield {
+            "id": order_id,
+            "location_id": locations[order_locations[i]],
+            "state": STATES[states[i]],
+            "created_at": created_at[i] + "Z",
+            "line_items": line_items,
+            "total_money": {"amount": sum(item["total_money"]["amount"] for item in line_items), "currency": "USD"}
+        }
+
+
+def write_export(fp, orders):
+    """Write orders as one Square export document without holding them all in memory"""
+    fp.write('{"orders": [')
+    for i, order in enumerate(orders):
+        if i:
+            fp.write(",\n")
+        fp.write(json.dumps(order))
+    fp.write("]}\n")
+
+
+def prepare_database(db, num_locations=1):
+    """Initialize an empty database with num_locations stores; returns their ids"""
+    # Every store starts with the same menu and starter inventory
+    sample_data.initialize(db, sample_orders=False)
+    locations = location_ids(num_locations)
+    for n, location_id in enumerate(locations[1:], start=2):
+        db.add_location(location_id, f"Synthetic Store {n}")
+        db.add_ingredients(sample_data.INITIAL_INGREDIENTS, location_id)
+    return locations
+
+
+def build_database(path, num_orders, seed=0, end_date=END_DATE, days=None, num_locations=1,
+                   batch_size=square_import.BATCH_SIZE):
+    """Create a seeded database at path holding num_orders synthetic orders; returns the import writer"""
+    db = database.Database(path)
+    try:
+        locations = prepare_database(db, num_locations)
+        conn = db.connection()
+        writer = square_import.OrderWriter(conn, batch_size)
+        for order in generate_orders(num_orders, seed, end_date, days, db.business_timezone(), locations):
+            writer.add(order)
+        writer.flush()
+    finally:
+        db.close()
+    return writer
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--orders", type=int, default=100_000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--end-date", default=END_DATE, help="last local day of the history (YYYY-MM-DD)")
+    arg_parser.add_argument("--days", type=int, help=f"days of history (default: {ORDERS_PER_DAY} orders a day)")
+    arg_parser.add_argument("--locations", type=int, default=1, help="number of stores sharing the orders")
+    arg_parser.add_argument("-o", "--output", help="scratch SQLite database to create")
+    arg_parser.add_argument("--export", help="write a Square export JSON file instead")
+    arg_parser.add_argument("--overwrite", action="store_true", help="replace the output if it exists")
+    args = arg_parser.parse_args()
+    
+    target = args.export or args.output
+    if not target:
+        arg_parser.error("give --output or --export")
+    if os.path.exists(target):
+        if not args.overwrite:
+            arg_parser.error(f"{target} exists; pass --overwrite to replace it")
+        os.remove(target)
+    
+    start = time.perf_counter()
+    if args.export:
+        with open(args.export, "w") as f:
+            write_export(f, generate_orders(args.orders, args.seed, args.end_date, args.days,
+                                            locations=location_ids(args.locations)))
+        print(f"Wrote {args.orders} orders to {args.export} in {time.perf_counter() - start:.1f}s")
+    else:
+        writer = build_database(args.output, args.orders, args.seed, args.end_date, args.days, args.locations)
+        print(f"Imported {writer.imported} orders ({writer.skipped} skipped) into {args.output} "
+              f"in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Memoized derived results, keyed by their parameters and the data versions they were computed from
+
+    counts = cache.memoize(conn, "order_counts", (location_id, first_day, last_day),
+                           [("orders", location_id)], compute)
+
+Triggers on orders, archived_order_counts, ingredients, order_consumption
+and the forecast tables bump a counter in data_versions for the scope
+(and store) each write touches. A result is cached under its parameters
+plus the current versions of the scopes it was computed from, so a write
+only misses the entries that depend on what it changed. Superseded
+entries are never looked up again and age out of the LRU.
+
+Cached values are shared between callers and threads; treat them as
+read-only.
+"""
+import threading
+from collections import OrderedDict
+
+# Results kept before the least recently used ones are dropped
+CACHE_SIZE = 128
+
+
+class LRUCache:
+    """Thread-safe mapping that drops the least recently used entries past maxsize"""
+    
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        """Return (True, value) for a cached key, else (False, None)"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key]
+    
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Process-wide cache used by memoize()
+results = LRUCache()
+
+
+def data_version(conn, scopes):
+    """Return the database's identity and the versions of (scope, location_id) pairs in one query
+    
+    A location of None sums every store's versions. The file path and the
+    random database_id keep apart copies of a database and one recreated
+    at the same path.
+    """
+    version_sql = "(SELECT COALESCE(SUM(version), 0) FROM data_versions WHERE scope = ? AND location_id = COALESCE(?, location_id))"
+    return conn.execute(
+        "SELECT (SELECT file FROM pragma_database_list WHERE name = 'main'), "
+        "(SELECT value FROM settings WHERE key = 'database_id')" + "".join(", " + version_sql for _ in scopes),
+        [value for scope in scopes for value in scope]
+    ).fetchone()
+
+
+def memoize(conn, name, params, scopes, compute):
+    """Return compute()'s result for these parameters, reusing it until a scope it read from changes
+    
+    Store-wide scopes (consumption, forecasts) use the location "". Inside
+    a transaction nothing is cached, since a rollback would hand the
+    versions it bumped to different data.
+    """
+    if conn.in_transaction:
+        return compute()
+    key = (name, params, data_version(conn, scopes))
+    found, value = results.get(key)
+    if found:
+        return value
+    value = compute()
+    results.put(key, value)
+    return value
@@ -0,0 +1,157 @@
+"""Matplotlib chart of hourly order counts for the Analytics tab
+
+Importing this module loads matplotlib and the Qt5Agg backend, so the admin
+panel only imports it when the Analytics tab is first shown.
+"""
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+import diagnostics
+from database import WEEKDAY_NAMES
+
+# Chart colors for each theme
+CHART_THEMES = {
+    "light": {"bar": 'skyblue', "text": '#333333', "grid": '#E0E0E0', "background": 'white'},
+    "dark": {"bar": '#2979FF', "text": '#FFFFFF', "grid": '#333333', "background": '#201c1c'}
+}
+
+class OrderAnalyticsFigure(FigureCanvas):
+    """A matplotlib figure embedded in Qt that builds its charts once and then only updates them"""
+    def __init__(self, parent=None, width=10, height=6, dpi=100):
+        fig = Figure(figsize=(width, height), dpi=dpi)
+        super(OrderAnalyticsFigure, self).__init__(fig)
+        
+        hours = list(range(24))
+        
+        # 3x3 grid of small charts for the All Days view (7 days + 2 empty)
+        self.day_axes = []
+        self.day_bars = []
+        self.day_empty_labels = []
+        for i, day in enumerate(WEEKDAY_NAMES):
+            ax = fig.add_subplot(3, 3, i+1)
+            self.day_axes.append(ax)
+            self.day_bars.append(ax.bar(hours, [0] * 24))
+            self.day_empty_labels.append(ax.text(0.5, 0.5, "No data", ha='center', va='center',
+                                                 transform=ax.transAxes))
+            ax.set_title(day)
+            ax.set_xlabel("Hour")
+            ax.set_ylabel("Orders")
+            ax.set_xticks([0, 6, 12, 18, 23])
+        
+        # Single large chart for one selected day
+        self.axes = fig.add_subplot(111)
+        self.bars = self.axes.bar(hours, [0] * 24)
+        self.empty_label = self.axes.text(0.5, 0.5, "No data available for this day",
+                                          ha='center', va='center', fontsize=12,
+                                          transform=self.axes.transAxes)
+        self.axes.set_title("Order Frequency by Hour")
+        self.axes.set_xlabel("Hour of Day (Local Time)")
+        self.axes.set_ylabel("Number of Orders")
+        self.axes.set_xticks(hours)
+        
+        self.theme = None
+        self.layouts = {}
+        self.show_all_days_layout(True)
+        
+        # Rendered images of recently shown views, restored with a blit
+        self.rendered_views = {}
+        self.current_view = None
+        self.mpl_connect('draw_event', self.remember_view)
+    
+    def show_all_days_layout(self, all_days):
+        """Show either the 7-day grid or the single-day chart"""
+        for ax in self.day_axes:
+            ax.set_visible(all_days)
+        self.axes.set_visible(not all_days)
+        
+        # Work out each layout once and reuse it until the widget is resized
+        if all_days not in self.layouts:
+            self.figure.tight_layout()
+            self.layouts[all_days] = [ax.get_position() for ax in self.figure.axes]
+        for ax, position in zip(self.figure.axes, self.layouts[all_days]):
+            ax.set_position(position)
+    
+    def resizeEvent(self, event):
+        super(OrderAnalyticsFigure, self).resizeEvent(event)
+        
+        # Text sizes are fixed in points, so redo the layouts at the new size
+        if hasattr(self, 'layouts'):
+            self.layouts = {}
+            self.rendered_views = {}
+            self.show_all_days_layout(not self.axes.get_visible())
+    
+    def set_theme(self, theme_mode):
+        """Recolor the existing artists for a theme"""
+        if theme_mode == self.theme:
+            return
+        self.theme = theme_mode
+        colors = CHART_THEMES[theme_mode]
+        
+        self.figure.patch.set_facecolor(colors["background"])
+        for ax, bars, empty_label in zip(self.day_axes + [self.axes],
+                                         self.day_bars + [self.bars],
+                                         self.day_empty_labels + [self.empty_label]):
+            ax.set_facecolor(colors["background"])
+            ax.title.set_color(colors["text"])
+            ax.xaxis.label.set_color(colors["text"])
+            ax.yaxis.label.set_color(colors["text"])
+            ax.tick_params(colors=colors["text"])
+            ax.grid(axis='y', linestyle='--', alpha=0.7, color=colors["grid"])
+            empty_label.set_color(colors["text"])
+            for bar in bars:
+                bar.set_color(colors["bar"])
+    
+    def set_counts(self, ax, bars, empty_label, counts):
+        """Update bar heights, the y range and the empty-state label of one chart"""
+        for bar, count in zip(bars, counts):
+            bar.set_height(count)
+        has_data = sum(counts) > 0
+        
+        # Only show bars and grid if we have data
+        ax.set_ylim(0, max(counts) * 1.05 if has_data else 1)
+        ax.yaxis.grid(has_data)
+        for bar in bars:
+            bar.set_visible(has_data)
+        empty_label.set_visible(not has_data)
+    
+    def show_all_days(self, weekday_counts):
+        """Show hourly counts for every weekday in the grid"""
+        day_counts = [tuple(weekday_counts.get(day, [0] * 24)) for day in WEEKDAY_NAMES]
+        
+        self.show_all_days_layout(True)
+        for ax, bars, empty_label, counts in zip(self.day_axes, self.day_bars,
+                                                 self.day_empty_labels, day_counts):
+            self.set_counts(ax, bars, empty_label, counts)
+        self.redraw((self.theme, "All Days", tuple(day_counts)))
+    
+    def show_day(self, day, counts):
+        """Show hourly counts for a single weekday"""
+        self.show_all_days_layout(False)
+        self.axes.set_title(f"Order Frequency by Hour on {day}")
+        self.set_counts(self.axes, self.bars, self.empty_label, counts)
+        self.redraw((self.theme, day, tuple(counts)))
+    
+    @diagnostics.traced("chart.draw")
+    def draw(self):
+        """Render the whole figure (the slow path that blitting avoids)"""
+        super(OrderAnalyticsFigure, self).draw()
+    
+    def redraw(self, view):
+        """Blit the view if it was drawn before, otherwise schedule a full draw"""
+        self.current_view = view
+        region = self.rendered_views.get(view)
+        if region is None:
+            self.draw_idle()
+        else:
+            self.restore_region(region)
+            self.blit(self.figure.bbox)
+    
+    def remember_view(self, event):
+        """Keep the image of each fully drawn view so switching back to it is a blit"""
+        if self.current_view is None:
+            return
+        self.rendered_views[self.current_view] = self.copy_from_bbox(self.figure.bbox)
+        
+        # Only keep the most recent views (the 8 day selections in both themes)
+        while len(self.rendered_views) > 16:
+            del self.rendered_views[next(iter(self.rendered_views))]
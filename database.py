@@ -0,0 +1,1240 @@
+"""SQLite connection layer and schema shared by the admin panel and the headless importers"""
+import sqlite3
+import threading
+from collections import namedtuple
+
+import auth
+import cache
+import diagnostics
+
+# Prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 256
+
+# Page cache per connection, in KiB (negative values are KiB for SQLite)
+CACHE_SIZE_KIB = 16 * 1024
+
+# Current time as epoch seconds, used to stamp stock counts
+NOW_SQL = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+# A sold item (alias s) matches a mapping (alias m) by catalog id, else by name and variation
+MAPPING_MATCH = '''(
+    m.catalog_object_id = s.catalog_object_id
+    OR (m.catalog_object_id IS NULL AND m.item_name = s.name
+        AND (m.variation_name IS NULL OR m.variation_name = s.variation_name))
+)'''
+
+# Local day of an orders row as days since 1970-01-01, the day numbers the forecasts use
+ORDER_DAY_SQL = "CAST(julianday(local_date) - julianday('1970-01-01') AS INTEGER)"
+
+# Business timezone used for orders' local date, weekday and hour until one is configured
+DEFAULT_TIMEZONE = "US/Pacific"
+
+# Store that orders and ingredients belong to when no Square location is given
+DEFAULT_LOCATION_ID = "default"
+DEFAULT_LOCATION_NAME = "Main Store"
+
+# Names of the orders.day_of_week values (0 = Monday)
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+Ingredient = namedtuple("Ingredient", ["id", "name", "quantity", "expected_restock"])
+
+
+class Database:
+    """Long-lived SQLite connections to kplate.db, one per thread
+    
+    Connections are opened lazily the first time a thread asks for one and
+    then reused, so their prepared statement cache stays warm. They are
+    keyed by thread id rather than kept in a threading.local, which PyQt
+    clears after every job on a QThreadPool thread; the number open is
+    bounded by the threads that use the database. WAL mode lets
+    the analytics readers keep working while a sync is writing. Every query
+    method is timed as a "db.*" diagnostics span.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.connections = {}
+        self.lock = threading.Lock()
+    
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        thread_id = threading.get_ident()
+        conn = self.connections.get(thread_id)
+        if conn is None:
+            conn = sqlite3.connect(self.path, cached_statements=STATEMENT_CACHE_SIZE,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            with self.lock:
+                self.connections[thread_id] = conn
+        return conn
+    
+    def close(self):
+        """Close every connection opened through this database"""
+        with self.lock:
+            for conn in self.connections.values():
+                conn.close()
+            self.connections = {}
+    
+    @diagnostics.traced("db.create_tables")
+    def create_tables(self):
+        """Create the schema or upgrade it to the latest version"""
+        conn = self.connection()
+        with conn:
+            create_tables(conn.cursor())
+    
+    def business_timezone(self):
+        return business_timezone(self.connection())
+    
+    @diagnostics.traced("db.set_business_timezone")
+    def set_business_timezone(self, name):
+        """Switch the business timezone, recomputing every order's local time"""
+        conn = self.connection()
+        with conn:
+            set_business_timezone(conn.cursor(), name)
+    
+    # Users
+    
+    def verify_user(self, username, password):
+        """Return True if the username and password match a user
+        
+        Deliberately slow; call it off the GUI thread. A hash made at an older
+        cost is upgraded on a successful login. Timed without its arguments,
+        which would put the password in the slow log.
+        """
+        with diagnostics.span("db.verify_user"):
+            conn = self.connection()
+            row = conn.execute("SELECT id, password FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return auth.check_unknown_user(password)
+            user_id, stored = row
+            if not auth.verify_password(password, stored):
+                return False
+            if auth.needs_rehash(stored):
+                with conn:
+                    conn.execute("UPDATE users SET password = ? WHERE id = ?", (auth.hash_password(password), user_id))
+            return True
+    
+    def user_exists(self, username):
+        row = self.connection().execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None
+    
+    def add_user(self, username, password):
+        conn = self.connection()
+        with conn:
+            conn.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                         (username, auth.hash_password(password)))
+    
+    # Locations
+    
+    @diagnostics.traced("db.list_locations")
+    def list_locations(self):
+        """Return (id, name) rows for every store location, ordered by name"""
+        return self.connection().execute("SELECT id, name FROM locations ORDER BY name").fetchall()
+    
+    @diagnostics.traced("db.add_location")
+    def add_location(self, location_id, name):
+        """Add a store location, or rename it if it exists"""
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO locations (id, name) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET name = excluded.name",
+                (location_id, name)
+            )
+    
+    @diagnostics.traced("db.adopt_location")
+    def adopt_location(self, old_id, new_id):
+        """Move a store's ingredients, orders and counts to another location id"""
+        conn = self.connection()
+        with conn:
+            adopt_location(conn.cursor(), old_id, new_id)
+    
+    def main_location_id(self):
+        return main_location_id(self.connection())
+    
+    # Ingredients
+    
+    @diagnostics.traced("db.list_ingredients")
+    def list_ingredients(self, location_id=DEFAULT_LOCATION_ID):
+        """Return a location's ingredients ordered by name"""
+        rows = self.connection().execute(
+            "SELECT id, name, quantity, expected_restock FROM ingredients WHERE location_id = ? ORDER BY name",
+            (location_id,)
+        ).fetchall()
+        return [Ingredient(*row) for row in rows]
+    
+    @diagnostics.traced("db.get_ingredient")
+    def get_ingredient(self, ingredient_id):
+        """Return the ingredient with the given id, or None"""
+        row = self.connection().execute(
+            "SELECT id, name, quantity, expected_restock FROM ingredients WHERE id = ?", (ingredient_id,)
+        ).fetchone()
+        return Ingredient(*row) if row else None
+    
+    @diagnostics.traced("db.find_ingredient")
+    def find_ingredient(self, name, location_id=DEFAULT_LOCATION_ID):
+        """Return a location's ingredient with the given name, or None"""
+        row = self.connection().execute(
+            "SELECT id, name, quantity, expected_restock FROM ingredients WHERE location_id = ? AND name = ?",
+            (location_id, name)
+        ).fetchone()
+        return Ingredient(*row) if row else None
+    
+    @diagnostics.traced("db.add_ingredient")
+    def add_ingredient(self, name, quantity, expected_restock, location_id=DEFAULT_LOCATION_ID):
+        """Insert an ingredient at a location and return its id"""
+        conn = self.connection()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO ingredients (location_id, name, quantity, expected_restock) VALUES (?, ?, ?, ?)",
+                (location_id, name, quantity, expected_restock)
+            )
+        return cursor.lastrowid
+    
+    @diagnostics.traced("db.add_ingredients")
+    def add_ingredients(self, ingredients, location_id=DEFAULT_LOCATION_ID):
+        """Insert (name, quantity, expected_restock) rows at a location in one transaction"""
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO ingredients (location_id, name, quantity, expected_restock) VALUES (?, ?, ?, ?)",
+                ((location_id,) + tuple(ingredient) for ingredient in ingredients)
+            )
+    
+    @diagnostics.traced("db.set_quantity")
+    def set_quantity(self, ingredient_id, quantity):
+        """Record a stock count; only orders placed after it are deducted from now on"""
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                f"INSERT INTO inventory_events (ingredient_id, at, kind, delta) "
+                f"SELECT id, {NOW_SQL}, 'adjustment', ? - quantity FROM ingredients WHERE id = ?",
+                (quantity, ingredient_id)
+            )
+            conn.execute(
+                f"UPDATE ingredients SET quantity = ?, counted_at = {NOW_SQL} WHERE id = ?",
+                (quantity, ingredient_id)
+            )
+    
+    @diagnostics.traced("db.receive_stock")
+    def receive_stock(self, ingredient_id, amount):
+        """Add a delivery to an ingredient's stock"""
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                f"INSERT INTO inventory_events (ingredient_id, at, kind, delta) "
+                f"SELECT id, {NOW_SQL}, 'restock', ? FROM ingredients WHERE id = ?",
+                (amount, ingredient_id)
+            )
+            conn.execute("UPDATE ingredients SET quantity = quantity + ? WHERE id = ?", (amount, ingredient_id))
+    
+    @diagnostics.traced("db.set_expected_restock")
+    def set_expected_restock(self, ingredient_id, expected_restock):
+        conn = self.connection()
+        with conn:
+            conn.execute("UPDATE ingredients SET expected_restock = ? WHERE id = ?",
+                         (expected_restock, ingredient_id))
+    
+    @diagnostics.traced("db.update_ingredients")
+    def update_ingredients(self, location_id, added=(), quantities=(), expected_restocks=()):
+        """Apply a bulk edit in one transaction
+        
+        added holds (name, quantity, expected_restock) rows, quantities
+        (quantity, ingredient_id) stock counts recorded like set_quantity, and
+        expected_restocks (expected_restock, ingredient_id) rows.
+        """
+        quantities = list(quantities)
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO ingredients (location_id, name, quantity, expected_restock) VALUES (?, ?, ?, ?)",
+                ((location_id,) + tuple(row) for row in added)
+            )
+            conn.executemany(
+                f"INSERT INTO inventory_events (ingredient_id, at, kind, delta) "
+                f"SELECT id, {NOW_SQL}, 'adjustment', ? - quantity FROM ingredients WHERE id = ?",
+                quantities
+            )
+            conn.executemany(f"UPDATE ingredients SET quantity = ?, counted_at = {NOW_SQL} WHERE id = ?", quantities)
+            conn.executemany("UPDATE ingredients SET expected_restock = ? WHERE id = ?", expected_restocks)
+    
+    @diagnostics.traced("db.delete_ingredient")
+    def delete_ingredient(self, ingredient_id):
+        conn = self.connection()
+        with conn:
+            conn.execute("DELETE FROM item_mappings WHERE ingredient_id = ?", (ingredient_id,))
+            conn.execute("DELETE FROM order_consumption WHERE ingredient_id = ?", (ingredient_id,))
+            conn.execute("DELETE FROM ingredient_forecasts WHERE ingredient_id = ?", (ingredient_id,))
+            conn.execute("DELETE FROM forecast_pending WHERE ingredient_id = ?", (ingredient_id,))
+            conn.execute("DELETE FROM ingredients WHERE id = ?", (ingredient_id,))
+    
+    # Item mappings
+    
+    @diagnostics.traced("db.list_item_mappings")
+    def list_item_mappings(self):
+        """Return (id, catalog_object_id, item_name, variation_name, ingredient_id, units) rows"""
+        return self.connection().execute(
+            '''SELECT id, catalog_object_id, item_name, variation_name, ingredient_id, units
+               FROM item_mappings ORDER BY item_name, variation_name'''
+        ).fetchall()
+    
+    @diagnostics.traced("db.add_item_mapping")
+    def add_item_mapping(self, ingredient_id, catalog_object_id=None, item_name=None,
+                         variation_name=None, units=1):
+        """Map a catalog object, or an item name and optional variation, to an ingredient
+        
+        Each unit sold (line item or modifier) uses ``units`` of the ingredient.
+        """
+        conn = self.connection()
+        with conn:
+            cursor = conn.execute(
+                '''INSERT INTO item_mappings (catalog_object_id, item_name, variation_name, ingredient_id, units)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (catalog_object_id, item_name, variation_name, ingredient_id, units)
+            )
+        return cursor.lastrowid
+    
+    @diagnostics.traced("db.delete_item_mapping")
+    def delete_item_mapping(self, mapping_id):
+        conn = self.connection()
+        with conn:
+            conn.execute("DELETE FROM item_mappings WHERE id = ?", (mapping_id,))
+    
+    # Orders
+    
+    @diagnostics.traced("db.count_orders")
+    def count_orders(self, location_id=None):
+        """Count the orders of one location, or of all of them, archived ones included"""
+        conn = self.connection()
+        return cache.memoize(conn, "count_orders", location_id, [("orders", location_id)],
+                             lambda: count_orders(conn, location_id))
+    
+    @diagnostics.traced("db.order_counts_by_weekday_hour")
+    def order_counts_by_weekday_hour(self, location_id=None, first_day=None, last_day=None):
+        """Return (day_of_week, hour, order_count) rows for one location (or all of them),
+        for orders on local days first_day..last_day if given, cached until its orders change"""
+        conn = self.connection()
+        days = (str(first_day), str(last_day)) if first_day is not None else None
+        return cache.memoize(conn, "order_counts_by_weekday_hour", (location_id, days), [("orders", location_id)],
+                             lambda: order_counts_by_weekday_hour(conn, location_id, first_day, last_day))
+    
+    @diagnostics.traced("db.add_orders")
+    def add_orders(self, orders, location_id=DEFAULT_LOCATION_ID):
+        """Insert (order_id, created_at, created_epoch, local_date, day_of_week, hour) rows for a location
+        in one transaction"""
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                '''INSERT INTO orders (location_id, order_id, created_at, created_epoch, local_date, day_of_week, hour)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                ((location_id,) + tuple(order) for order in orders)
+            )
+
+
+def create_tables(cursor):
+    """Bring the schema up to date by running the migrations it hasn't had yet
+    
+    PRAGMA user_version holds the number of migrations applied. Each one runs
+    in its own savepoint together with the version bump, so an interrupted
+    upgrade never leaves a half-migrated database.
+    """
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if version > len(MIGRATIONS):
+        raise RuntimeError(f"Database schema version {version} is newer than this version of K-Plate")
+    
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor.execute("SAVEPOINT migration")
+        try:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+        except Exception:
+            cursor.execute("ROLLBACK TO migration")
+            cursor.execute("RELEASE migration")
+            raise
+        cursor.execute("RELEASE migration")
+
+
+def create_base_schema(cursor):
+    """Migration 1: create the tables, upgrading databases from before schema versioning"""
+    # Create users table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL
+    )
+    ''')
+    
+    # Create ingredients table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ingredients (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        expected_restock INTEGER DEFAULT 0,
+        counted_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+    )
+    ''')
+    
+    # Databases from before automatic deductions: treat current stock as just counted
+    cursor.execute("SELECT 1 FROM pragma_table_info('ingredients') WHERE name = 'counted_at'")
+    if not cursor.fetchone():
+        cursor.execute("ALTER TABLE ingredients ADD COLUMN counted_at INTEGER")
+        cursor.execute(f"UPDATE ingredients SET counted_at = {NOW_SQL}")
+    
+    # Create orders table for analytics
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY,
+        order_id TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        day_of_week INTEGER NOT NULL,
+        hour INTEGER NOT NULL
+    )
+    ''')
+    
+    # Create line items table for imported Square orders
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS order_line_items (
+        id INTEGER PRIMARY KEY,
+        order_id TEXT NOT NULL,
+        uid TEXT,
+        catalog_object_id TEXT,
+        name TEXT,
+        variation_name TEXT,
+        quantity REAL NOT NULL,
+        total_money INTEGER
+    )
+    ''')
+    
+    # Modifiers of imported line items (extra rice, sauces, sides)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS order_line_item_modifiers (
+        id INTEGER PRIMARY KEY,
+        order_id TEXT NOT NULL,
+        line_item_uid TEXT,
+        catalog_object_id TEXT,
+        name TEXT,
+        quantity REAL NOT NULL
+    )
+    ''')
+    
+    # Line items and their modifiers as one list of sold items; modifier quantities are per unit
+    cursor.execute('''
+    CREATE VIEW IF NOT EXISTS sold_items AS
+    SELECT order_id, catalog_object_id, name, variation_name, quantity
+    FROM order_line_items
+    UNION ALL
+    SELECT m.order_id, m.catalog_object_id, m.name, NULL, li.quantity * m.quantity
+    FROM order_line_item_modifiers m
+    JOIN order_line_items li ON li.order_id = m.order_id AND li.uid = m.line_item_uid
+    ''')
+    
+    # Which ingredient, and how much of it, each catalog item or item name uses
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS item_mappings (
+        id INTEGER PRIMARY KEY,
+        catalog_object_id TEXT,
+        item_name TEXT,
+        variation_name TEXT,
+        ingredient_id INTEGER NOT NULL,
+        units REAL NOT NULL DEFAULT 1
+    )
+    ''')
+    
+    # Ingredients used by each stored order, so updates and cancellations can be reversed
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='order_consumption'")
+    consumption_exists = cursor.fetchone()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS order_consumption (
+        order_id TEXT NOT NULL,
+        ingredient_id INTEGER NOT NULL,
+        quantity REAL NOT NULL,
+        PRIMARY KEY (order_id, ingredient_id)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Sync progress per Square location: resume cursor and updated_at high-water mark
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sync_state (
+        location_id TEXT PRIMARY KEY,
+        cursor TEXT,
+        query_start TEXT,
+        high_water_mark TEXT
+    )
+    ''')
+    
+    # Per-item sales forecasts: sufficient statistics and fitted line per item
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS item_forecasts (
+        item_name TEXT PRIMARY KEY,
+        n REAL NOT NULL,
+        sum_t REAL NOT NULL,
+        sum_y REAL NOT NULL,
+        sum_tt REAL NOT NULL,
+        sum_ty REAL NOT NULL,
+        first_day INTEGER NOT NULL,
+        intercept REAL NOT NULL,
+        slope REAL NOT NULL
+    )
+    ''')
+    
+    # Day numbering origin and last local day folded into the forecasts
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS forecast_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        origin_day INTEGER,
+        fitted_through INTEGER
+    )
+    ''')
+    
+    # Record what earlier imports used; stock counts already include those orders.
+    # This is the single-store mapping of the time, kept here as it was so that
+    # later changes to map_items_by_name and record_consumption can't break it.
+    if not consumption_exists:
+        for ingredient_name in ("s.variation_name", "s.name"):
+            cursor.execute(f'''
+            INSERT INTO item_mappings (catalog_object_id, item_name, variation_name, ingredient_id)
+            SELECT s.catalog_object_id, MAX(s.name), MAX(s.variation_name), i.id
+            FROM sold_items s
+            JOIN ingredients i ON i.name = {ingredient_name} COLLATE NOCASE
+            WHERE NOT EXISTS (SELECT 1 FROM item_mappings m WHERE {MAPPING_MATCH})
+            GROUP BY s.catalog_object_id,
+                     CASE WHEN s.catalog_object_id IS NULL THEN s.name END,
+                     CASE WHEN s.catalog_object_id IS NULL THEN s.variation_name END,
+                     i.id
+            ''')
+        cursor.execute(f'''
+        INSERT INTO order_consumption (order_id, ingredient_id, quantity)
+        SELECT s.order_id, m.ingredient_id, SUM(s.quantity * m.units)
+        FROM sold_items s
+        JOIN item_mappings m ON {MAPPING_MATCH}
+        GROUP BY s.order_id, m.ingredient_id
+        ''')
+        cursor.execute("DELETE FROM item_forecasts")
+        cursor.execute("DELETE FROM forecast_state")
+    
+    # Create the hourly order count rollup used by the analytics tab
+    create_order_rollup(cursor)
+    
+    # Square order ids must be unique so imports and syncs can upsert
+    create_order_indexes(cursor)
+
+
+def add_lookup_indexes(cursor):
+    """Migration 2: index the columns used for date ranges and lookups; make ingredient names unique"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_weekday_hour ON orders (day_of_week, hour)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_mappings_catalog_object_id ON item_mappings (catalog_object_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_mappings_item_name ON item_mappings (item_name)")
+    
+    # Keep duplicate ingredient names apart by suffixing their id rather than losing stock
+    cursor.execute('''
+    UPDATE ingredients SET name = name || ' (' || id || ')'
+    WHERE id NOT IN (SELECT MIN(id) FROM ingredients GROUP BY name)
+    ''')
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_ingredients_name ON ingredients (name)")
+
+
+def add_local_time_columns(cursor):
+    """Migration 3: store each order's UTC epoch and business-local date next to created_at"""
+    import analytics
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    ''')
+    
+    cursor.execute("ALTER TABLE orders ADD COLUMN created_epoch INTEGER")
+    cursor.execute("ALTER TABLE orders ADD COLUMN local_date TEXT")
+    cursor.execute(f"UPDATE orders SET created_epoch = {analytics.EPOCH_SQL}")
+    refresh_local_time(cursor, business_timezone(cursor))
+    
+    # Date ranges are now local days; the covering index answers them on its own
+    cursor.execute("DROP INDEX IF EXISTS idx_orders_created_at")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_local_date ON orders (local_date, day_of_week, hour)")
+
+
+def add_locations(cursor):
+    """Migration 4: give orders, ingredients, the rollup and the forecasts a store location"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS locations (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO locations (id, name) VALUES (?, ?)",
+                   (DEFAULT_LOCATION_ID, DEFAULT_LOCATION_NAME))
+    
+    # Everything recorded so far belongs to the one store there was
+    cursor.execute(f"ALTER TABLE orders ADD COLUMN location_id TEXT NOT NULL DEFAULT '{DEFAULT_LOCATION_ID}'")
+    cursor.execute(f"ALTER TABLE ingredients ADD COLUMN location_id TEXT NOT NULL DEFAULT '{DEFAULT_LOCATION_ID}'")
+    
+    # Each store's queries only read its own slice of the indexes
+    cursor.execute("DROP INDEX IF EXISTS idx_ingredients_name")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_ingredients_location_name ON ingredients (location_id, name)")
+    cursor.execute("DROP INDEX IF EXISTS idx_orders_local_date")
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_orders_location_date
+    ON orders (location_id, local_date, day_of_week, hour)
+    ''')
+    
+    # Replace the single-store rollup with one counted per location
+    for trigger in ("orders_rollup_insert", "orders_rollup_delete", "orders_rollup_update"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS order_counts_by_weekday_hour")
+    create_location_rollup(cursor)
+    
+    # Forecast each ingredient rather than each name, since names repeat across stores
+    cursor.execute("DROP TABLE IF EXISTS item_forecasts")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ingredient_forecasts (
+        ingredient_id INTEGER PRIMARY KEY,
+        n REAL NOT NULL,
+        sum_t REAL NOT NULL,
+        sum_y REAL NOT NULL,
+        sum_tt REAL NOT NULL,
+        sum_ty REAL NOT NULL,
+        first_day INTEGER NOT NULL,
+        intercept REAL NOT NULL,
+        slope REAL NOT NULL
+    )
+    ''')
+    cursor.execute("DELETE FROM forecast_state")
+
+
+def add_order_archive(cursor):
+    """Migration 5: catalog of the Parquet partitions holding archived orders, and their counts"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archived_partitions (
+        location_id TEXT NOT NULL,
+        month TEXT NOT NULL,
+        orders_file TEXT NOT NULL,
+        consumption_file TEXT NOT NULL,
+        order_count INTEGER NOT NULL,
+        first_epoch INTEGER NOT NULL,
+        last_epoch INTEGER NOT NULL,
+        archived_at INTEGER NOT NULL,
+        PRIMARY KEY (location_id, month)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Archived orders per local weekday and hour, added to the live rollup for all-time counts
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archived_order_counts (
+        location_id TEXT NOT NULL,
+        day_of_week INTEGER NOT NULL,
+        hour INTEGER NOT NULL,
+        order_count INTEGER NOT NULL,
+        PRIMARY KEY (location_id, day_of_week, hour)
+    ) WITHOUT ROWID
+    ''')
+
+
+def add_inventory_ledger(cursor):
+    """Migration 6: append-only ledger of stock changes, its snapshots, and the ingredients it has seen"""
+    # Every ingredient the ledger has seen, kept after it is deleted; a reused id gets a new row
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS inventory_items (
+        ingredient_id INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        location_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        deleted_at INTEGER,
+        PRIMARY KEY (ingredient_id, created_at)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_items_location ON inventory_items (location_id)")
+    
+    # One row per stock change; ids give the order of changes within the same second
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS inventory_events (
+        id INTEGER PRIMARY KEY,
+        ingredient_id INTEGER NOT NULL,
+        at INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        delta REAL NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_events_ingredient_at ON inventory_events (ingredient_id, at, delta)")
+    
+    # An ingredient's quantity after every event up to last_event_id, the last of which happened at `at`
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS inventory_snapshots (
+        ingredient_id INTEGER NOT NULL,
+        last_event_id INTEGER NOT NULL,
+        at INTEGER NOT NULL,
+        quantity REAL NOT NULL,
+        PRIMARY KEY (ingredient_id, last_event_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_snapshots_ingredient_at ON inventory_snapshots (ingredient_id, at)")
+    
+    # Creating and deleting an ingredient are logged however it happens; quantity changes are
+    # logged by the statements that make them, which know whether it was a sale, count or delivery
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS ingredients_ledger_insert AFTER INSERT ON ingredients
+    BEGIN
+        INSERT OR REPLACE INTO inventory_items (ingredient_id, created_at, location_id, name)
+        VALUES (NEW.id, {NOW_SQL}, NEW.location_id, NEW.name);
+        INSERT INTO inventory_events (ingredient_id, at, kind, delta)
+        VALUES (NEW.id, {NOW_SQL}, 'create', NEW.quantity);
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS ingredients_ledger_delete AFTER DELETE ON ingredients
+    BEGIN
+        INSERT INTO inventory_events (ingredient_id, at, kind, delta)
+        VALUES (OLD.id, {NOW_SQL}, 'delete', -OLD.quantity);
+        UPDATE inventory_items SET deleted_at = {NOW_SQL}
+        WHERE ingredient_id = OLD.id AND deleted_at IS NULL;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS ingredients_ledger_rename AFTER UPDATE OF name ON ingredients
+    BEGIN
+        UPDATE inventory_items SET name = NEW.name WHERE ingredient_id = NEW.id AND deleted_at IS NULL;
+    END
+    ''')
+    
+    # The ledger starts from the stock on hand today
+    cursor.execute(f'''
+    INSERT OR IGNORE INTO inventory_items (ingredient_id, created_at, location_id, name)
+    SELECT id, {NOW_SQL}, location_id, name FROM ingredients
+    ''')
+    cursor.execute(f'''
+    INSERT INTO inventory_events (ingredient_id, at, kind, delta)
+    SELECT id, {NOW_SQL}, 'opening', quantity FROM ingredients
+    ''')
+
+
+def add_data_versions(cursor):
+    """Migration 7: per-location version counters bumped by triggers on every write that changes derived results"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        scope TEXT NOT NULL,
+        location_id TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (scope, location_id)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Versions restart with a new database, so cached results are also keyed by this
+    cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('database_id', lower(hex(randomblob(16))))")
+    
+    # (trigger name prefix, table, scope, location column or None for a store-wide table)
+    versioned = [
+        ("orders_version", "orders", "orders", "location_id"),
+        ("archived_order_counts_version", "archived_order_counts", "orders", "location_id"),
+        ("ingredients_version", "ingredients", "ingredients", "location_id"),
+        ("order_consumption_version", "order_consumption", "consumption", None),
+        ("ingredient_forecasts_version", "ingredient_forecasts", "forecasts", None),
+        ("forecast_state_version", "forecast_state", "forecasts", None)
+    ]
+    for prefix, table, scope, location in versioned:
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            location_id = f"{row}.{location}" if location else "''"
+            bump = (f"INSERT INTO data_versions (scope, location_id, version) VALUES ('{scope}', {location_id}, 1) "
+                    f"ON CONFLICT (scope, location_id) DO UPDATE SET version = version + 1;")
+            # A row moved to another store changes that store's results too
+            if event == "UPDATE" and location:
+                bump += (f"INSERT INTO data_versions (scope, location_id, version) "
+                         f"SELECT '{scope}', OLD.{location}, 1 WHERE OLD.{location} IS NOT NEW.{location} "
+                         f"ON CONFLICT (scope, location_id) DO UPDATE SET version = version + 1;")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {prefix}_{event.lower()} AFTER {event} ON {table} "
+                           f"BEGIN {bump} END")
+
+
+def hash_passwords(cursor):
+    """Migration 8: replace plaintext passwords with salted hashes"""
+    rows = cursor.execute("SELECT id, password FROM users").fetchall()
+    cursor.executemany(
+        "UPDATE users SET password = ? WHERE id = ?",
+        [(auth.hash_password(password), user_id) for user_id, password in rows if not auth.is_hashed(password)]
+    )
+
+
+def add_forecast_corrections(cursor):
+    """Migration 9: queue consumption changes on days the forecasts have already fitted"""
+    # Net change per ingredient and local day (days since 1970-01-01), folded in by the next update
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS forecast_pending (
+        ingredient_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        quantity REAL NOT NULL,
+        PRIMARY KEY (ingredient_id, day)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Later days are read by the next update anyway, so only fitted days are queued
+    def queue(row, sign):
+        return f'''
+        INSERT INTO forecast_pending (ingredient_id, day, quantity)
+        SELECT {row}.ingredient_id, o.day, {sign}{row}.quantity
+        FROM (SELECT {ORDER_DAY_SQL} AS day FROM orders WHERE order_id = {row}.order_id) AS o
+        JOIN forecast_state s ON s.id = 1
+        WHERE o.day <= s.fitted_through
+        ON CONFLICT (ingredient_id, day) DO UPDATE SET quantity = quantity + excluded.quantity;'''
+    for event, body in (("insert", queue("NEW", "")),
+                        ("delete", queue("OLD", "-")),
+                        ("update", queue("OLD", "-") + queue("NEW", ""))):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS order_consumption_forecast_{event} AFTER {event.upper()} ON order_consumption
+        BEGIN {body}
+        END
+        ''')
+    
+    # Sales that arrived for fitted days before this were never counted; refit once
+    cursor.execute("DELETE FROM ingredient_forecasts")
+    cursor.execute("DELETE FROM forecast_state")
+
+
+def never_reuse_ingredient_ids(cursor):
+    """Migration 10: stop SQLite reusing the id of the newest ingredient after it is deleted"""
+    # Archived usage, the ledger and the forecasts outlive a deleted ingredient under its id,
+    # which a plain INTEGER PRIMARY KEY hands to the next ingredient added
+    indexes_and_triggers = [row[0] for row in cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = 'ingredients' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+    )]
+    cursor.execute('''
+    CREATE TABLE ingredients_autoincrement (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        expected_restock INTEGER DEFAULT 0,
+        counted_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        location_id TEXT NOT NULL DEFAULT 'default'
+    )
+    ''')
+    cursor.execute('''
+    INSERT INTO ingredients_autoincrement (id, name, quantity, expected_restock, counted_at, location_id)
+    SELECT id, name, quantity, expected_restock, counted_at, location_id FROM ingredients
+    ''')
+    cursor.execute("DROP TABLE ingredients")
+    cursor.execute("ALTER TABLE ingredients_autoincrement RENAME TO ingredients")
+    for sql in indexes_and_triggers:
+        cursor.execute(sql)
+    
+    # New ids start past every id used so far, including those of deleted ingredients
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'ingredients'")
+    cursor.execute('''
+    INSERT INTO sqlite_sequence (name, seq)
+    SELECT 'ingredients', MAX(id) FROM (
+        SELECT MAX(id) AS id FROM ingredients
+        UNION ALL SELECT MAX(ingredient_id) FROM inventory_items
+        UNION ALL SELECT MAX(ingredient_id) FROM inventory_events
+        UNION ALL SELECT MAX(ingredient_id) FROM order_consumption
+        UNION ALL SELECT MAX(ingredient_id) FROM item_mappings
+        UNION ALL SELECT MAX(ingredient_id) FROM ingredient_forecasts
+    )
+    HAVING MAX(id) IS NOT NULL
+    ''')
+
+
+# Schema migrations in order; append new ones, never edit one that has shipped
+MIGRATIONS = [
+    create_base_schema,
+    add_lookup_indexes,
+    add_local_time_columns,
+    add_locations,
+    add_order_archive,
+    add_inventory_ledger,
+    add_data_versions,
+    hash_passwords,
+    add_forecast_corrections,
+    never_reuse_ingredient_ids
+]
+
+
+def create_order_indexes(cursor):
+    """Create the unique order id index, removing duplicate orders left by earlier imports"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND name='idx_orders_order_id'")
+    if not cursor.fetchone():
+        cursor.execute("DELETE FROM orders WHERE id NOT IN (SELECT MIN(id) FROM orders GROUP BY order_id)")
+        cursor.execute('''
+        DELETE FROM order_line_items
+        WHERE id NOT IN (SELECT MIN(id) FROM order_line_items GROUP BY order_id, uid)
+        ''')
+        cursor.execute("CREATE UNIQUE INDEX idx_orders_order_id ON orders (order_id)")
+    
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_line_items_order_id ON order_line_items (order_id)")
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_order_line_item_modifiers_order_id
+    ON order_line_item_modifiers (order_id)
+    ''')
+
+
+def sold_items_sql(order_ids_sql):
+    """The sold_items view restricted to the given orders, with each order's location
+    
+    SQLite materializes the whole view before filtering it, so the order
+    filter is repeated inside each branch to keep batch writes independent
+    of the size of the order history.
+    """
+    return f'''(
+        SELECT li.order_id, o.location_id, li.catalog_object_id, li.name, li.variation_name, li.quantity
+        FROM order_line_items li
+        JOIN orders o ON o.order_id = li.order_id
+        WHERE li.order_id IN ({order_ids_sql})
+        UNION ALL
+        SELECT m.order_id, o.location_id, m.catalog_object_id, m.name, NULL, li.quantity * m.quantity
+        FROM order_line_item_modifiers m
+        JOIN order_line_items li ON li.order_id = m.order_id AND li.uid = m.line_item_uid
+        JOIN orders o ON o.order_id = m.order_id
+        WHERE m.order_id IN ({order_ids_sql})
+    )'''
+
+
+def map_items_by_name(cursor, order_ids_sql):
+    """Map unmapped items sold in the given orders to the ingredient they are named after
+    
+    A variation named like an ingredient wins over the item name, so "Wings"
+    sold as "6 Wings" uses the "6 Wings" ingredient. Only ingredients of the
+    order's own location are considered. Items that match nothing stay
+    unmapped until a mapping is added by hand.
+    """
+    for ingredient_name in ("s.variation_name", "s.name"):
+        cursor.execute(f'''
+        INSERT INTO item_mappings (catalog_object_id, item_name, variation_name, ingredient_id)
+        SELECT s.catalog_object_id, MAX(s.name), MAX(s.variation_name), i.id
+        FROM {sold_items_sql(order_ids_sql)} s
+        JOIN ingredients i ON i.location_id = s.location_id AND i.name = {ingredient_name} COLLATE NOCASE
+        WHERE NOT EXISTS (
+            SELECT 1 FROM item_mappings m JOIN ingredients mapped ON mapped.id = m.ingredient_id
+            WHERE {MAPPING_MATCH} AND mapped.location_id = s.location_id
+        )
+        GROUP BY s.catalog_object_id,
+                 CASE WHEN s.catalog_object_id IS NULL THEN s.name END,
+                 CASE WHEN s.catalog_object_id IS NULL THEN s.variation_name END,
+                 i.id
+        ''')
+
+
+def record_consumption(cursor, order_ids_sql):
+    """Compute the ingredients used by the given orders from their sold items and their location's mappings"""
+    cursor.execute(f'''
+    INSERT INTO order_consumption (order_id, ingredient_id, quantity)
+    SELECT s.order_id, m.ingredient_id, SUM(s.quantity * m.units)
+    FROM {sold_items_sql(order_ids_sql)} s
+    JOIN item_mappings m ON {MAPPING_MATCH}
+    JOIN ingredients i ON i.id = m.ingredient_id AND i.location_id = s.location_id
+    GROUP BY s.order_id, m.ingredient_id
+    ''')
+
+
+def stage_stock_changes(cursor, sign, order_ids_sql):
+    """Queue sign * the consumption of the given orders placed after each ingredient's last count"""
+    cursor.execute(f'''
+    INSERT INTO temp.stock_changes (ingredient_id, amount)
+    SELECT c.ingredient_id, ? * c.quantity
+    FROM order_consumption c
+    JOIN orders o ON o.order_id = c.order_id
+    JOIN ingredients i ON i.id = c.ingredient_id
+    WHERE c.order_id IN ({order_ids_sql}) AND o.created_epoch > i.counted_at
+    ''', (sign,))
+
+
+def apply_stock_changes(cursor):
+    """Deduct all queued consumption from ingredient stock in one statement, logging it as sales"""
+    cursor.execute(f'''
+    INSERT INTO inventory_events (ingredient_id, at, kind, delta)
+    SELECT ingredient_id, {NOW_SQL}, 'sale', -SUM(amount) FROM temp.stock_changes
+    GROUP BY ingredient_id HAVING SUM(amount) != 0
+    ''')
+    cursor.execute('''
+    UPDATE ingredients SET quantity = ingredients.quantity - change.amount
+    FROM (SELECT ingredient_id, SUM(amount) AS amount FROM temp.stock_changes GROUP BY ingredient_id) AS change
+    WHERE ingredients.id = change.ingredient_id
+    ''')
+    cursor.execute("DELETE FROM temp.stock_changes")
+
+
+def create_order_rollup(cursor):
+    """Create the weekday/hour order count rollup and the triggers that keep it current"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='order_counts_by_weekday_hour'")
+    rollup_exists = cursor.fetchone()
+    
+    # One row per (weekday, hour) pair, 168 rows in total
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS order_counts_by_weekday_hour (
+        day_of_week INTEGER NOT NULL,
+        hour INTEGER NOT NULL,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day_of_week, hour)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Keep the counts up to date on every order insert, delete and update
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS orders_rollup_insert AFTER INSERT ON orders
+    BEGIN
+        UPDATE order_counts_by_weekday_hour SET order_count = order_count + 1
+        WHERE day_of_week = NEW.day_of_week AND hour = NEW.hour;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS orders_rollup_delete AFTER DELETE ON orders
+    BEGIN
+        UPDATE order_counts_by_weekday_hour SET order_count = order_count - 1
+        WHERE day_of_week = OLD.day_of_week AND hour = OLD.hour;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS orders_rollup_update AFTER UPDATE OF day_of_week, hour ON orders
+    BEGIN
+        UPDATE order_counts_by_weekday_hour SET order_count = order_count - 1
+        WHERE day_of_week = OLD.day_of_week AND hour = OLD.hour;
+        UPDATE order_counts_by_weekday_hour SET order_count = order_count + 1
+        WHERE day_of_week = NEW.day_of_week AND hour = NEW.hour;
+    END
+    ''')
+    
+    # Populate the rollup from existing orders the first time it is created
+    if not rollup_exists:
+        cursor.execute('''
+        INSERT INTO order_counts_by_weekday_hour (day_of_week, hour, order_count)
+        SELECT day_of_week, hour, COUNT(*) FROM orders GROUP BY day_of_week, hour
+        ''')
+        cursor.executemany(
+            "INSERT OR IGNORE INTO order_counts_by_weekday_hour (day_of_week, hour, order_count) VALUES (?, ?, 0)",
+            [(day, hour) for day in range(7) for hour in range(24)]
+        )
+
+
+def create_location_rollup(cursor):
+    """Create the per-location weekday/hour order counts and the triggers that keep them current"""
+    # One row per (location, weekday, hour) that has had orders
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS order_counts_by_location_weekday_hour (
+        location_id TEXT NOT NULL,
+        day_of_week INTEGER NOT NULL,
+        hour INTEGER NOT NULL,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (location_id, day_of_week, hour)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Keep the counts up to date on every order insert, delete and update
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS orders_location_rollup_insert AFTER INSERT ON orders
+    BEGIN
+        INSERT INTO order_counts_by_location_weekday_hour (location_id, day_of_week, hour, order_count)
+        VALUES (NEW.location_id, NEW.day_of_week, NEW.hour, 1)
+        ON CONFLICT (location_id, day_of_week, hour) DO UPDATE SET order_count = order_count + 1;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS orders_location_rollup_delete AFTER DELETE ON orders
+    BEGIN
+        UPDATE order_counts_by_location_weekday_hour SET order_count = order_count - 1
+        WHERE location_id = OLD.location_id AND day_of_week = OLD.day_of_week AND hour = OLD.hour;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS orders_location_rollup_update
+    AFTER UPDATE OF location_id, day_of_week, hour ON orders
+    BEGIN
+        UPDATE order_counts_by_location_weekday_hour SET order_count = order_count - 1
+        WHERE location_id = OLD.location_id AND day_of_week = OLD.day_of_week AND hour = OLD.hour;
+        INSERT INTO order_counts_by_location_weekday_hour (location_id, day_of_week, hour, order_count)
+        VALUES (NEW.location_id, NEW.day_of_week, NEW.hour, 1)
+        ON CONFLICT (location_id, day_of_week, hour) DO UPDATE SET order_count = order_count + 1;
+    END
+    ''')
+    
+    rebuild_order_rollup(cursor)
+
+
+def rebuild_order_rollup(cursor):
+    """Rebuild the per-location weekday/hour rollup from the orders table"""
+    # Recount every (location, weekday, hour) in a single pass over orders
+    cursor.execute("DELETE FROM order_counts_by_location_weekday_hour")
+    cursor.execute('''
+    INSERT INTO order_counts_by_location_weekday_hour (location_id, day_of_week, hour, order_count)
+    SELECT location_id, day_of_week, hour, COUNT(*) FROM orders GROUP BY location_id, day_of_week, hour
+    ''')
+
+
+def count_orders(conn, location_id=None):
+    """Count the orders of one location, or of all of them, archived ones included"""
+    if location_id is None:
+        return conn.execute(
+            "SELECT (SELECT COUNT(*) FROM orders) + (SELECT COALESCE(SUM(order_count), 0) FROM archived_partitions)"
+        ).fetchone()[0]
+    return conn.execute(
+        '''SELECT (SELECT COUNT(*) FROM orders WHERE location_id = ?)
+                + (SELECT COALESCE(SUM(order_count), 0) FROM archived_partitions WHERE location_id = ?)''',
+        (location_id, location_id)
+    ).fetchone()[0]
+
+
+def order_counts_by_weekday_hour(conn, location_id=None, first_day=None, last_day=None):
+    """Return (day_of_week, hour, order_count) rows for one location (or all of them),
+    for orders on local days first_day..last_day if given
+    
+    Without a range the precomputed rollup and archived counts are read.
+    With one, the counts come straight from the (location_id, local_date)
+    index, one location at a time, without touching the table, plus any
+    archived partitions the range reaches.
+    """
+    locations = "SELECT id FROM locations" if location_id is None else "?"
+    params = () if location_id is None else (location_id,)
+    if first_day is None:
+        return conn.execute(
+            f'''SELECT day_of_week, hour, SUM(order_count) FROM (
+                    SELECT day_of_week, hour, order_count FROM order_counts_by_location_weekday_hour
+                    WHERE location_id IN ({locations})
+                    UNION ALL
+                    SELECT day_of_week, hour, order_count FROM archived_order_counts
+                    WHERE location_id IN ({locations})
+                )
+                GROUP BY day_of_week, hour''',
+            params + params
+        ).fetchall()
+    rows = conn.execute(
+        f'''SELECT day_of_week, hour, COUNT(*) FROM orders
+            WHERE location_id IN ({locations}) AND local_date BETWEEN ? AND ?
+            GROUP BY day_of_week, hour''',
+        params + (str(first_day), str(last_day))
+    ).fetchall()
+    
+    import archive
+    
+    archived = archive.order_counts(conn, location_id, archive.day_number(first_day), archive.day_number(last_day))
+    if archived is None:
+        return rows
+    for day_of_week, hour, order_count in rows:
+        archived[day_of_week, hour] += order_count
+    return [(int(day), int(hour), int(archived[day, hour])) for day, hour in zip(*archived.nonzero())]
+
+
+def business_timezone(conn):
+    """Return the configured business timezone as a pytz timezone"""
+    import pytz
+    
+    row = conn.execute("SELECT value FROM settings WHERE key = 'timezone'").fetchone()
+    return pytz.timezone(row[0] if row else DEFAULT_TIMEZONE)
+
+
+def main_location_id(conn):
+    """Return the store commands act on when no location is given: the first store, wherever it was adopted"""
+    row = conn.execute("SELECT value FROM settings WHERE key = 'main_location_id'").fetchone()
+    return row[0] if row else DEFAULT_LOCATION_ID
+
+
+def adopt_location(cursor, old_id, new_id):
+    """Move a store's ingredients, orders, counts and archive to another location id
+    
+    Used to file the store that predates multi-location support under its
+    Square location id. The target may already hold orders, e.g. from an
+    import before the adoption; those are mapped to the adopted ingredients
+    and deducted from their stock as the import would have. Raises
+    ValueError if the target already has ingredients or archived months
+    overlapping the store's.
+    """
+    row = cursor.execute("SELECT name FROM locations WHERE id = ?", (old_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"No location {old_id!r}")
+    if old_id == new_id:
+        return
+    if cursor.execute("SELECT 1 FROM ingredients WHERE location_id = ? LIMIT 1", (new_id,)).fetchone():
+        raise ValueError(f"Location {new_id!r} already has ingredients")
+    if cursor.execute(
+        '''SELECT 1 FROM archived_partitions a JOIN archived_partitions b ON b.month = a.month
+           WHERE a.location_id = ? AND b.location_id = ? LIMIT 1''', (old_id, new_id)
+    ).fetchone():
+        raise ValueError(f"Locations {old_id!r} and {new_id!r} both have archived orders for the same month")
+    
+    # A location created by an import is named after its id; it takes the store's name
+    cursor.execute(
+        '''INSERT INTO locations (id, name) VALUES (?, ?)
+           ON CONFLICT (id) DO UPDATE SET name = excluded.name WHERE locations.name = locations.id''',
+        (new_id, row[0])
+    )
+    
+    # The target's own orders have no consumption yet, since it had no ingredients
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS adopted_orders (order_id TEXT PRIMARY KEY)")
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS stock_changes (ingredient_id INTEGER, amount REAL)")
+    cursor.execute("INSERT OR IGNORE INTO temp.adopted_orders SELECT order_id FROM orders WHERE location_id = ?",
+                   (new_id,))
+    
+    # The rollup and data version triggers follow the moved orders and ingredients
+    for table in ("orders", "ingredients", "inventory_items", "archived_partitions", "sync_state"):
+        cursor.execute(f"UPDATE OR IGNORE {table} SET location_id = ? WHERE location_id = ?", (new_id, old_id))
+    cursor.execute(
+        '''INSERT INTO archived_order_counts (location_id, day_of_week, hour, order_count)
+           SELECT ?, day_of_week, hour, order_count FROM archived_order_counts WHERE location_id = ?
+           ON CONFLICT (location_id, day_of_week, hour) DO UPDATE SET
+               order_count = archived_order_counts.order_count + excluded.order_count''',
+        (new_id, old_id)
+    )
+    for table in ("archived_order_counts", "order_counts_by_location_weekday_hour", "sync_state"):
+        cursor.execute(f"DELETE FROM {table} WHERE location_id = ?", (old_id,))
+    cursor.execute("DELETE FROM locations WHERE id = ?", (old_id,))
+    if main_location_id(cursor) == old_id:
+        cursor.execute(
+            '''INSERT INTO settings (key, value) VALUES ('main_location_id', ?)
+               ON CONFLICT (key) DO UPDATE SET value = excluded.value''',
+            (new_id,)
+        )
+    
+    adopted_ids_sql = "SELECT order_id FROM temp.adopted_orders"
+    map_items_by_name(cursor, adopted_ids_sql)
+    record_consumption(cursor, adopted_ids_sql)
+    stage_stock_changes(cursor, 1, adopted_ids_sql)
+    apply_stock_changes(cursor)
+    cursor.execute("DELETE FROM temp.adopted_orders")
+
+
+def set_business_timezone(cursor, name):
+    """Store a new business timezone and move every order's local date, weekday and hour to it"""
+    import pytz
+    
+    # Raises pytz.UnknownTimeZoneError before anything is written
+    tz = pytz.timezone(name)
+    cursor.execute(
+        "INSERT INTO settings (key, value) VALUES ('timezone', ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (tz.zone,)
+    )
+    refresh_local_time(cursor, tz)
+    
+    # Archived orders keep only their epoch; their weekday/hour counts are redone
+    if cursor.execute("SELECT 1 FROM archived_partitions LIMIT 1").fetchone():
+        import archive
+        
+        archive.recount(cursor, tz)
+    
+    # The forecasts count sales per local day, so they are refitted from scratch
+    cursor.execute("DELETE FROM ingredient_forecasts")
+    cursor.execute("DELETE FROM forecast_state")
+    cursor.execute("DELETE FROM forecast_pending")
+
+
+def refresh_local_time(cursor, tz):
+    """Recompute the local date, weekday and hour of every order from its UTC epoch"""
+    # NumPy is only needed here, so the admin panel can start without loading it
+    import numpy as np
+    
+    import analytics
+    
+    cursor.execute("SELECT id, created_epoch, day_of_week, hour, local_date FROM orders")
+    rows = cursor.fetchall()
+    if not rows:
+        return
+    ids, epochs, stored_weekdays, stored_hours, stored_dates = (np.array(column) for column in zip(*rows))
+    
+    local = analytics.to_local_seconds(epochs.astype(np.int64), tz)
+    weekdays = (local // analytics.SECONDS_PER_DAY + analytics.EPOCH_WEEKDAY) % 7
+    hours = local % analytics.SECONDS_PER_DAY // analytics.SECONDS_PER_HOUR
+    dates = (local // analytics.SECONDS_PER_DAY).astype("datetime64[D]").astype(str)
+    
+    # Only touch the orders that are out of date; the rollup triggers follow the weekday/hour changes
+    stale = (weekdays != stored_weekdays) | (hours != stored_hours) | (dates != stored_dates)
+    cursor.executemany(
+        "UPDATE orders SET local_date = ?, day_of_week = ?, hour = ? WHERE id = ?",
+        zip(dates[stale].tolist(), weekdays[stale].tolist(), hours[stale].tolist(), ids[stale].tolist())
+    )
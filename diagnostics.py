@@ -0,0 +1,203 @@
+"""Lightweight timing spans with rolling percentiles and a slow operation log
+
+    with diagnostics.span("chart.draw"):
+        ...
+    @diagnostics.traced("db.list_ingredients")
+    def list_ingredients(...):
+        ...
+
+Every span keeps its last ROLLING_WINDOW durations, so p50/p95 follow what
+staff are seeing now rather than the whole session. Spans slower than
+SLOW_SPAN_MS (SLOW_QUERY_MS for database spans, named "db.*") are added to
+the slow log with their details. Nothing here imports Qt, so the headless
+commands are traced the same way as the admin panel.
+"""
+import datetime
+import functools
+import json
+import reprlib
+import threading
+import time
+import traceback
+from collections import deque
+
+# Durations kept per span for the rolling percentiles
+ROLLING_WINDOW = 500
+
+# Spans slower than this go to the slow log, in milliseconds
+SLOW_SPAN_MS = 250
+SLOW_QUERY_MS = 50
+
+# Slow log and error entries kept, newest last
+SLOW_LOG_SIZE = 200
+ERROR_LOG_SIZE = 50
+
+# Longest detail (query arguments, SQL) kept with a slow log entry
+MAX_DETAIL_CHARS = 200
+
+# Items of a list, tuple, set or dict argument shown in a traced call's detail
+MAX_DETAIL_ITEMS = 5
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Tracer:
+    """Thread-safe store of span timings, slow spans and background errors"""
+    
+    def __init__(self, window=ROLLING_WINDOW):
+        self.window = window
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.counts = {}
+        self.slow_log = deque(maxlen=SLOW_LOG_SIZE)
+        self.errors = deque(maxlen=ERROR_LOG_SIZE)
+        self.started_at = time.time()
+    
+    def record(self, name, seconds, detail=None):
+        """Add one span's duration, logging it with its detail if slow
+        
+        detail may be a callable, only called for slow spans.
+        """
+        ms = seconds * 1000
+        threshold = SLOW_QUERY_MS if name.startswith("db.") else SLOW_SPAN_MS
+        with self.lock:
+            durations = self.durations.get(name)
+            if durations is None:
+                durations = self.durations[name] = deque(maxlen=self.window)
+            durations.append(ms)
+            self.counts[name] = self.counts.get(name, 0) + 1
+            slow = ms >= threshold
+        if slow:
+            if callable(detail):
+                detail = detail()
+            with self.lock:
+                self.slow_log.append({
+                    "at": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "span": name,
+                    "ms": round(ms, 1),
+                    "thread": threading.current_thread().name,
+                    "detail": str(detail)[:MAX_DETAIL_CHARS] if detail is not None else None
+                })
+    
+    def record_error(self, name, error):
+        """Keep a failed background job's error and traceback"""
+        with self.lock:
+            self.errors.append({
+                "at": datetime.datetime.now().isoformat(timespec="seconds"),
+                "span": name,
+                "error": str(error),
+                "traceback": traceback.format_exc()
+            })
+    
+    def stats(self):
+        """Return {span: {count, p50_ms, p95_ms, max_ms}}, slowest p95 first"""
+        with self.lock:
+            windows = {name: sorted(durations) for name, durations in self.durations.items()}
+            counts = dict(self.counts)
+        stats = {
+            name: {
+                "count": counts[name],
+                "p50_ms": round(percentile(durations, 0.5), 2),
+                "p95_ms": round(percentile(durations, 0.95), 2),
+                "max_ms": round(durations[-1], 2)
+            }
+            for name, durations in windows.items()
+        }
+        return dict(sorted(stats.items(), key=lambda item: item[1]["p95_ms"], reverse=True))
+    
+    def snapshot(self):
+        """Return everything recorded so far as JSON-ready data"""
+        stats = self.stats()
+        with self.lock:
+            slow_log = list(self.slow_log)
+            errors = list(self.errors)
+        return {
+            "started_at": datetime.datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+            "dumped_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "window": self.window,
+            "spans": stats,
+            "slow_log": slow_log,
+            "errors": errors
+        }
+    
+    def reset(self):
+        with self.lock:
+            self.durations.clear()
+            self.counts.clear()
+            self.slow_log.clear()
+            self.errors.clear()
+            self.started_at = time.time()
+
+
+# Process-wide tracer used by the helpers below
+tracer = Tracer()
+
+# Formats traced arguments without building the full repr of a big batch
+detail_repr = reprlib.Repr()
+detail_repr.maxstring = detail_repr.maxother = MAX_DETAIL_CHARS
+detail_repr.maxlist = detail_repr.maxtuple = detail_repr.maxset = detail_repr.maxfrozenset = MAX_DETAIL_ITEMS
+detail_repr.maxdict = detail_repr.maxdeque = detail_repr.maxarray = MAX_DETAIL_ITEMS
+
+
+class span:
+    """Context manager timing a block as the named span"""
+    
+    __slots__ = ("name", "detail", "start")
+    
+    def __init__(self, name, detail=None):
+        self.name = name
+        self.detail = detail
+        self.start = None
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if tracer.enabled:
+            tracer.record(self.name, time.perf_counter() - self.start, self.detail)
+        return False
+
+
+def traced(name=None):
+    """Decorator timing every call of a function as a span (named after the function by default)"""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+        
+        # Methods leave out self so the detail shows the call's own arguments
+        owner = fn.__qualname__.rpartition(".")[0]
+        first_arg = 1 if owner and not owner.endswith("<locals>") else 0
+        
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                tracer.record(span_name, time.perf_counter() - start,
+                              lambda: ", ".join([detail_repr.repr(arg) for arg in args[first_arg:]] +
+                                                [f"{key}={detail_repr.repr(value)}" for key, value in kwargs.items()]))
+        return wrapper
+    return decorator
+
+
+def record_error(name, error):
+    tracer.record_error(name, error)
+
+
+def snapshot():
+    return tracer.snapshot()
+
+
+def dump(path):
+    """Write the current timings, slow log and errors to a JSON file"""
+    with open(path, "w") as f:
+        json.dump(tracer.snapshot(), f, indent=2)
@@ -0,0 +1,271 @@
+"""Per-ingredient daily usage forecasts fitted from the ingredients used by orders"""
+import datetime
+
+import numpy as np
+
+import archive
+import cache
+import database
+import diagnostics
+
+# Days of demand subtracted from stock for the "Predicted Inventory" column
+FORECAST_DAYS = 7
+
+# How far ahead to look for a stock-out
+STOCKOUT_HORIZON_DAYS = 60
+
+EPOCH_DATE = datetime.date(1970, 1, 1)
+
+
+def business_today(tz):
+    """Return today's local date as days since 1970-01-01"""
+    return (datetime.datetime.now(tz).date() - EPOCH_DATE).days
+
+
+def day_number(local_date):
+    """Convert an ISO local date to days since 1970-01-01"""
+    return (datetime.date.fromisoformat(local_date) - EPOCH_DATE).days
+
+
+def day_date(day):
+    """Convert days since 1970-01-01 to an ISO date"""
+    return (EPOCH_DATE + datetime.timedelta(days=day)).isoformat()
+
+
+def load_daily_sales(conn, first_day, last_day):
+    """Return (ingredient_ids, days, quantities) for ingredients used between two local days,
+    archived orders included, cached until orders, their consumption or the ingredients change"""
+    # Archived usage is kept only for ingredients that exist, so adding or deleting one changes the result
+    return cache.memoize(conn, "daily_sales", (first_day, last_day),
+                         [("orders", None), ("consumption", ""), ("ingredients", None)],
+                         lambda: read_daily_sales(conn, first_day, last_day))
+
+
+def read_daily_sales(conn, first_day, last_day):
+    """Read the daily sales of every ingredient between two local days from SQLite and the archive"""
+    # Orders carry their local date, so the range and day numbers come straight from SQL
+    rows = conn.execute('''
+        SELECT c.ingredient_id, CAST(julianday(o.local_date) - julianday('1970-01-01') AS INTEGER), c.quantity
+        FROM order_consumption c
+        JOIN orders o ON o.order_id = c.order_id
+        WHERE o.local_date BETWEEN ? AND ?
+    ''', (day_date(first_day), day_date(last_day))).fetchall()
+    
+    # Older days may be in the archive; only the partitions they overlap are read
+    archived = archive.daily_consumption(conn, first_day, last_day)
+    if not rows:
+        return archived
+    
+    ingredient_ids, days, quantities = zip(*rows)
+    return (np.concatenate([archived[0], np.array(ingredient_ids, dtype=np.int64)]),
+            np.concatenate([archived[1], np.array(days, dtype=np.int64)]),
+            np.concatenate([archived[2], np.array(quantities, dtype=float)]))
+
+
+@diagnostics.traced("forecast.update")
+def update_forecasts(conn, tz=None, today=None):
+    """Fold every complete day since the last fit, and late sales on fitted days, into the per-ingredient models
+    
+    Each ingredient gets a least-squares line, sales = intercept + slope * t, over
+    its daily sales from its first sale onwards (days without sales count as
+    zero). Only the sufficient statistics (n, sums of t, y, t*t and t*y) are
+    stored, so new days are added without re-reading old history and all
+    ingredients are refitted in one vectorized batch. Orders imported or synced
+    for days already fitted are queued in forecast_pending by triggers and
+    added as corrections. Returns the number of days added or corrected.
+    
+    The update holds the write lock from its first read (BEGIN IMMEDIATE), so
+    two updates running at once can't both add the same days.
+    """
+    tz = tz or database.business_timezone(conn)
+    today = business_today(tz) if today is None else today
+    last_day = today - 1
+    
+    # Most calls have nothing to do; tell without taking the write lock
+    state = conn.execute("SELECT fitted_through FROM forecast_state WHERE id = 1").fetchone()
+    if (state and state[0] >= last_day
+            and conn.execute("SELECT 1 FROM forecast_pending LIMIT 1").fetchone() is None):
+        return 0
+    
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        days = fold_sales(conn, tz, last_day)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return days
+
+
+def fold_sales(conn, tz, last_day):
+    """Add the days through last_day and the queued corrections to the stored models (see update_forecasts)"""
+    origin_day, fitted_through = conn.execute(
+        "SELECT origin_day, fitted_through FROM forecast_state WHERE id = 1"
+    ).fetchone() or (None, None)
+    
+    if fitted_through is None:
+        # First fit: start from the oldest order, archived or not
+        oldest = conn.execute("SELECT MIN(local_date) FROM orders").fetchone()[0]
+        oldest_days = [day for day in (oldest and day_number(oldest), archive.oldest_day(conn, tz)) if day is not None]
+        if not oldest_days:
+            return 0
+        first_day = min(oldest_days)
+        fitted_through = first_day - 1
+    else:
+        first_day = fitted_through + 1
+    
+    # Net changes to fitted days since they were fitted, for ingredients that still exist
+    pending = conn.execute('''
+        SELECT p.ingredient_id, p.day, p.quantity FROM forecast_pending p
+        JOIN ingredients i ON i.id = p.ingredient_id
+        WHERE p.day <= ? AND ABS(p.quantity) > 1e-9
+    ''', (fitted_through,)).fetchall()
+    conn.execute("DELETE FROM forecast_pending")
+    corrected_days = sorted(set(row[1] for row in pending))
+    if first_day > last_day and not pending:
+        return 0
+    
+    ingredient_ids, days, quantities = load_daily_sales(conn, first_day, last_day)
+    if origin_day is None:
+        origin_day = int(days.min()) if days.size else first_day
+    if pending:
+        pending_ids, pending_days, pending_quantities = zip(*pending)
+        ingredient_ids = np.concatenate([ingredient_ids, np.array(pending_ids, dtype=np.int64)])
+        days = np.concatenate([days, np.array(pending_days, dtype=np.int64)])
+        quantities = np.concatenate([quantities, np.array(pending_quantities, dtype=float)])
+    
+    # The new days, plus fitted days back to the earliest correction
+    window_first = min([first_day] + corrected_days)
+    window_last = max(last_day, fitted_through)
+    
+    # Existing models keep accumulating (with zero sales on quiet days)
+    stored = conn.execute(
+        "SELECT ingredient_id, n, sum_t, sum_y, sum_tt, sum_ty, first_day FROM ingredient_forecasts"
+    ).fetchall()
+    stored_ids = [row[0] for row in stored]
+    item_ids = stored_ids + sorted(set(ingredient_ids.tolist()) - set(stored_ids))
+    item_index = {ingredient_id: i for i, ingredient_id in enumerate(item_ids)}
+    num_items = len(item_ids)
+    num_days = window_last - window_first + 1
+    
+    stats = np.zeros((num_items, 5))
+    fitted_first_day = np.full(num_items, window_last + 1, dtype=np.int64)
+    if stored:
+        stats[:len(stored)] = np.array([row[1:6] for row in stored], dtype=float)
+        fitted_first_day[:len(stored)] = [row[6] for row in stored]
+    item_first_day = fitted_first_day
+    
+    # Daily sales matrix for the window, one row per item; fitted days only hold their corrections
+    sales = np.zeros(num_items * num_days)
+    if ingredient_ids.size:
+        rows = np.array([item_index[ingredient_id] for ingredient_id in ingredient_ids.tolist()], dtype=np.int64)
+        cells = rows * num_days + (days - window_first)
+        sales = np.bincount(cells, weights=quantities, minlength=num_items * num_days)
+        sold = quantities > 0
+        first_sale = np.full(num_items, window_last + 1, dtype=np.int64)
+        np.minimum.at(first_sale, rows[sold], days[sold])
+        item_first_day = np.minimum(item_first_day, first_sale)
+    sales = sales.reshape(num_items, num_days)
+    
+    # Accumulate the sufficient statistics over each item's active days; a fitted day
+    # only counts again if a correction moved the item's first sale before it
+    day_numbers = np.arange(window_first, window_last + 1)
+    t = (day_numbers - origin_day).astype(float)
+    active = day_numbers[np.newaxis, :] >= item_first_day[:, np.newaxis]
+    counted = active & ((day_numbers[np.newaxis, :] > fitted_through)
+                        | (day_numbers[np.newaxis, :] < fitted_first_day[:, np.newaxis]))
+    y = sales * active
+    stats += np.column_stack([
+        counted.sum(axis=1),
+        (counted * t).sum(axis=1),
+        y.sum(axis=1),
+        (counted * t * t).sum(axis=1),
+        (y * t).sum(axis=1)
+    ])
+    
+    # Closed-form least squares for every item at once
+    n, sum_t, sum_y, sum_tt, sum_ty = stats.T
+    denominator = n * sum_tt - sum_t ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(denominator > 0, (n * sum_ty - sum_t * sum_y) / denominator, 0.0)
+        intercept = np.where(n > 0, (sum_y - slope * sum_t) / n, 0.0)
+    
+    conn.executemany(
+        '''INSERT INTO ingredient_forecasts
+           (ingredient_id, n, sum_t, sum_y, sum_tt, sum_ty, first_day, intercept, slope)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT (ingredient_id) DO UPDATE SET
+               n = excluded.n, sum_t = excluded.sum_t, sum_y = excluded.sum_y,
+               sum_tt = excluded.sum_tt, sum_ty = excluded.sum_ty,
+               first_day = excluded.first_day,
+               intercept = excluded.intercept, slope = excluded.slope''',
+        zip(item_ids, *(column.tolist() for column in stats.T),
+            item_first_day.tolist(), intercept.tolist(), slope.tolist())
+    )
+    conn.execute(
+        '''INSERT INTO forecast_state (id, origin_day, fitted_through) VALUES (1, ?, ?)
+           ON CONFLICT (id) DO UPDATE SET
+               origin_day = excluded.origin_day, fitted_through = excluded.fitted_through''',
+        (origin_day, window_last)
+    )
+    return max(last_day - fitted_through, 0) + len([day for day in corrected_days if day < first_day])
+
+
+def reset_forecasts(conn):
+    """Drop all fitted models so the next update refits from the full history"""
+    with conn:
+        conn.execute("DELETE FROM ingredient_forecasts")
+        conn.execute("DELETE FROM forecast_state")
+        conn.execute("DELETE FROM forecast_pending")
+
+
+@diagnostics.traced("forecast.project")
+def project_inventory(conn, ingredients, tz=None, today=None):
+    """Project each ingredient's stock from its usage forecast
+    
+    Returns {ingredient id: (predicted inventory, stock-out date or None)}.
+    The predicted inventory is on-hand plus expected restock minus the
+    forecast demand over the next FORECAST_DAYS days; the stock-out date is
+    the first day that cumulative demand uses up on-hand plus restock.
+    Ingredients without a forecast keep quantity + expected restock.
+    """
+    tz = tz or database.business_timezone(conn)
+    today = business_today(tz) if today is None else today
+    
+    # Ingredients are part of the key, so edits to them miss too
+    ingredients = tuple(ingredients)
+    return cache.memoize(conn, "project_inventory", (ingredients, today), [("forecasts", "")],
+                         lambda: project_forecasts(conn, ingredients, today))
+
+
+def project_forecasts(conn, ingredients, today):
+    """Project ingredients from the stored forecasts as of a local day (see project_inventory)"""
+    state = conn.execute("SELECT origin_day FROM forecast_state WHERE id = 1").fetchone()
+    models = dict((ingredient_id, (intercept, slope)) for ingredient_id, intercept, slope in conn.execute(
+        "SELECT ingredient_id, intercept, slope FROM ingredient_forecasts"
+    ))
+    
+    projections = {}
+    forecast = [ingredient for ingredient in ingredients if ingredient.id in models]
+    for ingredient in ingredients:
+        projections[ingredient.id] = (ingredient.quantity + ingredient.expected_restock, None)
+    if not forecast or state is None:
+        return projections
+    
+    # Daily demand for every forecast ingredient over the horizon in one array
+    coefficients = np.array([models[ingredient.id] for ingredient in forecast])
+    t = np.arange(today, today + STOCKOUT_HORIZON_DAYS) - state[0]
+    demand = np.clip(coefficients[:, :1] + coefficients[:, 1:] * t, 0, None)
+    cumulative = demand.cumsum(axis=1)
+    
+    stock = np.array([ingredient.quantity + ingredient.expected_restock for ingredient in forecast], dtype=float)
+    predicted = stock - cumulative[:, FORECAST_DAYS - 1]
+    runs_out = cumulative >= stock[:, np.newaxis]
+    first_out = runs_out.argmax(axis=1)
+    
+    for i, ingredient in enumerate(forecast):
+        stockout = None
+        if runs_out[i, first_out[i]]:
+            stockout = EPOCH_DATE + datetime.timedelta(days=int(today + first_out[i]))
+        projections[ingredient.id] = (int(round(predicted[i])), stockout)
+    return projections
@@ -0,0 +1,189 @@
+"""Bulk inventory import and export as CSV or Excel files
+
+    python kplate.py inventory export counts.csv
+    python kplate.py inventory import counts.xlsx --dry-run
+    python kplate.py inventory import counts.xlsx
+
+A file has a name column and a quantity and/or expected_restock column
+(headers are matched case-insensitively, "Expected Restock" works too).
+Quantities are stock counts, like Update Quantity; blank cells leave a
+value unchanged and names not in the database are added. Ingredients
+missing from the file are left alone.
+
+The whole file is validated before anything is written, the changes can
+be previewed, and they are applied in one transaction. openpyxl is only
+needed for .xlsx files.
+"""
+import csv
+import os
+from collections import namedtuple
+
+import diagnostics
+
+# Columns written by export_file, in order
+EXPORT_COLUMNS = ["id", "name", "quantity", "expected_restock"]
+
+# Columns an imported file may set; id is ignored since names identify ingredients
+VALUE_COLUMNS = ("quantity", "expected_restock")
+
+# Errors listed before the rest are summarized
+MAX_ERRORS_SHOWN = 20
+
+# One ingredient's change: ingredient_id is None for a new one, old values None when unchanged or new
+Change = namedtuple("Change", ["ingredient_id", "name", "old_quantity", "quantity",
+                               "old_expected_restock", "expected_restock"])
+
+
+class InventoryFileError(ValueError):
+    """A file that can't be imported; errors lists every problem found, with its line"""
+    
+    def __init__(self, errors):
+        self.errors = errors
+        shown = errors[:MAX_ERRORS_SHOWN]
+        if len(errors) > len(shown):
+            shown.append(f"... and {len(errors) - len(shown)} more")
+        super().__init__("\n".join(shown))
+
+
+def require_openpyxl():
+    """Import openpyxl, explaining how to get it if it is missing"""
+    try:
+        import openpyxl
+    except ImportError:
+        raise RuntimeError("Excel files need openpyxl: pip install openpyxl") from None
+    return openpyxl
+
+
+def is_excel(path):
+    return os.path.splitext(path)[1].lower() in (".xlsx", ".xlsm")
+
+
+def read_file(path):
+    """Return (line number, {column: value}) for each row of a CSV or Excel file, with normalized headers"""
+    if is_excel(path):
+        workbook = require_openpyxl().load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = list(workbook.active.iter_rows(values_only=True))
+        finally:
+            workbook.close()
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.reader(f))
+    if not rows:
+        return []
+    
+    headers = [str(header or "").strip().lower().replace(" ", "_") for header in rows[0]]
+    return [
+        (line, dict(zip(headers, row)))
+        for line, row in enumerate(rows[1:], start=2)
+        if any(value not in (None, "") for value in row)
+    ]
+
+
+def parse_amount(value):
+    """Return a cell as a non-negative number (an int when whole), None when blank; raises ValueError"""
+    if value is None or str(value).strip() == "":
+        return None
+    amount = float(str(value).strip())
+    if amount < 0 or amount != amount or amount in (float("inf"), float("-inf")):
+        raise ValueError(value)
+    return int(amount) if amount.is_integer() else amount
+
+
+@diagnostics.traced("inventory.plan_import")
+def plan_import(rows, ingredients):
+    """Validate every row against a location's ingredients and return the Changes they make
+    
+    Raises InventoryFileError listing every problem if any row is invalid.
+    Names match existing ingredients case-insensitively.
+    """
+    errors = []
+    columns = set(rows[0][1]) if rows else set()
+    if rows and "name" not in columns:
+        errors.append("The file needs a name column")
+    if rows and not columns & set(VALUE_COLUMNS):
+        errors.append("The file needs a quantity or expected_restock column")
+    if errors:
+        raise InventoryFileError(errors)
+    
+    existing = {ingredient.name.casefold(): ingredient for ingredient in ingredients}
+    seen = {}
+    changes = []
+    for line, row in rows:
+        name = str(row.get("name") or "").strip()
+        if not name:
+            errors.append(f"Line {line}: missing name")
+            continue
+        if name.casefold() in seen:
+            errors.append(f"Line {line}: {name} is also on line {seen[name.casefold()]}")
+            continue
+        seen[name.casefold()] = line
+        
+        values = {}
+        for column in VALUE_COLUMNS:
+            try:
+                values[column] = parse_amount(row.get(column))
+            except ValueError:
+                errors.append(f"Line {line}: {column} for {name} must be a number of at least 0, "
+                              f"not {row.get(column)!r}")
+        if len(values) < len(VALUE_COLUMNS):
+            continue
+        
+        ingredient = existing.get(name.casefold())
+        if ingredient is None:
+            changes.append(Change(None, name, None, values["quantity"] or 0,
+                                  None, values["expected_restock"] or 0))
+            continue
+        quantity_changed = values["quantity"] is not None and values["quantity"] != ingredient.quantity
+        restock_changed = (values["expected_restock"] is not None
+                           and values["expected_restock"] != ingredient.expected_restock)
+        if quantity_changed or restock_changed:
+            changes.append(Change(
+                ingredient.id, ingredient.name,
+                ingredient.quantity if quantity_changed else None, values["quantity"] if quantity_changed else None,
+                ingredient.expected_restock if restock_changed else None,
+                values["expected_restock"] if restock_changed else None
+            ))
+    if errors:
+        raise InventoryFileError(errors)
+    return changes
+
+
+def describe(change):
+    """One line for a change, e.g. "Fries: quantity 46 -> 120" """
+    if change.ingredient_id is None:
+        return f"{change.name}: new, quantity {change.quantity:g}, expected restock {change.expected_restock:g}"
+    parts = []
+    if change.quantity is not None:
+        parts.append(f"quantity {change.old_quantity:g} -> {change.quantity:g}")
+    if change.expected_restock is not None:
+        parts.append(f"expected restock {change.old_expected_restock:g} -> {change.expected_restock:g}")
+    return f"{change.name}: " + ", ".join(parts)
+
+
+def apply_changes(db, changes, location_id):
+    """Write planned Changes to a location in one transaction"""
+    db.update_ingredients(
+        location_id,
+        added=[(change.name, change.quantity, change.expected_restock)
+               for change in changes if change.ingredient_id is None],
+        quantities=[(change.quantity, change.ingredient_id)
+                    for change in changes if change.ingredient_id is not None and change.quantity is not None],
+        expected_restocks=[(change.expected_restock, change.ingredient_id)
+                           for change in changes
+                           if change.ingredient_id is not None and change.expected_restock is not None]
+    )
+
+
+def export_file(path, ingredients):
+    """Write ingredients to a CSV or Excel file that import reads back"""
+    rows = [EXPORT_COLUMNS] + [list(ingredient) for ingredient in ingredients]
+    if is_excel(path):
+        workbook = require_openpyxl().Workbook(write_only=True)
+        sheet = workbook.create_sheet("Inventory")
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+    else:
+        with open(path, "w", newline="") as f:
+            csv.writer(f).writerows(rows)
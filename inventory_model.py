@@ -0,0 +1,194 @@
+"""Table model shared by the current and future inventory views"""
+import datetime
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QSortFilterProxyModel, Qt
+from PyQt5.QtGui import QColor
+
+import diagnostics
+
+# Role holding the raw value a column sorts by
+SORT_ROLE = Qt.UserRole
+
+# Model columns; each view shows a subset of them through its proxy
+ID_COLUMN = 0
+NAME_COLUMN = 1
+QUANTITY_COLUMN = 2
+RESTOCK_COLUMN = 3
+PREDICTED_COLUMN = 4
+STOCKOUT_COLUMN = 5
+
+# Quantity colour of ingredients with a low-stock alert
+ALERT_COLOR = QColor("#FF5252")
+
+HEADERS = ["ID", "Ingredient", "Quantity", "Expected Restock", "Predicted Inventory", "Projected Stock-Out"]
+
+CURRENT_COLUMNS = (ID_COLUMN, NAME_COLUMN, QUANTITY_COLUMN)
+FUTURE_COLUMNS = (ID_COLUMN, NAME_COLUMN, RESTOCK_COLUMN, PREDICTED_COLUMN, STOCKOUT_COLUMN)
+
+
+class InventoryModel(QAbstractTableModel):
+    """In-memory cache of the ingredients table and their projections
+    
+    Edits update only the affected row and emit dataChanged, rowsInserted or
+    rowsRemoved for it, so the views never rebuild their contents; only
+    replacing the whole list with a different set of ingredients resets it.
+    """
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.ingredients = []
+        self.projections = {}
+        self.rows_by_id = {}
+        self.alerted_ids = set()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ingredients)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        
+        value = self.value(self.ingredients[index.row()], index.column())
+        if role == Qt.DisplayRole:
+            if index.column() == STOCKOUT_COLUMN:
+                return value.isoformat() if value else "-"
+            return str(value)
+        if role == SORT_ROLE:
+            return self.sort_key(index.row(), index.column())
+        if role == Qt.ForegroundRole and index.column() == QUANTITY_COLUMN:
+            return ALERT_COLOR if self.ingredients[index.row()].id in self.alerted_ids else None
+        if role == Qt.TextAlignmentRole and index.column() not in (NAME_COLUMN, STOCKOUT_COLUMN):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+    
+    def value(self, ingredient, column):
+        """Return the raw value of one column for an ingredient"""
+        if column < len(ingredient):
+            return ingredient[column]
+        predicted, stockout = self.projections.get(
+            ingredient.id, (ingredient.quantity + ingredient.expected_restock, None)
+        )
+        return predicted if column == PREDICTED_COLUMN else stockout
+    
+    def sort_key(self, row, column):
+        """Return the value a cell sorts by"""
+        value = self.value(self.ingredients[row], column)
+        # Ingredients that never run out sort after every stock-out date
+        if column == STOCKOUT_COLUMN and value is None:
+            return datetime.date.max
+        return value
+    
+    def ingredient(self, row):
+        return self.ingredients[row]
+    
+    def ingredient_row(self, ingredient_id):
+        """Return the row of an ingredient, or None"""
+        return self.rows_by_id.get(ingredient_id)
+    
+    @diagnostics.traced("table.reload")
+    def set_ingredients(self, ingredients, projections=None):
+        """Replace the cached ingredients, signalling only the rows that changed
+        
+        A first load, a location switch or any other change to the set of
+        ingredients resets the model in one step instead of a signal per row.
+        """
+        if projections is not None:
+            self.projections = dict(projections)
+        
+        new_ids = [ingredient.id for ingredient in ingredients]
+        if not self.ingredients or set(new_ids) != set(self.rows_by_id):
+            self.beginResetModel()
+            self.ingredients = list(ingredients)
+            self.rows_by_id = {ingredient_id: row for row, ingredient_id in enumerate(new_ids)}
+            self.projections = {ingredient_id: projection for ingredient_id, projection in self.projections.items()
+                                if ingredient_id in self.rows_by_id}
+            self.endResetModel()
+            return
+        
+        # Same ingredients: update only the rows that changed
+        for ingredient in ingredients:
+            row = self.rows_by_id[ingredient.id]
+            if self.ingredients[row] != ingredient:
+                self.ingredients[row] = ingredient
+                self.row_changed(row)
+        
+        if projections is not None and self.ingredients:
+            self.dataChanged.emit(self.index(0, PREDICTED_COLUMN),
+                                  self.index(len(self.ingredients) - 1, STOCKOUT_COLUMN))
+    
+    def set_alerts(self, ingredient_ids):
+        """Highlight the quantity of the given ingredients, redrawing only the rows that changed"""
+        ingredient_ids = set(ingredient_ids)
+        changed = ingredient_ids ^ self.alerted_ids
+        self.alerted_ids = ingredient_ids
+        for ingredient_id in changed:
+            row = self.rows_by_id.get(ingredient_id)
+            if row is not None:
+                self.dataChanged.emit(self.index(row, QUANTITY_COLUMN), self.index(row, QUANTITY_COLUMN))
+    
+    def update_ingredient(self, ingredient, projection=None):
+        """Insert or update one ingredient"""
+        if projection is not None:
+            self.projections[ingredient.id] = projection
+        row = self.rows_by_id.get(ingredient.id)
+        if row is None:
+            self.append(ingredient)
+        else:
+            self.ingredients[row] = ingredient
+            self.row_changed(row)
+    
+    def remove_ingredient(self, ingredient_id):
+        row = self.rows_by_id.get(ingredient_id)
+        if row is not None:
+            self.remove_row(row)
+    
+    def append(self, ingredient):
+        row = len(self.ingredients)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.ingredients.append(ingredient)
+        self.rows_by_id[ingredient.id] = row
+        self.endInsertRows()
+    
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        ingredient = self.ingredients.pop(row)
+        del self.rows_by_id[ingredient.id]
+        self.projections.pop(ingredient.id, None)
+        for later in self.ingredients[row:]:
+            self.rows_by_id[later.id] -= 1
+        self.endRemoveRows()
+    
+    def row_changed(self, row):
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(HEADERS) - 1))
+
+
+class InventoryProxyModel(QSortFilterProxyModel):
+    """Show a subset of the inventory columns, sorted by raw value and filtered by name"""
+    
+    def __init__(self, columns, parent=None):
+        super().__init__(parent)
+        self.columns = columns
+        self.setSortRole(SORT_ROLE)
+        self.setFilterKeyColumn(NAME_COLUMN)
+        self.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.setDynamicSortFilter(True)
+    
+    def filterAcceptsColumn(self, source_column, source_parent):
+        return source_column in self.columns
+    
+    def lessThan(self, left, right):
+        # Read the sort keys straight from the model rather than through data()
+        source = self.sourceModel()
+        return source.sort_key(left.row(), left.column()) < source.sort_key(right.row(), right.column())
+    
+    def ingredient(self, index):
+        """Return the ingredient shown at a proxy index"""
+        return self.sourceModel().ingredient(self.mapToSource(index).row())
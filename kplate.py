@@ -0,0 +1,496 @@
+"""Headless K-Plate commands for cron jobs and scripts
+
+    python kplate.py init
+    python kplate.py import export.json
+    python kplate.py sync --location L906FDH2F0XG8
+    python kplate.py sync --location L906FDH2F0XG8,LQ4B9W5KXS2M1 --workers 4 --rps 10
+    python kplate.py rollup
+    python kplate.py forecast
+    python kplate.py alerts --hours 48
+    python kplate.py timezone America/Chicago
+    python kplate.py locations --add L906FDH2F0XG8 "Downtown"
+    python kplate.py export ingredients -o inventory.csv
+    python kplate.py inventory export counts.xlsx
+    python kplate.py inventory import counts.xlsx --dry-run
+    python kplate.py archive --horizon-days 365 --vacuum
+    python kplate.py ledger at 2024-03-01T18:00
+    python kplate.py ledger receive "Chicken Wings" 200
+    python kplate.py ledger compact --keep-days 90
+    python kplate.py --trace sync-timings.json sync --location L906FDH2F0XG8
+
+Nothing here imports PyQt5 or matplotlib; each command only loads the
+modules it needs.
+"""
+import argparse
+import csv
+import datetime
+import os
+import sys
+
+import database
+from database import WEEKDAY_NAMES
+
+
+def cmd_init(db, args):
+    """Create the schema and seed a new database"""
+    import sample_data
+    
+    sample_data.initialize(db, sample_orders=not args.no_sample_orders)
+    print(f"Database ready: {db.count_orders()} orders, {len(db.list_ingredients(db.main_location_id()))} ingredients")
+    return 0
+
+
+def cmd_import(db, args):
+    """Stream Square order exports into the database"""
+    import square_import
+    
+    batch_size = args.batch_size or square_import.BATCH_SIZE
+    writer, cursor = square_import.import_orders(db.connection(), args.sources, batch_size, args.location)
+    print(f"Imported {writer.imported} orders ({writer.skipped} skipped)")
+    print_adoption(writer)
+    print_unarchived(writer)
+    if cursor:
+        print(f"Next page cursor: {cursor}")
+    return 0
+
+
+def print_adoption(writer):
+    if writer.adopted:
+        print(f"The existing store and its ingredients are now Square location {writer.adopted}")
+
+
+def print_unarchived(writer):
+    if writer.unarchived:
+        print(f"Replaced the archived copies of {writer.unarchived} orders synced again")
+
+
+def cmd_sync(db, args):
+    """Pull new orders from the Square Orders API, several locations at once"""
+    import square_sync
+    
+    location_ids = square_sync.location_list(args.location)
+    if not location_ids:
+        print("error: a Square location id is required (--location or $SQUARE_LOCATION_ID)", file=sys.stderr)
+        return 2
+    
+    base_url = args.base_url or square_sync.SQUARE_BASE_URL
+    client = square_sync.SquareClient(os.environ.get("SQUARE_ACCESS_TOKEN", ""), base_url,
+                                      requests_per_second=args.rps or square_sync.REQUESTS_PER_SECOND)
+    workers = args.workers or square_sync.SYNC_WORKERS
+    writer = square_sync.sync_locations(db.connection(), client, location_ids, workers)
+    print(f"Synced {writer.imported} orders ({writer.skipped} skipped) from {len(location_ids)} locations "
+          f"in {client.requests} requests ({client.retries} retried)")
+    print_adoption(writer)
+    print_unarchived(writer)
+    
+    # New sales may have brought items close to running out
+    import alerts
+    
+    for location_id in location_ids:
+        for alert in alerts.evaluate(db.connection(), location_id):
+            print(f"Low stock at {location_id}: {alerts.describe(alert)}")
+    return 0
+
+
+def cmd_rollup(db, args):
+    """Print the weekday/hour order counts, optionally rebuilding them first"""
+    db.create_tables()
+    if args.rebuild:
+        conn = db.connection()
+        with conn:
+            database.rebuild_order_rollup(conn.cursor())
+    
+    counts = [[0] * 24 for _ in range(7)]
+    for day_of_week, hour, order_count in db.order_counts_by_weekday_hour(args.location):
+        counts[day_of_week][hour] = order_count
+    
+    print("Weekday    " + " ".join(f"{hour:>4}" for hour in range(24)) + "  Total")
+    for day, hours in enumerate(counts):
+        print(f"{WEEKDAY_NAMES[day]:<10} " + " ".join(f"{count:>4}" for count in hours) + f"  {sum(hours):>5}")
+    return 0
+
+
+def cmd_forecast(db, args):
+    """Fold new sales into the forecasts and print the projected inventory"""
+    import forecasting
+    
+    db.create_tables()
+    conn = db.connection()
+    if args.refit:
+        forecasting.reset_forecasts(conn)
+    days = forecasting.update_forecasts(conn)
+    print(f"Added or corrected {days} days in the forecasts")
+    
+    ingredients = db.list_ingredients(args.location)
+    projections = forecasting.project_inventory(conn, ingredients)
+    print(f"{'Ingredient':<30} {'On hand':>8} {'Restock':>8} {'Predicted':>10}  Stock-out")
+    for ingredient in ingredients:
+        predicted, stockout = projections[ingredient.id]
+        print(f"{ingredient.name:<30} {ingredient.quantity:>8} {ingredient.expected_restock:>8} "
+              f"{predicted:>10}  {stockout.isoformat() if stockout else '-'}")
+    return 0
+
+
+def cmd_alerts(db, args):
+    """Print the ingredients projected to run out within the horizon; exits 1 if there are any"""
+    import alerts
+    
+    db.create_tables()
+    found = alerts.evaluate(db.connection(), args.location, args.hours)
+    for alert in found:
+        print(alerts.describe(alert))
+    if not found:
+        print(f"Nothing runs out within {args.hours:g} hours")
+    return 1 if found else 0
+
+
+def cmd_locations(db, args):
+    """List the store locations, adding, renaming or adopting one first if asked"""
+    db.create_tables()
+    if args.add:
+        db.add_location(*args.add)
+    if args.adopt:
+        try:
+            db.adopt_location(*args.adopt)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+    for location_id, name in db.list_locations():
+        print(f"{location_id:<20} {name:<30} {db.count_orders(location_id):>8} orders")
+    return 0
+
+
+def cmd_timezone(db, args):
+    """Show the business timezone, or change it and recompute every order's local time"""
+    db.create_tables()
+    if args.name:
+        db.set_business_timezone(args.name)
+    print(f"Business timezone: {db.business_timezone().zone}")
+    return 0
+
+
+def cmd_archive(db, args):
+    """Move cold orders into the Parquet archive, optionally reclaiming the freed space"""
+    import archive
+    
+    db.create_tables()
+    conn = db.connection()
+    if args.path:
+        archive.set_archive_root(conn, args.path)
+    partitions, orders = archive.archive_orders(conn, args.horizon_days)
+    print(f"Archived {orders} orders into {partitions} partitions under {archive.archive_root(conn)}")
+    
+    if args.vacuum:
+        conn.execute("VACUUM")
+    print(f"Database holds {conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]} live orders, "
+          f"{os.path.getsize(db.path) / 1e6:.1f} MB")
+    return 0
+
+
+def parse_instant(db, text):
+    """Epoch seconds of an ISO date or date and time, local to the business unless it gives an offset"""
+    instant = datetime.datetime.fromisoformat(text)
+    if instant.tzinfo is None:
+        instant = db.business_timezone().localize(instant)
+    return int(instant.timestamp())
+
+
+def format_instant(db, epoch):
+    return datetime.datetime.fromtimestamp(epoch, db.business_timezone()).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def find_ingredient(db, args):
+    ingredient = db.find_ingredient(args.name, args.location)
+    if ingredient is None:
+        print(f"error: no ingredient named {args.name!r} at {args.location}", file=sys.stderr)
+    return ingredient
+
+
+def cmd_ledger_at(db, args):
+    """Print a location's stock as it was at an instant"""
+    import ledger
+    
+    db.create_tables()
+    at = parse_instant(db, args.instant)
+    print(f"Stock at {format_instant(db, at)}:")
+    for _, name, quantity in ledger.stock_at(db.connection(), args.location, at):
+        print(f"  {name:<30} {quantity:>10g}")
+    return 0
+
+
+def cmd_ledger_history(db, args):
+    """Print an ingredient's latest stock changes"""
+    import ledger
+    
+    db.create_tables()
+    ingredient = find_ingredient(db, args)
+    if ingredient is None:
+        return 1
+    print(f"{'When':<19} {'Change':<10} {'Amount':>10} {'After':>10}")
+    for at, kind, delta, quantity in ledger.history(db.connection(), ingredient.id, args.limit):
+        print(f"{format_instant(db, at):<19} {kind:<10} {delta:>+10g} {quantity:>10g}")
+    return 0
+
+
+def cmd_ledger_receive(db, args):
+    """Add a delivery to an ingredient's stock"""
+    db.create_tables()
+    ingredient = find_ingredient(db, args)
+    if ingredient is None:
+        return 1
+    db.receive_stock(ingredient.id, args.amount)
+    print(f"{ingredient.name}: {db.get_ingredient(ingredient.id).quantity:g} on hand")
+    return 0
+
+
+def cmd_ledger_restore(db, args):
+    """Put a location's stock back to what it was at an instant"""
+    import ledger
+    
+    db.create_tables()
+    at = parse_instant(db, args.instant)
+    changed = ledger.restore(db.connection(), args.location, at)
+    print(f"Restored {changed} ingredients to their stock at {format_instant(db, at)}")
+    return 0
+
+
+def cmd_ledger_compact(db, args):
+    """Snapshot the ledger and drop the events older than the retention"""
+    import ledger
+    
+    db.create_tables()
+    snapshots, removed = ledger.compact(db.connection(), args.keep_days)
+    print(f"Took {snapshots} snapshots, removed {removed} events folded into them")
+    return 0
+
+
+def cmd_ledger_check(db, args):
+    """Compare stored quantities with the ledger, optionally resetting them to it"""
+    import ledger
+    
+    db.create_tables()
+    conn = db.connection()
+    mismatches = ledger.check(conn)
+    for _, name, stored, quantity in mismatches:
+        print(f"  {name:<30} stored {stored:>10g}  ledger {quantity:>10g}")
+    if args.rebuild:
+        print(f"Reset {ledger.rebuild(conn)} ingredients to the ledger")
+    else:
+        print(f"{len(mismatches)} ingredients disagree with the ledger")
+    return 1 if mismatches and not args.rebuild else 0
+
+
+def cmd_inventory_export(db, args):
+    """Write a location's ingredients to a CSV or Excel file for editing"""
+    import inventory_io
+    
+    db.create_tables()
+    ingredients = db.list_ingredients(args.location)
+    inventory_io.export_file(args.file, ingredients)
+    print(f"Exported {len(ingredients)} ingredients to {args.file}")
+    return 0
+
+
+def cmd_inventory_import(db, args):
+    """Validate a CSV or Excel file of counts, print the changes and apply them unless it's a dry run"""
+    import inventory_io
+    
+    db.create_tables()
+    try:
+        changes = inventory_io.plan_import(inventory_io.read_file(args.file), db.list_ingredients(args.location))
+    except inventory_io.InventoryFileError as e:
+        print(f"error: {args.file} was not imported:\n{e}", file=sys.stderr)
+        return 1
+    for change in changes:
+        print(inventory_io.describe(change))
+    if args.dry_run or not changes:
+        print(f"{len(changes)} ingredients would change" if changes else "Nothing to change")
+        return 0
+    inventory_io.apply_changes(db, changes, args.location)
+    print(f"Updated {len(changes)} ingredients")
+    return 0
+
+
+def export_ingredients(db, location_id):
+    import forecasting
+    
+    ingredients = db.list_ingredients(location_id or db.main_location_id())
+    projections = forecasting.project_inventory(db.connection(), ingredients)
+    yield ["id", "name", "quantity", "expected_restock", "predicted_inventory", "stockout_date"]
+    for ingredient in ingredients:
+        predicted, stockout = projections[ingredient.id]
+        yield list(ingredient) + [predicted, stockout.isoformat() if stockout else ""]
+
+
+def export_rollup(db, location_id):
+    yield ["day_of_week", "weekday", "hour", "order_count"]
+    for day_of_week, hour, order_count in sorted(db.order_counts_by_weekday_hour(location_id)):
+        yield [day_of_week, WEEKDAY_NAMES[day_of_week], hour, order_count]
+
+
+def export_forecasts(db, location_id):
+    yield ["ingredient_id", "ingredient", "days", "intercept", "slope"]
+    yield from db.connection().execute(
+        '''SELECT i.id, i.name, f.n, f.intercept, f.slope
+           FROM ingredient_forecasts f JOIN ingredients i ON i.id = f.ingredient_id
+           WHERE i.location_id = ? ORDER BY i.name''',
+        (location_id or db.main_location_id(),)
+    )
+
+
+EXPORTS = {
+    "ingredients": export_ingredients,
+    "rollup": export_rollup,
+    "forecasts": export_forecasts
+}
+
+
+def cmd_export(db, args):
+    """Write a report as CSV to a file or stdout"""
+    db.create_tables()
+    rows = EXPORTS[args.report](db, args.location)
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            csv.writer(f).writerows(rows)
+    else:
+        csv.writer(sys.stdout).writerows(rows)
+    return 0
+
+
+# Commands whose --location names one store
+STORE_COMMANDS = (cmd_forecast, cmd_alerts, cmd_ledger_at, cmd_ledger_history, cmd_ledger_receive,
+                  cmd_ledger_restore, cmd_inventory_export, cmd_inventory_import)
+
+
+def build_parser():
+    arg_parser = argparse.ArgumentParser(prog="kplate", description="K-Plate inventory tools without the admin panel")
+    arg_parser.add_argument("--db", default="kplate.db", help="Path to the SQLite database")
+    arg_parser.add_argument("--trace", metavar="FILE", help="write span timings and slow operations as JSON")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    
+    init_parser = commands.add_parser("init", help="create the schema and seed a new database")
+    init_parser.add_argument("--no-sample-orders", action="store_true", help="do not generate mock orders")
+    init_parser.set_defaults(handler=cmd_init)
+    
+    import_parser = commands.add_parser("import", help="import Square order exports or saved API pages")
+    import_parser.add_argument("sources", nargs="+", help="Square orders documents")
+    import_parser.add_argument("--batch-size", type=int, help="orders written per transaction")
+    import_parser.add_argument("--location", help="location of orders that do not name one (default: the main store)")
+    import_parser.set_defaults(handler=cmd_import)
+    
+    sync_parser = commands.add_parser("sync", help="pull new orders from the Square Orders API")
+    sync_parser.add_argument("--location", default=os.environ.get("SQUARE_LOCATION_ID"),
+                             help="comma-separated Square location ids (default: $SQUARE_LOCATION_ID)")
+    sync_parser.add_argument("--base-url", default=os.environ.get("SQUARE_BASE_URL"),
+                             help="Orders API host (default: $SQUARE_BASE_URL or Square production)")
+    sync_parser.add_argument("--workers", type=int, help="locations fetched at once")
+    sync_parser.add_argument("--rps", type=float, help="requests per second across all workers")
+    sync_parser.set_defaults(handler=cmd_sync)
+    
+    rollup_parser = commands.add_parser("rollup", help="print order counts by weekday and hour")
+    rollup_parser.add_argument("--rebuild", action="store_true", help="recount the rollup from the orders table")
+    rollup_parser.add_argument("--location", help="only count one location's orders (default: all)")
+    rollup_parser.set_defaults(handler=cmd_rollup)
+    
+    forecast_parser = commands.add_parser("forecast", help="update the sales forecasts and print projected stock")
+    forecast_parser.add_argument("--refit", action="store_true", help="refit from the full order history")
+    forecast_parser.add_argument("--location", help="location whose stock to project (default: the main store)")
+    forecast_parser.set_defaults(handler=cmd_forecast)
+    
+    alerts_parser = commands.add_parser("alerts", help="list ingredients projected to run out soon")
+    alerts_parser.add_argument("--hours", type=float, default=48, help="alert horizon in hours")
+    alerts_parser.add_argument("--location", help="store location (default: the main store)")
+    alerts_parser.set_defaults(handler=cmd_alerts)
+    
+    locations_parser = commands.add_parser("locations", help="list store locations")
+    locations_parser.add_argument("--add", nargs=2, metavar=("ID", "NAME"), help="add or rename a location")
+    locations_parser.add_argument("--adopt", nargs=2, metavar=("OLD_ID", "SQUARE_ID"),
+                                  help="move a store's ingredients, orders and counts to its Square location id")
+    locations_parser.set_defaults(handler=cmd_locations)
+    
+    timezone_parser = commands.add_parser("timezone", help="show or change the business timezone")
+    timezone_parser.add_argument("name", nargs="?", help="IANA timezone name, e.g. America/Chicago")
+    timezone_parser.set_defaults(handler=cmd_timezone)
+    
+    archive_parser = commands.add_parser("archive", help="move orders older than a horizon into Parquet files")
+    archive_parser.add_argument("--horizon-days", type=int, default=365,
+                                help="keep this many days of orders in SQLite (whole months are archived)")
+    archive_parser.add_argument("--path", help="archive directory to use from now on (default: next to the database)")
+    archive_parser.add_argument("--vacuum", action="store_true", help="shrink the database file afterwards")
+    archive_parser.set_defaults(handler=cmd_archive)
+    
+    ledger_parser = commands.add_parser("ledger", help="inventory history: past stock, deliveries, compaction")
+    ledger_commands = ledger_parser.add_subparsers(dest="ledger_command", required=True)
+    
+    at_parser = ledger_commands.add_parser("at", help="print the stock at a past instant")
+    at_parser.add_argument("instant", help="ISO date or date and time, in the business timezone unless given")
+    at_parser.set_defaults(handler=cmd_ledger_at)
+    
+    history_parser = ledger_commands.add_parser("history", help="print an ingredient's latest stock changes")
+    history_parser.add_argument("name", help="ingredient name")
+    history_parser.add_argument("--limit", type=int, default=50, help="changes to show")
+    history_parser.set_defaults(handler=cmd_ledger_history)
+    
+    receive_parser = ledger_commands.add_parser("receive", help="add a delivery to an ingredient's stock")
+    receive_parser.add_argument("name", help="ingredient name")
+    receive_parser.add_argument("amount", type=float, help="quantity delivered")
+    receive_parser.set_defaults(handler=cmd_ledger_receive)
+    
+    restore_parser = ledger_commands.add_parser("restore", help="put the stock back to what it was at an instant")
+    restore_parser.add_argument("instant", help="ISO date or date and time, in the business timezone unless given")
+    restore_parser.set_defaults(handler=cmd_ledger_restore)
+    
+    compact_parser = ledger_commands.add_parser("compact", help="fold old events into snapshots")
+    compact_parser.add_argument("--keep-days", type=int, default=90, help="keep every event from this many days")
+    compact_parser.set_defaults(handler=cmd_ledger_compact)
+    
+    check_parser = ledger_commands.add_parser("check", help="compare stored quantities with the ledger")
+    check_parser.add_argument("--rebuild", action="store_true", help="reset disagreeing quantities to the ledger")
+    check_parser.set_defaults(handler=cmd_ledger_check)
+    
+    for location_parser in (at_parser, history_parser, receive_parser, restore_parser):
+        location_parser.add_argument("--location", help="store location (default: the main store)")
+    
+    inventory_parser = commands.add_parser("inventory", help="bulk edit ingredients through CSV or Excel files")
+    inventory_commands = inventory_parser.add_subparsers(dest="inventory_command", required=True)
+    
+    inventory_export_parser = inventory_commands.add_parser("export", help="write the ingredients to a file")
+    inventory_export_parser.add_argument("file", help=".csv or .xlsx file to write")
+    inventory_export_parser.set_defaults(handler=cmd_inventory_export)
+    
+    inventory_import_parser = inventory_commands.add_parser("import", help="apply counts and restocks from a file")
+    inventory_import_parser.add_argument("file", help=".csv or .xlsx file with name and quantity or expected_restock")
+    inventory_import_parser.add_argument("--dry-run", action="store_true", help="only print the changes")
+    inventory_import_parser.set_defaults(handler=cmd_inventory_import)
+    
+    for location_parser in (inventory_export_parser, inventory_import_parser):
+        location_parser.add_argument("--location", help="store location (default: the main store)")
+    
+    export_parser = commands.add_parser("export", help="export a report as CSV")
+    export_parser.add_argument("report", choices=sorted(EXPORTS))
+    export_parser.add_argument("-o", "--output", help="CSV file to write (default: stdout)")
+    export_parser.add_argument("--location", help="location to export (default: the main store; rollup: all)")
+    export_parser.set_defaults(handler=cmd_export)
+    
+    return arg_parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db = database.Database(args.db)
+    try:
+        # Commands on one store default to the main one, which may have been adopted under a Square id
+        if args.handler in STORE_COMMANDS and args.location is None:
+            db.create_tables()
+            args.location = db.main_location_id()
+        return args.handler(db, args)
+    finally:
+        db.close()
+        if args.trace:
+            import diagnostics
+            
+            diagnostics.dump(args.trace)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
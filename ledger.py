@@ -0,0 +1,190 @@
+"""Append-only inventory ledger: stock changes as events, folded into periodic snapshots
+
+    python kplate.py ledger history "Chicken Wings"
+    python kplate.py ledger at 2024-03-01T18:00
+    python kplate.py ledger compact --keep-days 90
+
+Every change to an ingredient's stock is an inventory_events row: 'create'
+and 'delete' (written by triggers on ingredients), 'sale' (order
+deductions), 'adjustment' (a stock count), 'restock' (a delivery),
+'restore' (rolled back to an earlier instant) and the 'opening' stock of
+ingredients that predate the ledger.
+
+A snapshot holds an ingredient's quantity after all its events up to
+last_event_id. The quantity at any instant is the latest snapshot at or
+before it plus the events after that snapshot, so a lookup only reads the
+events since one snapshot however long the ledger gets. compact() takes
+snapshots and drops the events they cover once they are older than the
+retention; instants before that resolve to the last snapshot before them.
+
+ingredients.quantity stays the current quantity everyone reads, updated
+in the same transaction as its event. check() and rebuild() compare it
+with the ledger and repair it.
+"""
+import time
+
+import diagnostics
+from database import NOW_SQL
+
+# Events younger than this are kept by compact(), so recent history stays exact
+LEDGER_RETENTION_DAYS = 90
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Upper bound on `at` meaning "now and later"
+END_OF_TIME = 2 ** 62
+
+# Quantity of each inventory_items row (alias i) after every event up to :at
+QUANTITY_AT_SQL = '''(
+    COALESCE(s.quantity, 0) + COALESCE((
+        SELECT SUM(e.delta) FROM inventory_events e
+        WHERE e.ingredient_id = i.ingredient_id AND e.at BETWEEN COALESCE(s.at, 0) AND :at
+          AND e.id > COALESCE(s.last_event_id, 0)
+    ), 0)
+)'''
+
+# The latest snapshot (alias s) of each inventory_items row (alias i) at or before :at
+SNAPSHOT_AT_SQL = '''
+    LEFT JOIN inventory_snapshots s ON s.ingredient_id = i.ingredient_id AND s.last_event_id = (
+        SELECT last_event_id FROM inventory_snapshots
+        WHERE ingredient_id = i.ingredient_id AND at <= :at
+        ORDER BY at DESC, last_event_id DESC LIMIT 1
+    )'''
+
+# Largest difference between ingredients.quantity and the ledger put down to float rounding
+QUANTITY_TOLERANCE = 1e-6
+
+# Ledger ingredients that existed at :at
+EXISTING_AT_SQL = "i.created_at <= :at AND (i.deleted_at IS NULL OR i.deleted_at > :at)"
+
+
+@diagnostics.traced("ledger.stock_at")
+def stock_at(conn, location_id, at=None):
+    """Return (ingredient_id, name, quantity) for a location's ingredients at an epoch, by name
+    
+    Ingredients deleted by then are left out; without an instant the
+    current quantities are rebuilt from the ledger.
+    """
+    return conn.execute(
+        f'''SELECT i.ingredient_id, i.name, {QUANTITY_AT_SQL}
+            FROM inventory_items i {SNAPSHOT_AT_SQL}
+            WHERE i.location_id = :location AND {EXISTING_AT_SQL}
+            ORDER BY i.name''',
+        {"location": location_id, "at": END_OF_TIME if at is None else at}
+    ).fetchall()
+
+
+def quantity_at(conn, ingredient_id, at=None):
+    """Return one ingredient's quantity at an epoch, or None if it did not exist then"""
+    row = conn.execute(
+        f'''SELECT {QUANTITY_AT_SQL}
+            FROM inventory_items i {SNAPSHOT_AT_SQL}
+            WHERE i.ingredient_id = :ingredient AND {EXISTING_AT_SQL}''',
+        {"ingredient": ingredient_id, "at": END_OF_TIME if at is None else at}
+    ).fetchone()
+    return row[0] if row else None
+
+
+def history(conn, ingredient_id, limit=50):
+    """Return (at, kind, delta, quantity_after) for an ingredient's latest events, newest first"""
+    quantity = quantity_at(conn, ingredient_id)
+    if quantity is None:
+        return []
+    rows = []
+    for at, kind, delta in conn.execute(
+        "SELECT at, kind, delta FROM inventory_events WHERE ingredient_id = ? ORDER BY id DESC LIMIT ?",
+        (ingredient_id, limit)
+    ):
+        rows.append((at, kind, delta, quantity))
+        quantity -= delta
+    return rows
+
+
+def take_snapshots(cursor):
+    """Snapshot every ingredient with events since the last snapshots; returns the number taken
+    
+    Each round folds every event written since the previous one, so the
+    highest last_event_id is a watermark for the whole ledger. The events
+    are read by id range; grouping by ingredient through the index would
+    walk the whole ledger instead.
+    """
+    watermark = cursor.execute("SELECT COALESCE(MAX(last_event_id), 0) FROM inventory_snapshots").fetchone()[0]
+    cursor.execute('''
+    INSERT INTO inventory_snapshots (ingredient_id, last_event_id, at, quantity)
+    SELECT e.ingredient_id, MAX(e.id), MAX(e.at), SUM(e.delta) + COALESCE((
+        SELECT s.quantity FROM inventory_snapshots s WHERE s.ingredient_id = e.ingredient_id
+        ORDER BY s.last_event_id DESC LIMIT 1
+    ), 0)
+    FROM inventory_events e NOT INDEXED
+    WHERE e.id > ?
+    GROUP BY e.ingredient_id
+    ''', (watermark,))
+    return cursor.rowcount
+
+
+@diagnostics.traced("ledger.compact")
+def compact(conn, keep_days=LEDGER_RETENTION_DAYS, now=None):
+    """Snapshot the ledger and drop the events folded into snapshots older than keep_days
+    
+    Returns (snapshots taken, events removed). Only events covered by each
+    ingredient's last snapshot before the cutoff go, so every instant after
+    the cutoff still resolves exactly.
+    """
+    cutoff = int(time.time() if now is None else now) - keep_days * SECONDS_PER_DAY
+    with conn:
+        cursor = conn.cursor()
+        snapshots = take_snapshots(cursor)
+        cursor.execute('''
+        DELETE FROM inventory_events
+        WHERE at < :cutoff AND id <= (
+            SELECT s.last_event_id FROM inventory_snapshots s
+            WHERE s.ingredient_id = inventory_events.ingredient_id AND s.at < :cutoff
+            ORDER BY s.at DESC, s.last_event_id DESC LIMIT 1
+        )
+        ''', {"cutoff": cutoff})
+        return snapshots, cursor.rowcount
+
+
+def check(conn):
+    """Return (ingredient_id, name, stored, ledger) for ingredients whose quantity disagrees with the ledger"""
+    return conn.execute(
+        f'''SELECT i.ingredient_id, i.name, ingredients.quantity, {QUANTITY_AT_SQL} AS ledger
+            FROM inventory_items i {SNAPSHOT_AT_SQL}
+            JOIN ingredients ON ingredients.id = i.ingredient_id
+            WHERE i.deleted_at IS NULL AND ABS(ingredients.quantity - ledger) > :tolerance
+            ORDER BY i.name''',
+        {"at": END_OF_TIME, "tolerance": QUANTITY_TOLERANCE}
+    ).fetchall()
+
+
+def rebuild(conn):
+    """Reset ingredients.quantity to the ledger wherever they disagree; returns the ingredients fixed"""
+    with conn:
+        mismatches = check(conn)
+        conn.executemany(
+            "UPDATE ingredients SET quantity = ? WHERE id = ?",
+            [(ledger, ingredient_id) for ingredient_id, _, _, ledger in mismatches]
+        )
+    return len(mismatches)
+
+
+@diagnostics.traced("ledger.restore")
+def restore(conn, location_id, at):
+    """Put a location's current ingredients back to their quantity at an epoch, as 'restore' events
+    
+    Returns the number of ingredients changed. Ingredients added since are
+    left alone, and deleted ones are not brought back.
+    """
+    past = {ingredient_id: quantity for ingredient_id, _, quantity in stock_at(conn, location_id, at)}
+    with conn:
+        current = conn.execute(
+            "SELECT id, quantity FROM ingredients WHERE location_id = ?", (location_id,)
+        ).fetchall()
+        changes = [(past[ingredient_id] - quantity, ingredient_id) for ingredient_id, quantity in current
+                   if ingredient_id in past and past[ingredient_id] != quantity]
+        conn.executemany(
+            f"INSERT INTO inventory_events (ingredient_id, at, kind, delta) VALUES (?, {NOW_SQL}, 'restore', ?)",
+            [(ingredient_id, delta) for delta, ingredient_id in changes]
+        )
+        conn.executemany("UPDATE ingredients SET quantity = quantity + ? WHERE id = ?", changes)
+    return len(changes)
@@ -0,0 +1,121 @@
+"""Default admin user, starter inventory and mock orders for a new database"""
+import datetime
+import random
+
+import pytz
+
+# Starter inventory: (name, quantity, expected_restock)
+INITIAL_INGREDIENTS = [
+    ('K-Plate', 562, 400),
+    ('Spicy Chicken Plate', 190, 120),
+    ('Spicy Pork Plate', 93, 60),
+    ('Short Plate', 60, 40),
+    ('Soy Chicken Plate', 44, 0),
+    ('Beef Dumplings', 124, 80),
+    ('Kimchi Dumplings', 48, 0),
+    ('Fries', 46, 30),
+    ('6 Wings', 60, 40),
+    ('12 Wings', 24, 0),
+    ('18 Wings', 6, 0),
+    ('Mixed Veggie Plate', 22, 0)
+]
+
+
+def initialize(db, sample_orders=True):
+    """Create the schema and, on first run, the admin user, starter inventory and mock orders"""
+    # Create tables, indexes and triggers
+    db.create_tables()
+    
+    # Check if admin user exists, if not create one
+    if not db.user_exists('admin'):
+        db.add_user('admin', 'password')
+        
+        # Add initial inventory data
+        db.add_ingredients(INITIAL_INGREDIENTS)
+        
+        # Generate initial mock order data
+        if sample_orders:
+            add_sample_orders(db)
+
+
+def add_sample_orders(db):
+    """Generate two weeks of mock orders if the orders table is empty"""
+    # Mock orders follow the business's local opening hours
+    local_tz = db.business_timezone()
+    
+    # Create mock orders for the past 2 weeks (only if table is empty)
+    count = db.count_orders()
+    
+    if count == 0:
+        # Create a realistic distribution of orders
+        # Create mock orders for the past 2 weeks
+        start_date = datetime.datetime.now(local_tz).date() - datetime.timedelta(weeks=2)
+        
+        order_data = []
+        order_id = 1000
+        
+        # Create a realistic distribution with two peaks (lunch and dinner)
+        for day_offset in range(14):
+            current_date = start_date + datetime.timedelta(days=day_offset)
+            weekday = current_date.weekday()
+            
+            # More orders on weekends (5=Sat, 6=Sun)
+            num_orders = 50 if weekday >= 5 else 30
+            
+            for _ in range(num_orders):
+                # Create a bimodal distribution (lunch and dinner peaks)
+                hour = None
+                r = random.random()
+                
+                if r < 0.45:  # Lunch peak (11am-2pm)
+                    hour = random.choice([11, 12, 13, 14])
+                    # More orders at 12-1
+                    if hour in [12, 13]:
+                        if random.random() < 0.7:  # 70% chance to keep this hour
+                            pass
+                        else:
+                            continue
+                elif r < 0.9:  # Dinner peak (5pm-8pm)
+                    hour = random.choice([17, 18, 19, 20])
+                    # More orders at 6-7pm
+                    if hour in [18, 19]:
+                        if random.random() < 0.7:  # 70% chance to keep this hour
+                            pass
+                        else:
+                            continue
+                else:  # Some scattered orders throughout the day
+                    hour = random.choice([10, 15, 16, 21, 22])
+                    # Lower probability of keeping these hours
+                    if random.random() < 0.3:  # 30% chance to keep
+                        pass
+                    else:
+                        continue
+                
+                minute = random.randint(0, 59)
+                
+                # Create datetime in local timezone
+                order_time_local = local_tz.localize(
+                    datetime.datetime.combine(current_date, datetime.time(hour, minute))
+                )
+                
+                # Convert to UTC
+                order_time_utc = order_time_local.astimezone(pytz.UTC)
+                
+                # Format as ISO string for Square API compatibility
+                created_at = order_time_utc.isoformat()
+                
+                # Add to order data
+                order_data.append((
+                    f"order_{order_id}",
+                    created_at,
+                    int(order_time_utc.timestamp()),
+                    current_date.isoformat(),
+                    order_time_local.weekday(),
+                    order_time_local.hour
+                ))
+                
+                order_id += 1
+        
+        # Insert into database
+        db.add_orders(order_data)
+        print(f"Added {len(order_data)} mock orders to database")
@@ -0,0 +1,374 @@
+"""Streaming importer for Square order exports and Orders API pages"""
+import argparse
+import codecs
+import json
+import sys
+
+import pytz
+from dateutil import parser
+
+import archive
+import database
+import diagnostics
+
+# Bytes read from the export per chunk
+CHUNK_SIZE = 64 * 1024
+
+# Orders written per transaction
+BATCH_SIZE = 1000
+
+# Order states that count as sales
+IMPORT_STATES = ('COMPLETED', 'OPEN')
+
+# Order ids of the batch being flushed, as a subquery
+BATCH_ORDER_IDS = "SELECT order_id FROM temp.batch_orders"
+
+
+class SquareOrderStream:
+    """Parse a Square orders document incrementally, yielding one order at a time
+    
+    Only the current order and one chunk of text are held in memory, so the
+    size of the export does not matter. Several page documents written back
+    to back in the same file (e.g. one Orders API response per line) are read
+    in sequence. Top-level fields other than "orders" are kept in ``metadata``
+    and the pagination cursor of the last page read is available as ``cursor``.
+    """
+    
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.metadata = {}
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+    
+    @property
+    def cursor(self):
+        return self.metadata.get("cursor")
+    
+    def __iter__(self):
+        while self.skip_whitespace():
+            if self.peek() == "[":
+                # A bare array of orders
+                yield from self.read_array()
+            else:
+                yield from self.read_document()
+    
+    def read_document(self):
+        """Yield the orders of one top-level page document"""
+        self.metadata = {}
+        self.expect("{")
+        if self.skip_whitespace() and self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(":")
+            if key == "orders":
+                yield from self.read_array()
+            else:
+                self.metadata[key] = self.read_value()
+            self.skip_whitespace()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return
+    
+    def read_array(self):
+        """Yield each element of a JSON array without loading the whole array"""
+        self.expect("[")
+        if self.skip_whitespace() and self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.read_value()
+            self.skip_whitespace()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+    
+    def read_value(self):
+        """Decode the next JSON value, reading more input until it is complete"""
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number that ends with the buffer may continue in the next chunk
+            if end == len(self.buffer) and not self.eof:
+                self.fill()
+                continue
+            self.pos = end
+            return value
+    
+    def skip_whitespace(self):
+        """Skip whitespace, returning False at the end of the input"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return True
+            if not self.fill():
+                return False
+    
+    def peek(self):
+        return self.buffer[self.pos]
+    
+    def expect(self, char):
+        if not self.skip_whitespace() or self.peek() != char:
+            found = self.peek() if self.pos < len(self.buffer) else "end of input"
+            raise ValueError(f"Malformed Square export: expected '{char}' but found '{found}'")
+        self.pos += 1
+    
+    def fill(self):
+        """Drop consumed text and append the next chunk, returning False at end of input"""
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        if isinstance(chunk, bytes):
+            # Multi-byte characters may be split across chunks
+            chunk = self.text_decoder.decode(chunk)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+
+class OrderWriter:
+    """Buffer parsed orders and write them to the database in batched transactions"""
+    
+    def __init__(self, conn, batch_size=BATCH_SIZE, location_id=None):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.location_id = location_id or database.main_location_id(conn)
+        self.local_tz = database.business_timezone(conn)
+        self.order_rows = []
+        self.line_item_rows = []
+        self.modifier_rows = []
+        self.removed_ids = []
+        self.queued_ids = set()
+        self.location_ids = set()
+        self.adopted = None
+        self.imported = 0
+        self.skipped = 0
+        self.unarchived = 0
+    
+    def add(self, order):
+        """Queue one Square order, flushing when the batch is full"""
+        if not order.get("created_at"):
+            self.skipped += 1
+            return
+        
+        # An order updated twice within one batch must be written in order
+        if order["id"] in self.queued_ids:
+            self.flush()
+        self.queued_ids.add(order["id"])
+        
+        # Drafts and canceled orders are not sales; drop them if stored earlier
+        if order.get("state") not in IMPORT_STATES:
+            self.removed_ids.append((order["id"],))
+            self.skipped += 1
+        else:
+            self.queue_order(order)
+        
+        if len(self.order_rows) + len(self.removed_ids) >= self.batch_size:
+            self.flush()
+    
+    def queue_order(self, order):
+        """Convert one Square order into order and line item rows"""
+        # Square timestamps are UTC; store the epoch and the business-local date, weekday and hour
+        created_at = parser.isoparse(order["created_at"])
+        if created_at.tzinfo is None:
+            created_at = pytz.UTC.localize(created_at)
+        order_date_local = created_at.astimezone(self.local_tz)
+        location_id = order.get("location_id") or self.location_id
+        self.location_ids.add(location_id)
+        self.order_rows.append((
+            location_id,
+            order["id"],
+            order["created_at"],
+            int(created_at.timestamp()),
+            order_date_local.date().isoformat(),
+            order_date_local.weekday(),
+            order_date_local.hour
+        ))
+        
+        for line_item in order.get("line_items", []):
+            self.line_item_rows.append((
+                order["id"],
+                line_item.get("uid"),
+                line_item.get("catalog_object_id"),
+                line_item.get("name"),
+                line_item.get("variation_name"),
+                float(line_item.get("quantity", 0)),
+                line_item.get("total_money", {}).get("amount")
+            ))
+            for modifier in line_item.get("modifiers", []):
+                self.modifier_rows.append((
+                    order["id"],
+                    line_item.get("uid"),
+                    modifier.get("catalog_object_id"),
+                    modifier.get("name"),
+                    float(modifier.get("quantity", 1))
+                ))
+    
+    def adopt_store(self, cursor):
+        """File the store that predates locations under the first Square location id imported
+        
+        Only while the default store is the only location and this batch is
+        all from one new location; otherwise `kplate.py locations --adopt`
+        links them by hand.
+        """
+        known = {row[0] for row in cursor.execute("SELECT id FROM locations")}
+        new = self.location_ids - known
+        if known != {database.DEFAULT_LOCATION_ID} or len(new) != 1 or self.location_ids != new:
+            return
+        self.adopted = new.pop()
+        database.adopt_location(cursor, database.DEFAULT_LOCATION_ID, self.adopted)
+        if self.location_id == database.DEFAULT_LOCATION_ID:
+            self.location_id = self.adopted
+    
+    @diagnostics.traced("import.flush")
+    def flush(self):
+        """Upsert the queued orders, replace their line items and update stock in a single transaction
+        
+        Stock is adjusted by the difference between what the batch's orders
+        used before and after the write, so re-imported and updated orders
+        are not deducted twice and canceled orders give their stock back.
+        Orders synced again after they were archived replace their archived
+        copy the same way.
+        """
+        if not self.order_rows and not self.removed_ids:
+            return
+        batch_ids = self.removed_ids + [(row[1],) for row in self.order_rows]
+        written_files = []
+        replaced_files = []
+        try:
+            self.write_batch(batch_ids, written_files, replaced_files)
+        except BaseException:
+            archive.remove_files(self.conn, written_files)
+            raise
+        archive.remove_files(self.conn, replaced_files)
+        self.imported += len(self.order_rows)
+        self.order_rows = []
+        self.line_item_rows = []
+        self.modifier_rows = []
+        self.removed_ids = []
+        self.queued_ids = set()
+        self.location_ids = set()
+    
+    def write_batch(self, batch_ids, written_files, replaced_files):
+        """Write the queued orders in one transaction (see flush)"""
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS batch_orders (order_id TEXT PRIMARY KEY)")
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS stock_changes (ingredient_id INTEGER, amount REAL)")
+            cursor.executemany("INSERT OR IGNORE INTO temp.batch_orders (order_id) VALUES (?)", batch_ids)
+            
+            # Give back what the previous version of these orders used
+            database.stage_stock_changes(cursor, -1, BATCH_ORDER_IDS)
+            cursor.execute(f"DELETE FROM order_consumption WHERE order_id IN ({BATCH_ORDER_IDS})")
+            
+            # Line items are replaced wholesale since Square may add or remove them
+            self.conn.executemany("DELETE FROM order_line_items WHERE order_id = ?", batch_ids)
+            self.conn.executemany("DELETE FROM order_line_item_modifiers WHERE order_id = ?", batch_ids)
+            self.conn.executemany("DELETE FROM orders WHERE order_id = ?", self.removed_ids)
+            
+            self.adopt_store(cursor)
+            
+            # Square locations seen for the first time are named after their id until renamed
+            self.conn.executemany("INSERT OR IGNORE INTO locations (id, name) VALUES (?, ?)",
+                                  [(location_id, location_id) for location_id in self.location_ids])
+            self.conn.executemany(
+                '''INSERT INTO orders (location_id, order_id, created_at, created_epoch, local_date, day_of_week, hour)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (order_id) DO UPDATE SET
+                       location_id = excluded.location_id,
+                       created_at = excluded.created_at,
+                       created_epoch = excluded.created_epoch,
+                       local_date = excluded.local_date,
+                       day_of_week = excluded.day_of_week,
+                       hour = excluded.hour''',
+                self.order_rows
+            )
+            self.conn.executemany(
+                '''INSERT INTO order_line_items
+                   (order_id, uid, catalog_object_id, name, variation_name, quantity, total_money)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                self.line_item_rows
+            )
+            self.conn.executemany(
+                '''INSERT INTO order_line_item_modifiers
+                   (order_id, line_item_uid, catalog_object_id, name, quantity)
+                   VALUES (?, ?, ?, ?, ?)''',
+                self.modifier_rows
+            )
+            
+            # Take what the new version uses, then update every ingredient in one statement
+            database.map_items_by_name(cursor, BATCH_ORDER_IDS)
+            database.record_consumption(cursor, BATCH_ORDER_IDS)
+            database.stage_stock_changes(cursor, 1, BATCH_ORDER_IDS)
+            self.unarchived += archive.drop_archived_copies(cursor, BATCH_ORDER_IDS, written_files, replaced_files)
+            database.apply_stock_changes(cursor)
+            cursor.execute("DELETE FROM temp.batch_orders")
+
+
+@diagnostics.traced("import.orders")
+def import_orders(conn, sources, batch_size=BATCH_SIZE, location_id=None):
+    """Stream orders from each source (path or file object) into the database
+    
+    Returns the writer, whose ``imported`` and ``skipped`` counts describe the
+    run, and the cursor of the last page read. Orders that name no location
+    go to location_id, by default the main store.
+    """
+    database.create_tables(conn.cursor())
+    conn.commit()
+    
+    writer = OrderWriter(conn, batch_size, location_id)
+    cursor = None
+    for source in sources:
+        fp = open(source, "rb") if isinstance(source, str) else source
+        try:
+            stream = SquareOrderStream(fp)
+            for order in stream:
+                writer.add(order)
+            cursor = stream.cursor
+        finally:
+            if fp is not source:
+                fp.close()
+    writer.flush()
+    return writer, cursor
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Import Square order exports into kplate.db")
+    arg_parser.add_argument("sources", nargs="+", help="Square orders documents or saved API pages")
+    arg_parser.add_argument("--db", default="kplate.db", help="Path to the SQLite database")
+    arg_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = arg_parser.parse_args()
+    
+    db = database.Database(args.db)
+    conn = db.connection()
+    try:
+        writer, cursor = import_orders(conn, args.sources, args.batch_size)
+    finally:
+        db.close()
+    
+    print(f"Imported {writer.imported} orders ({writer.skipped} skipped)")
+    if cursor:
+        print(f"Next page cursor: {cursor}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
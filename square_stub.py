@@ -0,0 +1,159 @@
+"""Local stand-in for the Square Orders search endpoint, serving orders from an export
+
+    python square_stub.py random.json --port 8765
+    python square_stub.py random.json --throttle-rate 0.2 --error-rate 0.05 --latency-ms 50
+    python square_sync.py --location L906FDH2F0XG8 --base-url http://127.0.0.1:8765
+
+Connections are kept alive like the real API's. The throttling, error and
+latency options make it answer some requests with 429 or 503, or slowly,
+to exercise the sync's retries and concurrency.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class SquareStubHandler(BaseHTTPRequestHandler):
+    """Answer POST /v2/orders/search with pages of the loaded orders"""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def setup(self):
+        super().setup()
+        self.server.count("connections_opened")
+    
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/v2/orders/search":
+            self.send_error(404)
+            return
+        
+        if self.server.latency_s:
+            time.sleep(self.server.latency_s)
+        failure = self.server.draw_failure()
+        if failure:
+            self.send_failure(failure)
+            return
+        
+        query = body.get("query", {})
+        updated_filter = query.get("filter", {}).get("date_time_filter", {}).get("updated_at", {})
+        start_at = updated_filter.get("start_at")
+        location_ids = set(body.get("location_ids", []))
+        
+        # Filter and sort the same way the Orders API does for this query
+        orders = [
+            order for order in self.server.orders
+            if (not location_ids or order.get("location_id") in location_ids)
+            and (not start_at or order.get("updated_at", "") >= start_at)
+        ]
+        orders.sort(key=lambda order: order.get("updated_at", ""))
+        
+        # The cursor is simply the offset of the next page
+        offset = int(body.get("cursor") or 0)
+        limit = int(body.get("limit", 500))
+        page = {"orders": orders[offset:offset + limit]}
+        if offset + limit < len(orders):
+            page["cursor"] = str(offset + limit)
+        
+        payload = json.dumps(page).encode("utf-8")
+        self.server.count("requests_served")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def send_failure(self, status):
+        """Answer with a rate limit or server error in the Orders API's error format"""
+        category = "RATE_LIMIT_ERROR" if status == 429 else "API_ERROR"
+        payload = json.dumps({"errors": [{"category": category, "code": category}]}).encode("utf-8")
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", str(self.server.retry_after))
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class SquareStubServer(ThreadingHTTPServer):
+    """Threaded stub server holding the orders, failure settings and request counters"""
+    
+    daemon_threads = True
+    
+    def __init__(self, address, orders, throttle_rate=0.0, error_rate=0.0, latency_s=0.0, retry_after=0, seed=None):
+        super().__init__(address, SquareStubHandler)
+        self.orders = orders
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.latency_s = latency_s
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests_served = 0
+        self.requests_throttled = 0
+        self.requests_failed = 0
+        self.connections_opened = 0
+    
+    def count(self, counter):
+        """Increment one of the request counters (handlers run on many threads)"""
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+    
+    def draw_failure(self):
+        """Return 429 or 503 if this request should fail, else None"""
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.throttle_rate:
+            self.count("requests_throttled")
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            self.count("requests_failed")
+            return 503
+        return None
+
+
+def make_server(orders, host="127.0.0.1", port=0, throttle_rate=0.0, error_rate=0.0, latency_s=0.0,
+                retry_after=0, seed=None):
+    """Create a stub server for the given orders; port 0 picks a free port
+    
+    throttle_rate and error_rate are the shares of requests answered with
+    429 (with a Retry-After of retry_after seconds) and 503, and every
+    request waits latency_s first.
+    """
+    return SquareStubServer((host, port), orders, throttle_rate, error_rate, latency_s, retry_after, seed)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Serve a Square orders export as the Orders API")
+    arg_parser.add_argument("export", help="Square orders document such as random.json")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    arg_parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before each answer")
+    arg_parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    args = arg_parser.parse_args()
+    
+    with open(args.export) as f:
+        orders = json.load(f)["orders"]
+    
+    server = make_server(orders, port=args.port, throttle_rate=args.throttle_rate, error_rate=args.error_rate,
+                         latency_s=args.latency_ms / 1000, retry_after=args.retry_after)
+    print(f"Serving {len(orders)} orders on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+"""Incremental Square order sync with a persisted cursor and high-water mark
+
+Several locations are fetched at once by a small pool of threads that share
+a request budget and keep-alive connections; every page they fetch is
+written by the calling thread, which owns the database connection.
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import diagnostics
+from square_import import BATCH_SIZE, OrderWriter, SquareOrderStream
+
+SQUARE_BASE_URL = "https://connect.squareup.com"
+SQUARE_VERSION = "2025-03-19"
+
+# Orders requested per page (the Orders API maximum)
+PAGE_LIMIT = 500
+
+# Locations fetched at the same time
+SYNC_WORKERS = 4
+
+# Requests started per second across all workers
+REQUESTS_PER_SECOND = 10
+
+# Retries of a request that was rate limited, hit a server error or lost its connection
+MAX_RETRIES = 5
+BACKOFF_BASE_S = 0.5
+MAX_BACKOFF_S = 30
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Pages fetched ahead of the writer before the workers wait for it
+QUEUED_PAGES = 8
+
+# One fetched page of a location's orders and the sync state to save once it is written
+SyncPage = namedtuple("SyncPage", ["location_id", "orders", "cursor", "query_start", "high_water_mark"])
+
+# Queued by a worker when it has fetched every page of a location, or failed to
+LocationDone = namedtuple("LocationDone", ["location_id", "error"])
+
+
+class SquareAPIError(RuntimeError):
+    """A Square request failed with an HTTP error status"""
+    
+    def __init__(self, status, message):
+        super().__init__(f"Square API error {status}: {message}")
+        self.status = status
+
+
+class RateLimiter:
+    """Space out requests so no more than `rate` start per second, across threads"""
+    
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_start = time.monotonic()
+    
+    def wait(self):
+        """Block until the calling thread may start its next request"""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class SquareClient:
+    """Minimal client for the Square Orders search endpoint
+    
+    Each thread keeps one keep-alive connection to the API host. Every
+    request waits its turn under the shared requests-per-second budget, and
+    429 and 5xx answers are retried with exponential backoff (or after the
+    server's Retry-After).
+    """
+    
+    def __init__(self, access_token, base_url=SQUARE_BASE_URL, timeout=30,
+                 requests_per_second=REQUESTS_PER_SECOND, max_retries=MAX_RETRIES):
+        self.access_token = access_token
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        
+        url = urllib.parse.urlsplit(self.base_url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.host = url.netloc
+        self.path_prefix = url.path
+    
+    def connection(self):
+        """Return this thread's connection to the API host, opening it on first use"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.connection_class(self.host, timeout=self.timeout)
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+    
+    def reconnect(self):
+        """Close the calling thread's connection so its next request opens a new one"""
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+    
+    def close(self):
+        """Close every pooled connection (once no requests are in flight)"""
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+    
+    def search_orders(self, location_id, updated_since=None, cursor=None, limit=PAGE_LIMIT):
+        """Request one page of orders updated at or after updated_since, oldest first
+        
+        Returns the open HTTP response so the page can be parsed as it streams in.
+        """
+        query = {"sort": {"sort_field": "UPDATED_AT", "sort_order": "ASC"}}
+        if updated_since:
+            query["filter"] = {"date_time_filter": {"updated_at": {"start_at": updated_since}}}
+        
+        body = {"location_ids": [location_id], "limit": limit, "query": query}
+        if cursor:
+            body["cursor"] = cursor
+        return self.post("/v2/orders/search", body)
+    
+    def post(self, path, body):
+        """POST a JSON body, retrying throttled and failed requests; returns the response"""
+        payload = json.dumps(body).encode("utf-8")
+        headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Square-Version": SQUARE_VERSION,
+            "Content-Type": "application/json"
+        }
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            with self.lock:
+                self.requests += 1
+            try:
+                conn = self.connection()
+                conn.request("POST", self.path_prefix + path, payload, headers)
+                response = conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                # The server may have dropped an idle keep-alive connection
+                self.reconnect()
+                if attempt == self.max_retries:
+                    raise
+                self.retry_after(attempt)
+                continue
+            
+            if response.status < 400:
+                return response
+            
+            # Read the error body so the connection can be reused
+            message = response.read().decode("utf-8", "replace")
+            if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                raise SquareAPIError(response.status, message)
+            self.retry_after(attempt, response.getheader("Retry-After"))
+    
+    def retry_after(self, attempt, retry_after=None):
+        """Sleep before retry number attempt + 1: the server's Retry-After, else jittered exponential backoff"""
+        with self.lock:
+            self.retries += 1
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = min(MAX_BACKOFF_S, BACKOFF_BASE_S * 2 ** attempt) * random.uniform(0.5, 1.0)
+        time.sleep(delay)
+
+
+def load_sync_state(conn, location_id):
+    """Return (cursor, query_start, high_water_mark) for a location"""
+    row = conn.execute(
+        "SELECT cursor, query_start, high_water_mark FROM sync_state WHERE location_id = ?",
+        (location_id,)
+    ).fetchone()
+    return row or (None, None, None)
+
+
+def save_sync_state(conn, location_id, cursor, query_start, high_water_mark):
+    """Persist sync progress for a location"""
+    with conn:
+        conn.execute(
+            '''INSERT INTO sync_state (location_id, cursor, query_start, high_water_mark)
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT (location_id) DO UPDATE SET
+                   cursor = excluded.cursor,
+                   query_start = excluded.query_start,
+                   high_water_mark = excluded.high_water_mark''',
+            (location_id, cursor, query_start, high_water_mark)
+        )
+
+
+def put_page(pages, item, stop):
+    """Queue an item for the writer, giving up if the sync is being stopped"""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def fetch_location(client, location_id, state, pages, stop):
+    """Fetch a location's pages in cursor order and queue each for the writer (worker thread)"""
+    error = None
+    try:
+        cursor, query_start, high_water_mark = state
+        if not cursor:
+            # Start a new query from the last fully synced update
+            query_start = high_water_mark
+        
+        while not stop.is_set():
+            with diagnostics.span("sync.fetch_page", location_id), \
+                    client.search_orders(location_id, query_start, cursor) as response:
+                page = SquareOrderStream(response)
+                orders = list(page)
+                cursor = page.cursor
+            
+            for order in orders:
+                updated_at = order.get("updated_at")
+                if updated_at and (high_water_mark is None or updated_at > high_water_mark):
+                    high_water_mark = updated_at
+            put_page(pages, SyncPage(location_id, orders, cursor, query_start, high_water_mark), stop)
+            if not cursor:
+                break
+    except Exception as e:
+        error = e
+    put_page(pages, LocationDone(location_id, error), stop)
+
+
+def sync_locations(conn, client, location_ids, workers=SYNC_WORKERS, batch_size=BATCH_SIZE):
+    """Pull orders updated since the last sync of each location and upsert them
+    
+    Up to `workers` locations are fetched concurrently. Their pages are
+    written here, on the connection's own thread, several pages per
+    transaction when they arrive together, and each location's progress is
+    saved once its page is written, so an interrupted sync resumes from its
+    stored cursor. Pages are re-requested from the high-water mark
+    inclusively, which is safe because orders are upserted by Square id.
+    A location that fails does not stop the others; the first error is
+    raised once they are done. Returns the writer with the imported and
+    skipped counts.
+    """
+    database.create_tables(conn.cursor())
+    conn.commit()
+    
+    states = {location_id: load_sync_state(conn, location_id) for location_id in location_ids}
+    pages = queue.Queue(maxsize=QUEUED_PAGES)
+    stop = threading.Event()
+    writer = OrderWriter(conn, batch_size)
+    errors = []
+    
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="square-sync") as executor:
+        for location_id in states:
+            executor.submit(fetch_location, client, location_id, states[location_id], pages, stop)
+        
+        try:
+            remaining = len(states)
+            while remaining:
+                # Write whatever pages are waiting together, up to one batch of orders
+                batch = [pages.get()]
+                queued_orders = len(getattr(batch[0], "orders", ()))
+                while queued_orders < batch_size:
+                    try:
+                        batch.append(pages.get_nowait())
+                    except queue.Empty:
+                        break
+                    queued_orders += len(getattr(batch[-1], "orders", ()))
+                
+                synced = []
+                for item in batch:
+                    if isinstance(item, LocationDone):
+                        remaining -= 1
+                        if item.error is not None:
+                            errors.append(item.error)
+                        continue
+                    for order in item.orders:
+                        order.setdefault("location_id", item.location_id)
+                        writer.add(order)
+                    synced.append(item)
+                writer.flush()
+                
+                for page in synced:
+                    save_sync_state(conn, page.location_id, page.cursor, page.query_start, page.high_water_mark)
+        finally:
+            stop.set()
+    client.close()
+    
+    if errors:
+        raise errors[0]
+    return writer
+
+
+def sync_orders(conn, client, location_id, batch_size=BATCH_SIZE):
+    """Pull orders updated since the last sync of one location and upsert them"""
+    return sync_locations(conn, client, [location_id], 1, batch_size)
+
+
+def location_list(value):
+    """Split a comma-separated list of location ids"""
+    return [location_id.strip() for location_id in (value or "").split(",") if location_id.strip()]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Sync new Square orders into kplate.db")
+    arg_parser.add_argument("--location", action="append", type=location_list,
+                            help="Square location id(s), comma-separated or repeated "
+                                 "(default: $SQUARE_LOCATION_ID)")
+    arg_parser.add_argument("--base-url", default=os.environ.get("SQUARE_BASE_URL", SQUARE_BASE_URL))
+    arg_parser.add_argument("--workers", type=int, default=SYNC_WORKERS, help="locations fetched at once")
+    arg_parser.add_argument("--rps", type=float, default=REQUESTS_PER_SECOND, help="request budget per second")
+    arg_parser.add_argument("--db", default="kplate.db", help="Path to the SQLite database")
+    args = arg_parser.parse_args()
+    
+    location_ids = sum(args.location or [], []) or location_list(os.environ.get("SQUARE_LOCATION_ID"))
+    if not location_ids:
+        arg_parser.error("a Square location id is required")
+    
+    client = SquareClient(os.environ.get("SQUARE_ACCESS_TOKEN", ""), args.base_url, requests_per_second=args.rps)
+    db = database.Database(args.db)
+    conn = db.connection()
+    try:
+        writer = sync_locations(conn, client, location_ids, args.workers)
+    finally:
+        db.close()
+    
+    print(f"Synced {writer.imported} orders ({writer.skipped} skipped) from {len(location_ids)} locations")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Background jobs for the admin panel, run on a QThreadPool"""
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+import diagnostics
+
+# Worker threads for background jobs; each keeps one database connection open
+JOB_THREADS = 4
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when a newer job with the same key has been submitted"""
+
+
+class JobSignals(QObject):
+    """Signals a job emits from its worker thread"""
+    finished = pyqtSignal(object, object)
+    failed = pyqtSignal(object, str)
+    cancelled = pyqtSignal(object)
+
+
+class Job(QRunnable):
+    """Run a function on the thread pool and report its result through signals
+    
+    The function receives a ``check_cancelled`` callable it should call between
+    steps; it raises JobCancelled once the job has been superseded.
+    """
+    
+    def __init__(self, key, generation, fn, is_current, on_result, on_error):
+        super().__init__()
+        self.key = key
+        self.generation = generation
+        self.fn = fn
+        self.is_current = is_current
+        self.on_result = on_result
+        self.on_error = on_error
+        self.signals = JobSignals()
+    
+    def check_cancelled(self):
+        if not self.is_current(self):
+            raise JobCancelled()
+    
+    def run(self):
+        try:
+            self.check_cancelled()
+            with diagnostics.span(f"job.{self.key}"):
+                result = self.fn(self.check_cancelled)
+        except JobCancelled:
+            self.signals.cancelled.emit(self)
+            return
+        except Exception as e:
+            diagnostics.record_error(f"job.{self.key}", e)
+            self.signals.failed.emit(self, str(e))
+            return
+        self.signals.finished.emit(self, result)
+
+
+class JobRunner(QObject):
+    """Submit background jobs by key; a newer job with the same key cancels the older one
+    
+    Results are delivered on the GUI thread, and only for the latest job of
+    each key, so a slow stale query can never overwrite a newer one. Jobs
+    run on a fixed set of threads that never expire, since every thread
+    that touches the database holds a connection for as long as it lives.
+    """
+    
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        if pool is None:
+            pool = QThreadPool(self)
+            pool.setMaxThreadCount(JOB_THREADS)
+            pool.setExpiryTimeout(-1)
+        self.pool = pool
+        self.generations = {}
+        self.active_jobs = set()
+    
+    def submit(self, key, fn, on_result, on_error=None):
+        """Run fn(check_cancelled) in the background and pass its result to on_result"""
+        generation = self.generations.get(key, 0) + 1
+        self.generations[key] = generation
+        
+        job = Job(key, generation, fn, self.is_current, on_result, on_error)
+        job.signals.finished.connect(self.job_finished)
+        job.signals.failed.connect(self.job_failed)
+        job.signals.cancelled.connect(self.job_cancelled)
+        job.setAutoDelete(False)
+        self.active_jobs.add(job)
+        self.pool.start(job)
+        return job
+    
+    def cancel(self, key):
+        """Cancel the pending job for key, if any"""
+        if key in self.generations:
+            self.generations[key] += 1
+    
+    def is_current(self, job):
+        return self.generations.get(job.key) == job.generation
+    
+    @pyqtSlot(object, object)
+    def job_finished(self, job, result):
+        self.active_jobs.discard(job)
+        if self.is_current(job):
+            job.on_result(result)
+    
+    @pyqtSlot(object, str)
+    def job_failed(self, job, message):
+        self.active_jobs.discard(job)
+        if self.is_current(job) and job.on_error:
+            job.on_error(message)
+    
+    @pyqtSlot(object)
+    def job_cancelled(self, job):
+        self.active_jobs.discard(job)